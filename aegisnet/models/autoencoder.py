@@ -1,4 +1,6 @@
 # models/autoencoder.py
+import time
+
 import torch
 from torch import nn
 from torch.utils.data import Dataset
@@ -6,6 +8,64 @@ import pandas as pd
 import numpy as np
 
 
+STD_EPS = 1e-6
+_COUNT_BLOCK = 1 << 24
+
+
+class RunningStats:
+    """
+    Per-column mean and (population) variance, updated a chunk at a
+    time: Welford's update generalized to merging a whole chunk's
+    mean/M2 (Chan et al.), in float64.
+    """
+
+    def __init__(self, dim):
+        self.n = 0
+        self.mean = np.zeros(dim, dtype=np.float64)
+        self._m2 = np.zeros(dim, dtype=np.float64)
+
+    def update(self, X):
+        n_b = len(X)
+        if not n_b:
+            return
+        # One float64 column at a time keeps the scratch space small.
+        mean_b = np.empty(X.shape[1], dtype=np.float64)
+        m2_b = np.empty(X.shape[1], dtype=np.float64)
+        for j in range(X.shape[1]):
+            col = X[:, j].astype(np.float64)
+            mean_b[j] = col.mean()
+            col -= mean_b[j]
+            m2_b[j] = col @ col
+
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * (n_b / n)
+        self._m2 += m2_b + delta * delta * (self.n * n_b / n)
+        self.n = n
+
+    @property
+    def std(self):
+        if not self.n:
+            return np.zeros_like(self._m2)
+        return np.sqrt(self._m2 / self.n)
+
+
+def _max_rows(csv_path):
+    """Upper bound on the data rows of a CSV: its line count minus header."""
+    lines = 0
+    last = b"\n"
+    with open(csv_path, "rb") as f:
+        while True:
+            block = f.read(_COUNT_BLOCK)
+            if not block:
+                break
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1  # no trailing newline
+    return max(lines - 1, 0)
+
+
 class FlowDataset(Dataset):
     """
     Dataset for network flow records stored in a CSV file.
@@ -13,22 +73,58 @@ class FlowDataset(Dataset):
     Each row should contain numeric columns listed in feature_cols.
     Example columns:
       - bytes_in, bytes_out, packets, duration, src_port, dst_port, protocol
+
+    The CSV is read in chunks of chunk_rows, parsing only feature_cols
+    (as float32) straight into one preallocated matrix sized from a
+    line count, while the normalization stats are accumulated chunk by
+    chunk; the matrix is then normalized in place. Peak memory is the
+    final matrix plus one chunk.
     """
 
-    def __init__(self, csv_path, feature_cols, normalize=True):
-        df = pd.read_csv(csv_path)
+    def __init__(self, csv_path, feature_cols, normalize=True,
+                 chunk_rows=250_000):
+        cols = list(feature_cols)
+        dim = len(cols)
+        start = time.perf_counter()
 
-        # Keep only the feature columns and convert to float32
-        self.features = df[feature_cols].astype(np.float32).values
+        features = np.empty((_max_rows(csv_path), dim), dtype=np.float32)
+        stats = RunningStats(dim)
+        rows = 0
+        reader = pd.read_csv(
+            csv_path,
+            usecols=cols,
+            dtype={c: np.float32 for c in cols},
+            chunksize=chunk_rows,
+        )
+        for chunk in reader:
+            n = len(chunk)
+            out = features[rows:rows + n]
+            for j, c in enumerate(cols):
+                out[:, j] = chunk[c].to_numpy()
+            if normalize:
+                stats.update(out)
+            rows += n
+        # Quoted newlines or blank lines make the line count an
+        # overestimate; a view trims it without copying.
+        self.features = features[:rows]
 
         # Simple z-score normalization
         if normalize:
-            self.mean = self.features.mean(axis=0, keepdims=True)
-            self.std = self.features.std(axis=0, keepdims=True) + 1e-6
-            self.features = (self.features - self.mean) / self.std
+            self.mean = stats.mean.astype(np.float32).reshape(1, dim)
+            self.std = (stats.std + STD_EPS).astype(np.float32)
+            self.std = self.std.reshape(1, dim)
+            self.features -= self.mean
+            self.features /= self.std
         else:
-            self.mean = np.zeros((1, self.features.shape[1]), dtype=np.float32)
-            self.std = np.ones((1, self.features.shape[1]), dtype=np.float32)
+            self.mean = np.zeros((1, dim), dtype=np.float32)
+            self.std = np.ones((1, dim), dtype=np.float32)
+
+        elapsed = time.perf_counter() - start
+        self.rows_per_s = rows / max(elapsed, 1e-9)
+        print(
+            f"[Dataset] {rows:,} rows x {dim} from {csv_path} in "
+            f"{elapsed:.1f}s ({self.rows_per_s:,.0f} rows/s)"
+        )
 
     def __len__(self):
         return len(self.features)
@@ -0,0 +1,106 @@
+# models/numpy_autoencoder.py
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+Layer = Tuple[np.ndarray, np.ndarray, bool]
+
+
+class NumpyAutoencoder:
+    """
+    Inference-only copy of `Autoencoder` that runs on plain NumPy.
+
+    Weights are exported once from a PyTorch state dict into contiguous
+    float32 arrays (stored transposed, so each layer is `x @ W + b`).
+    Forward passes reuse per-thread scratch buffers, so scoring a batch
+    allocates nothing beyond the returned score vector.
+    """
+
+    def __init__(self, layers: List[Layer]) -> None:
+        if not layers:
+            raise ValueError("NumpyAutoencoder needs at least one layer")
+
+        self.layers = layers
+        self.input_dim = layers[0][0].shape[0]
+        self._local = threading.local()
+
+    @classmethod
+    def from_state_dict(cls, state_dict: Dict) -> "NumpyAutoencoder":
+        """
+        Build from an `Autoencoder.state_dict()`.
+
+        Linear layers are taken in encoder -> decoder order; every layer
+        except the final decoder output is followed by a ReLU, matching
+        the module layout in `autoencoder.py`.
+        """
+        linear: List[Tuple[np.ndarray, np.ndarray]] = []
+
+        for part in ("encoder", "decoder"):
+            indices = sorted(
+                int(k.split(".")[1])
+                for k in state_dict
+                if k.startswith(part + ".") and k.endswith(".weight")
+            )
+            for i in indices:
+                w = _to_numpy(state_dict[f"{part}.{i}.weight"])
+                b = _to_numpy(state_dict[f"{part}.{i}.bias"])
+                linear.append(
+                    (
+                        np.ascontiguousarray(w.T, dtype=np.float32),
+                        np.ascontiguousarray(b, dtype=np.float32),
+                    )
+                )
+
+        last = len(linear) - 1
+        layers = [(w, b, i != last) for i, (w, b) in enumerate(linear)]
+        return cls(layers)
+
+    # ------------------------------------------------------------------
+    # Scratch buffers
+    # ------------------------------------------------------------------
+    def _buffers(self, n: int) -> List[np.ndarray]:
+        bufs = getattr(self._local, "bufs", None)
+        if bufs is None or bufs[0].shape[0] < n:
+            capacity = max(n, 64)
+            bufs = [
+                np.empty((capacity, w.shape[1]), dtype=np.float32)
+                for w, _, _ in self.layers
+            ]
+            self._local.bufs = bufs
+        return [b[:n] for b in bufs]
+
+    # ------------------------------------------------------------------
+    # Inference
+    # ------------------------------------------------------------------
+    def reconstruct(self, X: np.ndarray) -> np.ndarray:
+        """
+        Run the forward pass for a (N, D) float32 matrix.
+
+        The returned array is a view into a scratch buffer and is only
+        valid until the next call on the same thread.
+        """
+        h = X
+        for (w, b, relu), out in zip(self.layers, self._buffers(len(X))):
+            np.matmul(h, w, out=out)
+            out += b
+            if relu:
+                np.maximum(out, 0.0, out=out)
+            h = out
+        return h
+
+    def score(self, X: np.ndarray) -> np.ndarray:
+        """Per-row MSE reconstruction error for a (N, D) matrix."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        recon = self.reconstruct(X)
+        np.subtract(recon, X, out=recon)
+        np.square(recon, out=recon)
+        return recon.mean(axis=1)
+
+
+def _to_numpy(t) -> np.ndarray:
+    # Accepts torch tensors without importing torch here.
+    if hasattr(t, "detach"):
+        t = t.detach().cpu().numpy()
+    return np.asarray(t, dtype=np.float32)
@@ -1,7 +1,48 @@
+import json
+import warnings
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+
 import torch
 import numpy as np
 
 from aegisnet.models.autoencoder import Autoencoder
+from aegisnet.models.numpy_autoencoder import NumpyAutoencoder
+
+
+BACKENDS = ("torch", "numpy")
+
+NORM_EPS = 1e-8
+
+# Metadata file inside TorchScript artifacts (see model_export.py)
+META_FILE = "aegisnet.json"
+
+RowErrors = Dict[int, List[str]]
+
+
+class MissingFeaturesError(ValueError):
+    """
+    Raised when one or more flows lack feature columns.
+    `row_errors` maps row index -> list of missing column names.
+    """
+
+    def __init__(self, row_errors: RowErrors):
+        self.row_errors = row_errors
+        shown = sorted(row_errors.items())[:5]
+        detail = "; ".join(f"row {i}: {cols}" for i, cols in shown)
+        if len(row_errors) > len(shown):
+            detail += f"; ... ({len(row_errors)} rows total)"
+        super().__init__(f"Missing feature columns ({detail})")
+
+
+def is_torchscript(path: str) -> bool:
+    """True for an artifact written by model_export.py."""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            suffix = "/extra/" + META_FILE
+            return any(name.endswith(suffix) for name in zf.namelist())
+    except (OSError, zipfile.BadZipFile):
+        return False
 
 
 class AnomalyScorer:
@@ -10,49 +51,138 @@ class AnomalyScorer:
     single flows and batches of flows.
     """
 
-    def __init__(self, checkpoint_path: str):
-        """Load model and metadata from a training checkpoint."""
+    def __init__(self, checkpoint_path: str, backend: str = "torch"):
+        """
+        Load model and metadata from a training checkpoint, or from a
+        TorchScript artifact made by model_export.py (float or int8).
+
+        backend="numpy" exports the weights to float32 NumPy arrays and
+        scores without going through PyTorch at inference time (training
+        checkpoints only).
+        """
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown backend {backend!r}; expected one of {BACKENDS}"
+            )
+
         self.device = "cpu"
+        self.backend = backend
 
-        # Load checkpoint (contains weights & metadata)
-        checkpoint = torch.load(
-            checkpoint_path,
-            map_location=self.device,
-            weights_only=False,  # Required for full checkpoint structures
-        )
+        self.scripted = is_torchscript(checkpoint_path)
+        if self.scripted:
+            if backend == "numpy":
+                raise ValueError(
+                    "The numpy backend needs a training checkpoint, "
+                    "not a TorchScript artifact"
+                )
+            checkpoint = self._load_scripted(checkpoint_path)
+        else:
+            # Load checkpoint (contains weights & metadata)
+            checkpoint = torch.load(
+                checkpoint_path,
+                map_location=self.device,
+                weights_only=False,  # Required for full checkpoint structures
+            )
+        self.quantized = bool(checkpoint.get("quantized", False))
 
         # Extract preprocessing metadata
         self.feature_cols = checkpoint.get("feature_cols", [])
         self.mean = checkpoint.get("mean", None)
         self.std = checkpoint.get("std", None)
 
-        # Build model using stored input dimension
+        # Precompute broadcastable constants: x_norm = (x - shift) * scale
+        self._shift: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None
+        if self.mean is not None and self.std is not None:
+            std = np.asarray(self.std, dtype=np.float64).reshape(-1)
+            self._shift = np.asarray(self.mean, dtype=np.float32).reshape(-1)
+            self._scale = (1.0 / (std + NORM_EPS)).astype(np.float32)
+
         input_dim = checkpoint.get("input_dim", len(self.feature_cols))
-        self.model = Autoencoder(input_dim=input_dim).to(self.device)
+        if not self.scripted:
+            # Build model using stored input dimension
+            self.model = Autoencoder(input_dim=input_dim).to(self.device)
 
-        # Load only the neural network weights
-        self.model.load_state_dict(checkpoint["model_state_dict"])
-        self.model.eval()
+            # Load only the neural network weights
+            self.model.load_state_dict(checkpoint["model_state_dict"])
+            self.model.eval()
+
+        self.np_model: NumpyAutoencoder | None = None
+        if backend == "numpy":
+            self.np_model = NumpyAutoencoder.from_state_dict(
+                self.model.state_dict()
+            )
+
+        model_format = "checkpoint"
+        if self.scripted:
+            model_format = "torchscript"
+            if self.quantized:
+                model_format += "-int8"
+        print(
+            f"[Scorer Ready] Device: {self.device}, "
+            f"Backend: {self.backend}, Model: {model_format}, "
+            f"Input dim: {input_dim}"
+        )
 
-        print(f"[Scorer Ready] Device: {self.device}, Input dim: {input_dim}")
+    def _load_scripted(self, path: str) -> Dict[str, Any]:
+        """Load a TorchScript artifact into self.model; returns its meta."""
+        extra = {META_FILE: ""}
+        with warnings.catch_warnings():
+            # torch.jit.load is deprecated (see model_export.py)
+            warnings.simplefilter("ignore", FutureWarning)
+            self.model = torch.jit.load(
+                path,
+                map_location=self.device,
+                _extra_files=extra,
+            )
+        self.model.eval()
+        return json.loads(extra[META_FILE])
 
     # ------------------------------------------------------------------
     # Internal preprocessing
     # ------------------------------------------------------------------
-    def _preprocess(self, flow: dict) -> np.ndarray:
+    def _fill_matrix(self, flows: List[dict]) -> Tuple[np.ndarray, RowErrors]:
         """
-        Convert a flow dictionary into a normalized feature vector.
+        Copy many flow dicts into one preallocated float32 matrix,
+        column by column. Rows with missing columns are zero-filled and
+        reported instead of raising.
         """
-        x = np.array(
-            [flow[col] for col in self.feature_cols],
-            dtype=np.float32,
-        )
+        X = np.empty((len(flows), len(self.feature_cols)), dtype=np.float32)
+        missing: RowErrors = {}
 
-        # Apply normalization if stats were saved
-        if self.mean is not None and self.std is not None:
-            x = (x - self.mean) / (self.std + 1e-8)
+        for j, col in enumerate(self.feature_cols):
+            try:
+                X[:, j] = [f[col] for f in flows]
+            except KeyError:
+                for i, f in enumerate(flows):
+                    if col in f:
+                        X[i, j] = f[col]
+                    else:
+                        X[i, j] = 0.0
+                        missing.setdefault(i, []).append(col)
+
+        return X, missing
+
+    def _normalize(self, X: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """Apply z-score normalization from X into `out` (may be X)."""
+        if self._shift is None or self._scale is None:
+            if out is not X:
+                out[...] = X
+            return out
+
+        np.subtract(X, self._shift, out=out)
+        np.multiply(out, self._scale, out=out)
+        return out
 
-        return x
+    def _preprocess_batch(
+        self,
+        flows: List[dict],
+    ) -> Tuple[np.ndarray, RowErrors]:
+        """
+        Convert flow dictionaries into a normalized (N, D) matrix.
+        """
+        X, missing = self._fill_matrix(flows)
+        return self._normalize(X, out=X), missing
 
     # ------------------------------------------------------------------
     # Single-flow scoring API
@@ -61,29 +191,75 @@ class AnomalyScorer:
         """
         Compute anomaly score (MSE reconstruction error) for a single flow.
         """
-        x = self._preprocess(flow)
-        x_tensor = torch.tensor(x, dtype=torch.float32).to(self.device)
-
-        with torch.no_grad():
-            recon = self.model(x_tensor)
-            mse = torch.mean((recon - x_tensor) ** 2).item()
+        X, missing = self._preprocess_batch([flow])
+        if missing:
+            raise MissingFeaturesError(missing)
 
-        return mse
+        return float(self._score_normalized(X)[0])
 
     # ------------------------------------------------------------------
     # Batch scoring API
     # ------------------------------------------------------------------
-    def score_batch(self, flows: list[dict]) -> list[float]:
+    def score_batch(self, flows: List[dict]) -> List[float]:
         """
         Compute anomaly scores for a batch of flows.
-        Returns a list of MSE values.
+        Returns a list of MSE values; raises MissingFeaturesError listing
+        every bad row if any flow lacks a feature column.
+        """
+        X, missing = self._preprocess_batch(flows)
+        if missing:
+            raise MissingFeaturesError(missing)
+
+        return self._score_normalized(X).tolist()
+
+    def score_batch_partial(
+        self,
+        flows: List[dict],
+    ) -> Tuple[List[Optional[float]], RowErrors]:
+        """
+        Like score_batch, but scores every valid row and returns
+        (scores, row_errors) with None in place of rows that failed.
+        """
+        X, missing = self._preprocess_batch(flows)
+        if not missing:
+            return self._score_normalized(X).tolist(), missing
+
+        ok = np.ones(len(flows), dtype=bool)
+        ok[list(missing)] = False
+
+        scores: List[Optional[float]] = [None] * len(flows)
+        if ok.any():
+            good = self._score_normalized(X[ok]).tolist()
+            for i, value in zip(np.flatnonzero(ok).tolist(), good):
+                scores[i] = value
+
+        return scores, missing
+
+    # ------------------------------------------------------------------
+    # Matrix scoring API
+    # ------------------------------------------------------------------
+    def score_matrix(self, X: np.ndarray) -> np.ndarray:
         """
-        X = np.stack([self._preprocess(f) for f in flows], axis=0)
-        X_tensor = torch.tensor(X, dtype=torch.float32).to(self.device)
+        Compute anomaly scores for a raw (N, D) feature matrix whose
+        columns follow feature_cols. Returns a vector of MSE values.
+        """
+        out = np.empty(X.shape, dtype=np.float32)
+        return self._score_normalized(self._normalize(X, out=out))
+
+    def _score_normalized(self, X: np.ndarray) -> np.ndarray:
+        if self.np_model is not None:
+            return self.np_model.score(X)
+
+        X_tensor = torch.from_numpy(
+            np.ascontiguousarray(X, dtype=np.float32)
+        ).to(self.device)
 
         with torch.no_grad():
-            recon = self.model(X_tensor)
-            mse = torch.mean((recon - X_tensor) ** 2, dim=1)
-            mse = mse.cpu().numpy()
+            if self.scripted:
+                # Normalization is already done; skip the built-in one.
+                mse = self.model.score_normalized(X_tensor)
+            else:
+                recon = self.model(X_tensor)
+                mse = torch.mean((recon - X_tensor) ** 2, dim=1)
 
-        return mse.tolist()
+        return mse.cpu().numpy()
@@ -0,0 +1,123 @@
+"""
+Compare a training checkpoint with its TorchScript and int8 exports.
+
+Exports the checkpoint (float and dynamically quantized) to a temporary
+directory, then for each model file reports scorer startup time,
+score_batch time at batch sizes 1, 64 and 4096, and score drift against
+the float checkpoint: max/mean relative difference and how many flows
+change their suspicious verdict at THRESHOLD.
+
+    python bench_model_export.py [autoencoder.pt] [flows.csv]
+
+Drift is measured on the CSV's flows when given (default
+data/sample_flows.csv if present), otherwise on random flows.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from anomaly_scorer import AnomalyScorer
+from model_export import export_scorer
+
+
+BATCH_SIZES = (1, 64, 4096)
+MIN_SECONDS = 1.0
+STARTUP_RUNS = 5
+THRESHOLD = 0.05
+
+
+def _random_flows(feature_cols, n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.random((n, len(feature_cols))) * 50_000.0
+    return [dict(zip(feature_cols, map(float, row))) for row in X]
+
+
+def _csv_flows(csv_path, feature_cols):
+    df = pd.read_csv(csv_path, usecols=list(feature_cols))
+    return df[list(feature_cols)].astype(float).to_dict("records")
+
+
+def _startup_s(path):
+    times = []
+    for _ in range(STARTUP_RUNS):
+        start = time.perf_counter()
+        AnomalyScorer(path)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def _time_batches(scorer, flows):
+    # Warm up, then repeat until we have a stable measurement.
+    scorer.score_batch(flows)
+
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        scorer.score_batch(flows)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SECONDS:
+            return elapsed / calls
+
+
+def main(checkpoint_path="autoencoder.pt", csv_path=None):
+    if csv_path is None and os.path.exists("data/sample_flows.csv"):
+        csv_path = "data/sample_flows.csv"
+
+    tmp = tempfile.mkdtemp(prefix="aegisnet-export-")
+    models = {
+        "checkpoint": checkpoint_path,
+        "torchscript": os.path.join(tmp, "autoencoder.ts"),
+        "ts-int8": os.path.join(tmp, "autoencoder-int8.ts"),
+    }
+    export_scorer(checkpoint_path, models["torchscript"])
+    export_scorer(checkpoint_path, models["ts-int8"], quantize=True)
+
+    scorers = {name: AnomalyScorer(path) for name, path in models.items()}
+    cols = scorers["checkpoint"].feature_cols
+    if csv_path:
+        check = _csv_flows(csv_path, cols)
+        print(f"drift measured on {len(check)} flows from {csv_path}")
+    else:
+        check = _random_flows(cols, 20_000, seed=1)
+        print(f"drift measured on {len(check)} random flows")
+    reference = np.asarray(scorers["checkpoint"].score_batch(check))
+    flagged = reference > THRESHOLD
+
+    print(
+        f"\n{'model':>12} {'size KB':>8} {'startup ms':>11} "
+        f"{'max rel':>9} {'mean rel':>9} {'flipped':>8}"
+    )
+    for name, path in models.items():
+        scores = np.asarray(scorers[name].score_batch(check))
+        rel = np.abs(scores - reference) / np.maximum(
+            np.abs(reference), 1e-12
+        )
+        flipped = int(((scores > THRESHOLD) != flagged).sum())
+        print(
+            f"{name:>12} {os.path.getsize(path) / 1024:>8.1f} "
+            f"{_startup_s(path) * 1000:>11.2f} {rel.max():>9.2e} "
+            f"{rel.mean():>9.2e} {flipped:>8}"
+        )
+
+    print(f"\n{'batch':>6}" + "".join(
+        f" {name + ' us':>16}" for name in models
+    ))
+    for n in BATCH_SIZES:
+        flows = _random_flows(cols, n)
+        row = f"{n:>6}"
+        for scorer in scorers.values():
+            row += f" {_time_batches(scorer, flows) * 1e6:>16.1f}"
+        print(row)
+
+    for name in ("torchscript", "ts-int8"):
+        os.remove(models[name])
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:3])
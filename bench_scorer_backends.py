@@ -0,0 +1,66 @@
+"""
+Compare the torch and NumPy AnomalyScorer backends.
+
+Checks that both produce the same scores, then times score_batch at
+batch sizes 1, 64 and 4096.
+
+    python bench_scorer_backends.py [autoencoder.pt]
+"""
+import sys
+import time
+
+import numpy as np
+
+from anomaly_scorer import AnomalyScorer
+
+
+BATCH_SIZES = (1, 64, 4096)
+MIN_SECONDS = 1.0
+
+
+def _random_flows(feature_cols, n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.random((n, len(feature_cols))) * 50_000.0
+    return [dict(zip(feature_cols, map(float, row))) for row in X]
+
+
+def _time_batches(scorer, flows):
+    # Warm up, then repeat until we have a stable measurement.
+    scorer.score_batch(flows)
+
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        scorer.score_batch(flows)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SECONDS:
+            return elapsed / calls
+
+
+def main(checkpoint_path="autoencoder.pt"):
+    torch_scorer = AnomalyScorer(checkpoint_path, backend="torch")
+    numpy_scorer = AnomalyScorer(checkpoint_path, backend="numpy")
+    cols = torch_scorer.feature_cols
+
+    check = _random_flows(cols, 4096, seed=1)
+    a = np.asarray(torch_scorer.score_batch(check))
+    b = np.asarray(numpy_scorer.score_batch(check))
+    max_rel = float(np.max(np.abs(a - b) / np.maximum(np.abs(a), 1e-12)))
+    print(f"max relative score difference: {max_rel:.2e}")
+    assert np.allclose(a, b, rtol=1e-4, atol=1e-6), "backends disagree"
+
+    print(f"{'batch':>6} {'torch us/call':>14} {'numpy us/call':>14} "
+          f"{'speedup':>8}")
+    for n in BATCH_SIZES:
+        flows = _random_flows(cols, n)
+        t_torch = _time_batches(torch_scorer, flows)
+        t_numpy = _time_batches(numpy_scorer, flows)
+        print(
+            f"{n:>6} {t_torch * 1e6:>14.1f} {t_numpy * 1e6:>14.1f} "
+            f"{t_torch / t_numpy:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,108 @@
+"""
+Latency of concurrent scoring, direct vs through a ScoringPool.
+
+N client threads (like uvicorn's threadpool under load) each call
+score_batch on a batch of flows in a loop. "direct" calls the scorer
+from the client threads with torch's default threading, as the service
+did before; "pool" routes the same calls through ScoringPool. Reports
+per-call p50/p99 latency and throughput for each client concurrency.
+
+    python bench_scoring_pool.py [autoencoder.pt] [--batch 64]
+        [--workers 0] [--torch-threads 0]
+
+Set OMP_NUM_THREADS to see how a wider default OpenMP team behaves
+when the host has fewer free cores than torch assumes.
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+import torch
+
+from anomaly_scorer import AnomalyScorer
+from scoring_pool import ScoringPool, available_cores
+
+
+CONCURRENCY = (1, 2, 4, 8, 16, 32)
+SECONDS = 2.0
+
+
+def _random_flows(feature_cols, n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.random((n, len(feature_cols))) * 50_000.0
+    return [dict(zip(feature_cols, map(float, row))) for row in X]
+
+
+def _run(score_batch, flows, clients):
+    """Latencies (s) of every call made by `clients` threads."""
+    latencies = [[] for _ in range(clients)]
+    stop = time.perf_counter() + SECONDS
+    barrier = threading.Barrier(clients)
+
+    def client(out):
+        barrier.wait()
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= stop:
+                return
+            score_batch(flows)
+            out.append(time.perf_counter() - t0)
+
+    threads = [
+        threading.Thread(target=client, args=(out,)) for out in latencies
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return np.concatenate([np.asarray(x) for x in latencies]), elapsed
+
+
+def _row(latencies, elapsed):
+    p50, p99 = np.percentile(latencies, (50, 99)) * 1000.0
+    return f"{p50:>8.2f} {p99:>8.2f} {len(latencies) / elapsed:>8.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("checkpoint", nargs="?", default="autoencoder.pt")
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--torch-threads", type=int, default=0)
+    args = parser.parse_args()
+
+    scorer = AnomalyScorer(args.checkpoint)
+    flows = _random_flows(scorer.feature_cols, args.batch)
+    scorer.score_batch(flows)  # warm up
+
+    print(
+        f"cores={available_cores()} default torch threads="
+        f"{torch.get_num_threads()} batch={args.batch}"
+    )
+
+    # Direct first: the pool changes the process-wide inter-op setting.
+    direct = {n: _run(scorer.score_batch, flows, n) for n in CONCURRENCY}
+
+    pool = ScoringPool(
+        scorer,
+        workers=args.workers,
+        torch_threads=args.torch_threads,
+    )
+    pool.score_batch(flows)
+    pooled = {n: _run(pool.score_batch, flows, n) for n in CONCURRENCY}
+    pool.close()
+
+    print(f"{'':>7} {'direct (ms, calls/s)':>26}   {'pool (ms, calls/s)':>26}")
+    print(
+        f"{'clients':>7} {'p50':>8} {'p99':>8} {'calls/s':>8}   "
+        f"{'p50':>8} {'p99':>8} {'calls/s':>8}"
+    )
+    for n in CONCURRENCY:
+        print(f"{n:>7} {_row(*direct[n])}   {_row(*pooled[n])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark ThreatClassifier.update under adversarial scan traffic.
+
+Replays a single host scanning many ports/hosts (so its window holds tens
+of thousands of events) through both the current classifier and the
+previous O(window) implementation, checks the verdicts are identical and
+reports events per second.
+
+    python bench_threat_classifier.py [events] [window_s]
+"""
+import random
+import sys
+import time
+from collections import defaultdict, deque
+
+from threat_classifier import ThreatClassifier, ThreatVerdict
+
+
+class LegacyThreatClassifier(ThreatClassifier):
+    """Previous implementation: rescans the whole window on every event."""
+
+    def __init__(self, window_s: int = 30) -> None:
+        self.window_s = window_s
+        self.by_src = defaultdict(deque)
+
+    def _prune(self, q, now):
+        cutoff = now - self.window_s
+        while q and q[0][0] < cutoff:
+            q.popleft()
+
+    def update(self, meta, features, anomaly_score):
+        now = float(meta["timestamp"])
+        src_ip = meta["src_ip"]
+        q = self.by_src[src_ip]
+        q.append(
+            (
+                now,
+                meta["dst_ip"],
+                int(features["dst_port"]),
+                float(features["bytes_out"]),
+                float(features["packets"]),
+            )
+        )
+        self._prune(q, now)
+
+        dst_ports = {p for _, _, p, _, _ in q if p > 0}
+        dst_hosts = {h for _, h, _, _, _ in q if h}
+        total_bytes_out = sum(b for _, _, _, b, _ in q)
+        total_packets = sum(pk for _, _, _, _, pk in q)
+
+        w = self.window_s
+        if len(dst_ports) >= 30 and anomaly_score > 0.03:
+            return ThreatVerdict(
+                "Port Scan Suspected", 0.75,
+                f"{len(dst_ports)} dst ports in {w}s from {src_ip}",
+            )
+        if len(dst_hosts) >= 20 and anomaly_score > 0.03:
+            return ThreatVerdict(
+                "Host Sweep / Lateral Movement", 0.70,
+                f"{len(dst_hosts)} dst hosts in {w}s from {src_ip}",
+            )
+        if total_bytes_out >= 50_000_000 and anomaly_score > 0.02:
+            return ThreatVerdict(
+                "Data Exfiltration Suspected", 0.70,
+                f"{int(total_bytes_out)} bytes_out in {w}s from {src_ip}",
+            )
+        if total_packets >= 50_000 and anomaly_score > 0.02:
+            return ThreatVerdict(
+                "Traffic Spike / Flood Suspected", 0.65,
+                f"{int(total_packets)} packets in {w}s from {src_ip}",
+            )
+        if anomaly_score > 0.08:
+            return ThreatVerdict(
+                "Anomalous Activity", 0.50, "High reconstruction error",
+            )
+        return None
+
+
+def _scan_events(n, window_s, seed=0):
+    rng = random.Random(seed)
+    t0 = 1_700_000_000.0
+    step = window_s / max(1, n // 2)  # ~half the run fits in one window
+    for i in range(n):
+        src = "10.0.0.66"
+        if rng.random() >= 0.95:
+            src = f"10.0.1.{rng.randrange(254)}"
+        yield (
+            {
+                "src_ip": src,
+                "dst_ip": f"192.168.{rng.randrange(4)}.{rng.randrange(254)}",
+                "timestamp": t0 + i * step,
+            },
+            {
+                "dst_port": float(rng.randrange(1, 65535)),
+                "bytes_out": float(rng.randrange(40, 1500)) + 0.25,
+                "packets": float(rng.randrange(1, 4)),
+            },
+            rng.random() * 0.1,
+        )
+
+
+def _run(clf, events):
+    start = time.perf_counter()
+    verdicts = [clf.update(m, f, s) for m, f, s in events]
+    return verdicts, time.perf_counter() - start
+
+
+def main(n=50_000, window_s=30):
+    n, window_s = int(n), int(window_s)
+    events = list(_scan_events(n, window_s))
+
+    new_verdicts, t_new = _run(ThreatClassifier(window_s=window_s), events)
+
+    # The legacy path is quadratic; time it on a prefix when n is large.
+    n_legacy = min(n, 20_000)
+    old_verdicts, t_old = _run(
+        LegacyThreatClassifier(window_s=window_s), events[:n_legacy]
+    )
+    assert new_verdicts[:n_legacy] == old_verdicts, "verdicts differ"
+
+    print(f"events={n} window_s={window_s} (legacy checked on {n_legacy})")
+    print(f"legacy      : {n_legacy / t_old:>12,.0f} events/s")
+    print(f"incremental : {n / t_new:>12,.0f} events/s")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:3])
@@ -0,0 +1,74 @@
+"""
+Throughput of ShardedThreatClassifier vs shard count.
+
+Replays synthetic traffic from many sources in batches through
+update_many(), checks verdicts match a single in-process
+ThreatClassifier, and reports events per second per shard count.
+
+    python bench_threat_shards.py [events] [batch]
+"""
+import os
+import random
+import sys
+import time
+
+from threat_classifier import ThreatClassifier
+from threat_shards import ShardedThreatClassifier
+
+
+def _events(n, n_sources=2_000, seed=0):
+    rng = random.Random(seed)
+    t0 = 1_700_000_000.0
+    out = []
+    for i in range(n):
+        src = rng.randrange(n_sources)
+        out.append(
+            (
+                {
+                    "src_ip": f"10.0.{src // 256}.{src % 256}",
+                    "dst_ip": f"192.168.0.{rng.randrange(64)}",
+                    "timestamp": t0 + i * 0.0005,
+                },
+                {
+                    "dst_port": float(rng.randrange(1, 2048)),
+                    "bytes_out": float(rng.randrange(40, 1500)),
+                    "packets": float(rng.randrange(1, 4)),
+                },
+                rng.random() * 0.1,
+            )
+        )
+    return out
+
+
+def _run(clf, events, batch):
+    verdicts = []
+    start = time.perf_counter()
+    for i in range(0, len(events), batch):
+        chunk = events[i:i + batch]
+        if hasattr(clf, "update_many"):
+            verdicts.extend(clf.update_many(chunk))
+        else:
+            verdicts.extend(clf.update(m, f, s) for m, f, s in chunk)
+    return verdicts, time.perf_counter() - start
+
+
+def main(n=200_000, batch=2_000):
+    n, batch = int(n), int(batch)
+    events = _events(n)
+
+    reference, t_ref = _run(ThreatClassifier(), events, batch)
+    print(f"cores={os.cpu_count()} events={n} batch={batch}")
+    print(f"in-process : {n / t_ref:>12,.0f} events/s")
+
+    for shards in (1, 2, 4, 8):
+        clf = ShardedThreatClassifier(n_shards=shards)
+        try:
+            verdicts, elapsed = _run(clf, events, batch)
+        finally:
+            clf.close()
+        assert verdicts == reference, f"verdicts differ with {shards} shards"
+        print(f"{shards} shard(s) : {n / elapsed:>12,.0f} events/s")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:3])
@@ -0,0 +1,407 @@
+"""
+Multi-process capture pipeline for pcap_agent.
+
+    capture + parse (calling process)
+        -> N aggregator processes, each with its own FlowTable
+        -> 1 exporter process posting to /ingest_batch
+
+Stages are connected by single-producer/single-consumer rings in shared
+memory. Packets are sharded by a direction-free hash of the flow key,
+so both sides of a conversation land on the same aggregator. Capture
+never waits on anything downstream: when an aggregator falls behind its
+ring fills up and further packets for it are dropped (and counted),
+like a kernel capture ring. Only the exporter touches the network.
+"""
+import math
+import multiprocessing as mp
+import queue
+import signal
+import threading
+import time
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import requests
+
+from flow_table import FLOW_DTYPE, PACKET_DTYPE, PACKET_STRUCT, FlowTable
+from pcap_agent import (
+    ACTIVE_TIMEOUT,
+    API_URL,
+    FLOW_TTL,
+    FLUSH_INTERVAL,
+    MAX_FLUSH,
+    CaptureStats,
+    _capture_loop,
+    _hostname,
+    _post_flows,
+)
+from raw_capture import Packet
+
+
+PACKET_RING_SLOTS = 1 << 18  # per aggregator, ~13 MB
+FLOW_RING_SLOTS = 1 << 16  # per aggregator, ~4 MB
+PUSH_BATCH = 512  # packets buffered per shard before a ring write
+PUSH_INTERVAL_S = 0.05  # live capture: push partial batches this often
+IDLE_SLEEP_S = 0.001
+
+
+class ShmRing:
+    """
+    Single-producer, single-consumer ring of fixed-size records in
+    shared memory. Pickles to its shared memory name, so it can be
+    passed to a spawned process and attached there.
+    """
+
+    # head, tail (monotonic record counts), closed flag
+    _HEADER = 64
+
+    def __init__(
+        self,
+        dtype: np.dtype,
+        capacity: int,
+        name: Optional[str] = None,
+    ) -> None:
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self._owner = name is None
+        self._shm = SharedMemory(
+            name=name,
+            create=self._owner,
+            size=self._HEADER + capacity * self.dtype.itemsize,
+        )
+        self._ctr = np.ndarray(3, dtype=np.uint64, buffer=self._shm.buf)
+        self._data = np.ndarray(
+            capacity,
+            dtype=self.dtype,
+            buffer=self._shm.buf,
+            offset=self._HEADER,
+        )
+        if self._owner:
+            self._ctr[:] = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            "dtype": self.dtype,
+            "capacity": self.capacity,
+            "name": self._shm.name,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["dtype"], state["capacity"], state["name"])
+
+    def __len__(self) -> int:
+        return int(self._ctr[0] - self._ctr[1])
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._ctr[2])
+
+    def push(self, records: np.ndarray) -> int:
+        """Producer: copy in as many records as fit; returns that count."""
+        head = int(self._ctr[0])
+        n = min(len(records), self.capacity - (head - int(self._ctr[1])))
+        if n <= 0:
+            return 0
+
+        i = head % self.capacity
+        first = min(n, self.capacity - i)
+        self._data[i:i + first] = records[:first]
+        self._data[:n - first] = records[first:n]
+        self._ctr[0] = head + n  # publish after the data is in place
+        return n
+
+    def pop(self, max_n: int) -> np.ndarray:
+        """Consumer: take up to max_n records (copied out)."""
+        tail = int(self._ctr[1])
+        n = min(max_n, int(self._ctr[0]) - tail)
+        if n <= 0:
+            return self._data[:0].copy()
+
+        i = tail % self.capacity
+        first = min(n, self.capacity - i)
+        out = np.concatenate([self._data[i:i + first], self._data[:n - first]])
+        self._ctr[1] = tail + n
+        return out
+
+    def close(self) -> None:
+        """Producer: no more records will be pushed."""
+        self._ctr[2] = 1
+
+    def release(self) -> None:
+        del self._ctr, self._data
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+# ----------------------------------------------------------------------
+# Capture stage
+# ----------------------------------------------------------------------
+class PacketFanout:
+    """
+    FlowTable.add_packet stand-in that shards packets onto the
+    aggregator rings in PUSH_BATCH-sized writes. Never blocks.
+    """
+
+    def __init__(self, rings: List[ShmRing], batch_size: int = PUSH_BATCH):
+        self._rings = rings
+        self._n = len(rings)
+        self._batch_size = batch_size
+        self._bufs = [
+            bytearray(batch_size * PACKET_STRUCT.size) for _ in rings
+        ]
+        self._counts = [0] * self._n
+        self.dropped = 0
+
+    def add_packet(
+        self,
+        ts: float,
+        src: bytes,
+        dst: bytes,
+        sport: int,
+        dport: int,
+        proto: int,
+        length: int,
+        flags: int = 0,
+    ) -> None:
+        # XOR is symmetric, so both directions pick the same shard.
+        shard = (hash(src) ^ hash(dst) ^ sport ^ dport) % self._n
+        count = self._counts[shard]
+        PACKET_STRUCT.pack_into(
+            self._bufs[shard],
+            count * PACKET_STRUCT.size,
+            ts, src, dst, length, sport, dport, proto, flags,
+        )
+        count += 1
+        if count == self._batch_size:
+            self._push(shard, count)
+            count = 0
+        self._counts[shard] = count
+
+    def _push(self, shard: int, count: int) -> None:
+        records = np.frombuffer(
+            self._bufs[shard],
+            dtype=PACKET_DTYPE,
+            count=count,
+        )
+        self.dropped += count - self._rings[shard].push(records)
+
+    def flush(self, now: float = 0.0) -> None:
+        """Push every partially filled batch."""
+        for shard, count in enumerate(self._counts):
+            if count:
+                self._push(shard, count)
+                self._counts[shard] = 0
+
+    def close(self) -> None:
+        self.flush()
+        for ring in self._rings:
+            ring.close()
+
+
+# ----------------------------------------------------------------------
+# Aggregator and exporter processes
+# ----------------------------------------------------------------------
+def _push_all(ring: ShmRing, records: np.ndarray) -> None:
+    """Blocking push: aggregators wait for the exporter, capture never."""
+    while len(records):
+        records = records[ring.push(records):]
+        if len(records):
+            time.sleep(IDLE_SLEEP_S)
+
+
+def _aggregate(
+    packets_in: ShmRing,
+    flows_out: ShmRing,
+    packet_time: bool,
+    results: Any,
+) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent drains us
+
+    table = FlowTable(idle_s=FLOW_TTL, active_s=ACTIVE_TIMEOUT)
+    clock = 0.0
+    next_tick = 0.0
+
+    while True:
+        closed = packets_in.closed
+        batch = packets_in.pop(8 * PUSH_BATCH)
+        if len(batch):
+            table.update(batch)
+            clock = max(clock, float(batch["ts"].max()))
+        elif closed:
+            break
+        else:
+            time.sleep(IDLE_SLEEP_S)
+
+        now = clock if packet_time else time.time()
+        if now >= next_tick:
+            _push_all(flows_out, table.expire(now))
+            next_tick = now + FLUSH_INTERVAL
+
+    _push_all(flows_out, table.expire(math.inf))
+    flows_out.close()
+    results.put(
+        {
+            "flows_created": table.flows_created,
+            "flows_closed": table.flows_closed,
+        }
+    )
+    packets_in.release()
+    flows_out.release()
+
+
+def _export(
+    rings: List[ShmRing],
+    send: bool,
+    agent_id: str,
+    results: Any,
+) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    session = requests.Session() if send else None
+    stats = CaptureStats(log_flushes=False)
+    live = list(rings)
+
+    while live:
+        idle = True
+        for ring in list(live):
+            closed = ring.closed
+            records = ring.pop(MAX_FLUSH)
+            if len(records):
+                idle = False
+                stats.flows_exported += len(records)
+                if session is not None:
+                    _post_flows(records, session, agent_id, stats)
+            elif closed:
+                live.remove(ring)
+        if idle:
+            time.sleep(IDLE_SLEEP_S)
+
+    results.put(
+        {
+            "flows_exported": stats.flows_exported,
+            "send_errors": stats.send_errors,
+            "post_latencies": stats.post_latencies,
+        }
+    )
+    for ring in rings:
+        ring.release()
+
+
+# ----------------------------------------------------------------------
+# Driver
+# ----------------------------------------------------------------------
+def _push_timer(
+    fanout: PacketFanout,
+    lock: threading.Lock,
+    stopped: threading.Event,
+) -> None:
+    while not stopped.wait(PUSH_INTERVAL_S):
+        with lock:
+            fanout.flush()
+
+
+def _collect(results: Any, procs: List, stats: CaptureStats) -> None:
+    """Add each stage's final counters into `stats`."""
+    pending = len(procs)
+    while pending:
+        try:
+            counters = results.get(timeout=1.0)
+        except queue.Empty:
+            if not any(proc.is_alive() for proc in procs):
+                print("[PCAP Agent] a pipeline stage exited early")
+                return
+            continue
+
+        pending -= 1
+        for key, value in counters.items():
+            setattr(stats, key, getattr(stats, key) + value)
+
+
+def run_pipeline(
+    packets: Iterable[Packet],
+    n_aggregators: int,
+    send: bool = True,
+    packet_time: bool = False,
+    speed: float = 0.0,
+) -> CaptureStats:
+    """
+    Run `packets` through the pipeline until the source ends or Ctrl+C,
+    then drain every stage. packet_time/speed are as for a replay.
+    """
+    agent_id = _hostname()
+    stats = CaptureStats(log_flushes=False)
+
+    packet_rings = [
+        ShmRing(PACKET_DTYPE, PACKET_RING_SLOTS) for _ in range(n_aggregators)
+    ]
+    flow_rings = [
+        ShmRing(FLOW_DTYPE, FLOW_RING_SLOTS) for _ in range(n_aggregators)
+    ]
+
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(
+            target=_aggregate,
+            args=(packet_rings[i], flow_rings[i], packet_time, results),
+            name=f"aegisnet-pcap-aggregator-{i}",
+            daemon=True,
+        )
+        for i in range(n_aggregators)
+    ]
+    procs.append(
+        ctx.Process(
+            target=_export,
+            args=(flow_rings, send, agent_id, results),
+            name="aegisnet-pcap-exporter",
+            daemon=True,
+        )
+    )
+    for proc in procs:
+        proc.start()
+
+    print(f"[PCAP Agent] agent_id={agent_id}")
+    print(f"[PCAP Agent] pipeline: {n_aggregators} aggregator(s) + exporter")
+    print(f"[PCAP Agent] sending to {API_URL if send else '(nowhere)'}")
+
+    fanout = PacketFanout(packet_rings)
+    lock = threading.Lock()
+    stopped = threading.Event()
+    pusher = threading.Thread(
+        target=_push_timer,
+        args=(fanout, lock, stopped),
+        name="pcap-agent-push",
+        daemon=True,
+    )
+    if not packet_time:
+        pusher.start()
+
+    try:
+        _capture_loop(
+            packets,
+            fanout,
+            stats,
+            packet_time=packet_time,
+            speed=speed,
+            lock=None if packet_time else lock,
+            on_tick=fanout.flush if packet_time else None,
+        )
+    except KeyboardInterrupt:
+        print("\n[PCAP Agent] stopping")
+    finally:
+        stopped.set()
+        if pusher.is_alive():
+            pusher.join()
+        fanout.close()
+
+        _collect(results, procs, stats)
+        for proc in procs:
+            proc.join()
+        for ring in packet_rings + flow_rings:
+            ring.release()
+
+    stats.dropped = fanout.dropped
+    print(stats.summary())
+    return stats
@@ -0,0 +1,186 @@
+import io
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+RAW_MEDIA_TYPE = "application/octet-stream"
+NPY_MEDIA_TYPE = "application/x-npy"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_FILE_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+
+FLOAT32_LE = np.dtype("<f4")
+
+
+class ColumnarError(ValueError):
+    """Raised when a columnar payload cannot be decoded."""
+
+
+def parse_columns_header(value: Optional[str]) -> Optional[List[str]]:
+    if not value:
+        return None
+    return [c.strip() for c in value.split(",") if c.strip()]
+
+
+def _media_type(content_type: Optional[str]) -> str:
+    return (content_type or RAW_MEDIA_TYPE).split(";")[0].strip().lower()
+
+
+# ----------------------------------------------------------------------
+# Decoding
+# ----------------------------------------------------------------------
+def _decode_raw(body: bytes, n_cols: int) -> np.ndarray:
+    if n_cols <= 0:
+        raise ColumnarError("Raw payloads need an X-Feature-Columns header")
+
+    row_bytes = n_cols * FLOAT32_LE.itemsize
+    if len(body) % row_bytes:
+        raise ColumnarError(
+            f"Raw payload of {len(body)} bytes is not a whole number of "
+            f"{n_cols}-column float32 rows"
+        )
+
+    # Zero-copy view over the request body.
+    return np.frombuffer(body, dtype=FLOAT32_LE).reshape(-1, n_cols)
+
+
+def _decode_npy(body: bytes) -> np.ndarray:
+    fp = io.BytesIO(body)
+    try:
+        version = np.lib.format.read_magic(fp)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(fp)
+        else:
+            header = np.lib.format.read_array_header_2_0(fp)
+        shape, fortran_order, dtype = header
+    except ValueError as exc:
+        raise ColumnarError(f"Invalid .npy payload: {exc}") from exc
+
+    if len(shape) != 2:
+        raise ColumnarError(f".npy payload must be 2-D, got shape {shape}")
+    if dtype.hasobject:
+        raise ColumnarError(".npy payload must be numeric")
+
+    count = shape[0] * shape[1]
+    offset = fp.tell()
+    if len(body) - offset < count * dtype.itemsize:
+        raise ColumnarError(".npy payload is truncated")
+
+    X = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+    X = X.reshape(shape[::-1]).T if fortran_order else X.reshape(shape)
+    return X
+
+
+def _decode_arrow(
+    body: bytes,
+    file_format: bool,
+) -> Tuple[np.ndarray, List[str]]:
+    try:
+        import pyarrow as pa
+    except ImportError as exc:
+        raise ColumnarError("Arrow payloads require pyarrow") from exc
+
+    try:
+        reader = (
+            pa.ipc.open_file(pa.py_buffer(body))
+            if file_format
+            else pa.ipc.open_stream(pa.py_buffer(body))
+        )
+        table = reader.read_all()
+    except pa.ArrowInvalid as exc:
+        raise ColumnarError(f"Invalid Arrow payload: {exc}") from exc
+
+    # Arrow is column-major, so one copy into a row-major matrix.
+    X = np.empty((table.num_rows, table.num_columns), dtype=np.float32)
+    for j, (name, col) in enumerate(zip(table.column_names, table.columns)):
+        if not (
+            pa.types.is_integer(col.type) or pa.types.is_floating(col.type)
+        ):
+            raise ColumnarError(
+                f"Arrow column {name!r} must be numeric, got {col.type}"
+            )
+        try:
+            X[:, j] = col.to_numpy()
+        except (ValueError, pa.ArrowException) as exc:
+            raise ColumnarError(
+                f"Arrow column {name!r} cannot be converted: {exc}"
+            ) from exc
+    return X, list(table.column_names)
+
+
+def decode_matrix(
+    body: bytes,
+    content_type: Optional[str],
+    columns: Optional[Sequence[str]],
+) -> Tuple[np.ndarray, List[str]]:
+    """
+    Decode a request body into an (N, D) matrix plus its column names.
+
+    Raw and .npy payloads take their column names from `columns`
+    (the X-Feature-Columns header); Arrow payloads use the schema.
+    """
+    media = _media_type(content_type)
+    cols = list(columns or [])
+
+    if media in (ARROW_STREAM_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE):
+        return _decode_arrow(body, media == ARROW_FILE_MEDIA_TYPE)
+
+    if media == NPY_MEDIA_TYPE:
+        X = _decode_npy(body)
+    elif media == RAW_MEDIA_TYPE:
+        X = _decode_raw(body, len(cols))
+    else:
+        raise ColumnarError(f"Unsupported content type: {media}")
+
+    if X.shape[1] != len(cols):
+        raise ColumnarError(
+            f"Payload has {X.shape[1]} columns but "
+            f"{len(cols)} names were given"
+        )
+    return X, cols
+
+
+def align_columns(
+    X: np.ndarray,
+    columns: Sequence[str],
+    feature_cols: Sequence[str],
+) -> np.ndarray:
+    """
+    Return X as contiguous float32 in `feature_cols` order.
+
+    No copy is made when the payload already matches exactly.
+    """
+    missing = [c for c in feature_cols if c not in columns]
+    if missing:
+        raise ColumnarError(f"Missing feature columns: {missing}")
+
+    if list(columns) != list(feature_cols):
+        index = [list(columns).index(c) for c in feature_cols]
+        X = X[:, index]
+
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+# ----------------------------------------------------------------------
+# Encoding
+# ----------------------------------------------------------------------
+def encode_scores(scores: np.ndarray, media_type: str) -> Tuple[bytes, str]:
+    """Pack a score vector in the same format the request used."""
+    scores = np.ascontiguousarray(scores, dtype=FLOAT32_LE)
+    media = _media_type(media_type)
+
+    if media == NPY_MEDIA_TYPE:
+        buf = io.BytesIO()
+        np.save(buf, scores, allow_pickle=False)
+        return buf.getvalue(), NPY_MEDIA_TYPE
+
+    if media in (ARROW_STREAM_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE):
+        import pyarrow as pa
+
+        table = pa.table({"anomaly_score": scores})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_STREAM_MEDIA_TYPE
+
+    return scores.tobytes(), RAW_MEDIA_TYPE
@@ -0,0 +1,425 @@
+"""
+Incremental TCP connection tracking for flow_agent.
+
+ConnectionTracker diffs successive socket snapshots and reports only
+new, changed and closed established connections. On Linux snapshots
+come from a sock_diag netlink dump, which also carries each socket's
+byte and segment counters, or failing that from /proc/net/tcp{,6};
+socket owners are found through /proc/<pid>/fd only for sockets not
+seen before. Elsewhere it falls back to psutil.net_connections().
+
+ProcessNameCache keeps pid -> process name lookups off the hot path.
+"""
+import os
+import socket
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import psutil
+
+import sock_diag
+
+
+PROC_NET_TCP = ("/proc/net/tcp", "/proc/net/tcp6")
+_TCP_ESTABLISHED = "01"
+_V4_MAPPED = "::ffff:"
+
+# (local ip, local port, remote ip, remote port)
+ConnKey = Tuple[str, int, str, int]
+# inode, pid, bytes out, bytes in, packets
+SocketInfo = Tuple[int, Optional[int], int, int, int]
+
+BACKENDS = ("diag", "proc", "psutil")
+
+
+@dataclass
+class Connection:
+    laddr: str
+    lport: int
+    raddr: str
+    rport: int
+    pid: Optional[int] = None
+    inode: int = 0
+    first_seen: float = 0.0
+    # Cumulative socket counters and their change at the last poll
+    # (zero unless the tracker has_counters).
+    bytes_out: int = 0
+    bytes_in: int = 0
+    packets: int = 0
+    delta_out: int = 0
+    delta_in: int = 0
+    delta_packets: int = 0
+
+    @property
+    def key(self) -> ConnKey:
+        return (self.laddr, self.lport, self.raddr, self.rport)
+
+
+class ProcessNameCache:
+    """
+    pid -> process name with a TTL. Once an entry is older than ttl_s
+    the process start time is checked again: if the pid now belongs to
+    a different process (pid reuse) the name is looked up afresh,
+    otherwise the cached name is kept for another ttl_s.
+    """
+
+    def __init__(self, ttl_s: float = 30.0, max_entries: int = 4_096):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        # pid -> (create_time, name, last checked)
+        self._entries: Dict[int, Tuple[float, Optional[str], float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def name(self, pid: Optional[int]) -> Optional[str]:
+        if pid is None:
+            return None
+
+        now = time.monotonic()
+        entry = self._entries.get(pid)
+        if entry is not None and now - entry[2] < self.ttl_s:
+            self.hits += 1
+            return entry[1]
+
+        try:
+            proc = psutil.Process(pid)
+            start = proc.create_time()
+            if entry is not None and entry[0] == start:
+                self.hits += 1
+                name = entry[1]
+            else:
+                self.misses += 1
+                name = proc.name()
+        except Exception:
+            self._entries.pop(pid, None)
+            return None
+
+        if pid not in self._entries and len(self._entries) >= self.max_entries:
+            self._prune(now)
+        self._entries[pid] = (start, name, now)
+        return name
+
+    def _prune(self, now: float) -> None:
+        stale = [
+            pid for pid, (_, _, checked) in self._entries.items()
+            if now - checked >= self.ttl_s
+        ]
+        for pid in stale:
+            del self._entries[pid]
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+
+
+# ----------------------------------------------------------------------
+# /proc/net/tcp parsing
+# ----------------------------------------------------------------------
+def _ip_text(raw: bytes) -> str:
+    """4 or 16 network-order address bytes -> text, IPv4-mapped unwrapped."""
+    if len(raw) == 4:
+        return socket.inet_ntop(socket.AF_INET, raw)
+    ip = socket.inet_ntop(socket.AF_INET6, raw)
+    if ip.startswith(_V4_MAPPED) and "." in ip:
+        ip = ip[len(_V4_MAPPED):]
+    return ip
+
+
+def _decode_addr(hex_addr: str) -> Tuple[str, int]:
+    """'0100007F:0016' -> ('127.0.0.1', 22); handles tcp6 rows too."""
+    ip_hex, port_hex = hex_addr.split(":")
+    raw = bytes.fromhex(ip_hex)
+    if sys.byteorder == "little":
+        # The kernel prints each 32-bit word in host byte order.
+        raw = b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    return _ip_text(raw), int(port_hex, 16)
+
+
+def read_proc_net_tcp(
+    paths: Iterable[str] = PROC_NET_TCP,
+) -> Dict[Tuple[str, str], int]:
+    """
+    Established sockets as {(local hex, remote hex): inode}, without
+    decoding addresses (only new entries need that).
+    """
+    out: Dict[Tuple[str, str], int] = {}
+    for path in paths:
+        try:
+            with open(path) as f:
+                next(f, None)  # header
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 10 or fields[3] != _TCP_ESTABLISHED:
+                        continue
+                    out[(fields[1], fields[2])] = int(fields[9])
+        except OSError:
+            continue
+    return out
+
+
+def _socket_inodes(pid: int) -> List[int]:
+    fd_dir = f"/proc/{pid}/fd"
+    inodes = []
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return inodes
+
+    for fd in fds:
+        try:
+            target = os.readlink(f"{fd_dir}/{fd}")
+        except OSError:
+            continue
+        if target.startswith("socket:["):
+            inodes.append(int(target[8:-1]))
+    return inodes
+
+
+# ----------------------------------------------------------------------
+# Tracker
+# ----------------------------------------------------------------------
+class ConnectionTracker:
+    """
+    Diffs established TCP connections between calls to poll().
+
+    backend is "diag" (sock_diag netlink, Linux >= 4.2), "proc"
+    (/proc/net/tcp) or "psutil"; None picks the first that works.
+
+    "Changed" means the same 4-tuple now belongs to a different socket
+    or process or, when the backend has_counters, that it moved bytes or
+    packets since the last poll; each Connection then carries the
+    deltas. A new socket's delta is everything it has done so far,
+    except on the first poll, which only takes a baseline.
+
+    With the diag and proc backends, new sockets are matched to a pid
+    by first checking processes already known to own sockets and only
+    then scanning every /proc/<pid>/fd, at most once per rescan_s.
+    Sockets still without a pid are retried on the next allowed scans
+    (up to resolve_retries times) and reported as changed once found.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[str] = None,
+        rescan_s: float = 1.0,
+        resolve_retries: int = 5,
+    ) -> None:
+        if backend is None:
+            if sock_diag.available():
+                backend = "diag"
+            elif os.path.exists(PROC_NET_TCP[0]):
+                backend = "proc"
+            else:
+                backend = "psutil"
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend!r}")
+        self.backend = backend
+        self.rescan_s = rescan_s
+        self.resolve_retries = resolve_retries
+
+        self._diag = sock_diag.SockDiag() if backend == "diag" else None
+        self._conns: Dict[ConnKey, Connection] = {}
+        self._raw: Dict[tuple, ConnKey] = {}
+        self._inode_pid: Dict[int, int] = {}
+        self._last_full_scan = 0.0
+        # Connections whose pid lookup failed -> retries left.
+        self._unresolved: Dict[ConnKey, int] = {}
+
+        self.polls = 0
+        self.full_scans = 0
+
+    def __len__(self) -> int:
+        return len(self._conns)
+
+    @property
+    def has_counters(self) -> bool:
+        """True if connections carry real per-socket byte counters."""
+        return self.backend == "diag"
+
+    def connections(self) -> List[Connection]:
+        return list(self._conns.values())
+
+    def close(self) -> None:
+        if self._diag is not None:
+            self._diag.close()
+
+    def poll(
+        self,
+    ) -> Tuple[List[Connection], List[Connection], List[Connection]]:
+        """Return (new, changed, closed) since the previous poll."""
+        self.polls += 1
+        if self.backend == "diag":
+            snapshot = self._snapshot_diag()
+        elif self.backend == "proc":
+            snapshot = self._snapshot_proc()
+        else:
+            snapshot = self._snapshot_psutil()
+
+        now = time.time()
+        baseline = self.polls == 1
+        new: List[Connection] = []
+        changed: List[Connection] = []
+
+        for key, (inode, pid, out, in_, packets) in snapshot.items():
+            conn = self._conns.get(key)
+            if conn is None:
+                conn = Connection(*key, pid=pid, inode=inode, first_seen=now)
+                if baseline:
+                    conn.bytes_out, conn.bytes_in = out, in_
+                    conn.packets = packets
+                self._conns[key] = conn
+                new.append(conn)
+            elif conn.inode != inode:
+                conn.inode, conn.pid, conn.first_seen = inode, pid, now
+                conn.bytes_out = conn.bytes_in = conn.packets = 0
+                changed.append(conn)
+            elif conn.pid != pid:
+                conn.pid, conn.first_seen = pid, now
+                changed.append(conn)
+            elif (
+                packets != conn.packets
+                or out != conn.bytes_out
+                or in_ != conn.bytes_in
+            ):
+                changed.append(conn)
+
+            conn.delta_out = out - conn.bytes_out
+            conn.delta_in = in_ - conn.bytes_in
+            conn.delta_packets = packets - conn.packets
+            conn.bytes_out, conn.bytes_in, conn.packets = out, in_, packets
+
+        closed = [c for k, c in self._conns.items() if k not in snapshot]
+        for conn in closed:
+            del self._conns[conn.key]
+            self._inode_pid.pop(conn.inode, None)
+            self._unresolved.pop(conn.key, None)
+
+        if self.backend != "psutil":
+            retry = self._retry_candidates(new, changed, now)
+            self._resolve_pids(new + changed + retry, now)
+            changed.extend(c for c in retry if c.pid is not None)
+        return new, changed, closed
+
+    # ------------------------------------------------------------------
+    # Backends
+    # ------------------------------------------------------------------
+    def _snapshot_diag(self) -> Dict[ConnKey, SocketInfo]:
+        seen = {}
+        for sk in self._diag.dump_tcp():
+            seen[(sk.src, sk.sport, sk.dst, sk.dport)] = sk
+
+        for gone in [r for r in self._raw if r not in seen]:
+            del self._raw[gone]
+
+        snapshot = {}
+        for ident, sk in seen.items():
+            key = self._raw.get(ident)
+            if key is None:
+                key = self._raw[ident] = (
+                    _ip_text(sk.src), sk.sport, _ip_text(sk.dst), sk.dport
+                )
+            snapshot[key] = (
+                sk.inode,
+                self._inode_pid.get(sk.inode),
+                sk.bytes_acked,
+                sk.bytes_received,
+                sk.segs_out + sk.segs_in,
+            )
+        return snapshot
+
+    def _snapshot_proc(self) -> Dict[ConnKey, SocketInfo]:
+        raw = read_proc_net_tcp()
+
+        # Forget decodings of sockets that went away, decode new ones.
+        for gone in [r for r in self._raw if r not in raw]:
+            del self._raw[gone]
+
+        snapshot = {}
+        for pair, inode in raw.items():
+            key = self._raw.get(pair)
+            if key is None:
+                local, remote = _decode_addr(pair[0]), _decode_addr(pair[1])
+                key = self._raw[pair] = local + remote
+            snapshot[key] = (inode, self._inode_pid.get(inode), 0, 0, 0)
+        return snapshot
+
+    def _snapshot_psutil(self) -> Dict[ConnKey, SocketInfo]:
+        snapshot = {}
+        for c in psutil.net_connections(kind="tcp"):
+            if not c.raddr or c.status != psutil.CONN_ESTABLISHED:
+                continue
+            laddr, raddr = c.laddr.ip, c.raddr.ip
+            if laddr.startswith(_V4_MAPPED) and "." in laddr:
+                laddr = laddr[len(_V4_MAPPED):]
+            if raddr.startswith(_V4_MAPPED) and "." in raddr:
+                raddr = raddr[len(_V4_MAPPED):]
+            key = (laddr, c.laddr.port, raddr, c.raddr.port)
+            snapshot[key] = (0, c.pid, 0, 0, 0)
+        return snapshot
+
+    def _retry_candidates(
+        self,
+        new: List[Connection],
+        changed: List[Connection],
+        now: float,
+    ) -> List[Connection]:
+        """Unresolved connections not already in this poll's report."""
+        if (
+            not self._unresolved
+            or now - self._last_full_scan < self.rescan_s
+        ):
+            return []
+        reported = {c.key for c in new}
+        reported.update(c.key for c in changed)
+        retry = []
+        for key in list(self._unresolved):
+            conn = self._conns.get(key)
+            if conn is None or conn.pid is not None:
+                del self._unresolved[key]
+            elif key not in reported:
+                retry.append(conn)
+        return retry
+
+    def _resolve_pids(self, conns: List[Connection], now: float) -> None:
+        missing = {c.inode for c in conns if c.pid is None}
+        if not missing:
+            return
+
+        # New sockets usually belong to processes that already own one.
+        known = set(self._inode_pid.values())
+        missing = self._scan(known, missing)
+
+        if missing and now - self._last_full_scan >= self.rescan_s:
+            self._last_full_scan = now
+            self.full_scans += 1
+            pids = {int(p) for p in os.listdir("/proc") if p.isdigit()}
+            self._scan(pids - known, missing)
+
+        for conn in conns:
+            if conn.pid is None:
+                conn.pid = self._inode_pid.get(conn.inode)
+            if conn.pid is not None:
+                self._unresolved.pop(conn.key, None)
+                continue
+            # Retry later, but give up on sockets we cannot attribute
+            # (e.g. owned by processes we may not inspect).
+            left = self._unresolved.get(conn.key, self.resolve_retries + 1)
+            if left > 1:
+                self._unresolved[conn.key] = left - 1
+            else:
+                self._unresolved.pop(conn.key, None)
+
+    def _scan(self, pids: Set[int], wanted: Set[int]) -> Set[int]:
+        """Record socket owners for `pids`; returns inodes still unknown."""
+        wanted = set(wanted)
+        for pid in pids:
+            if not wanted:
+                break
+            for inode in _socket_inodes(pid):
+                if inode in wanted:
+                    self._inode_pid[inode] = pid
+                    wanted.discard(inode)
+        return wanted
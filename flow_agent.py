@@ -1,17 +1,24 @@
-import random
+import queue
 import socket
+import threading
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import psutil
 import requests
 
+from conn_tracker import ConnectionTracker, ProcessNameCache
 
-API_URL = "http://127.0.0.1:8000/ingest"
+
+API_URL = "http://127.0.0.1:8000/ingest_batch"
 INTERVAL = 0.2  # seconds
 
-MAX_CONNECTIONS_PER_TICK = 25  # prevents spamming the API
-TIMEOUT_S = 0.5
+QUEUE_MAX_EVENTS = 10_000  # events buffered before we start dropping
+BATCH_MAX_EVENTS = 500
+BATCH_MAX_WAIT_S = 0.5
+TIMEOUT_S = 2.0
+HEARTBEAT_S = 5.0
+PROCESS_NAME_TTL_S = 30.0
 
 
 def _hostname() -> str:
@@ -21,23 +28,107 @@ def _hostname() -> str:
         return "unknown-host"
 
 
-def _safe_process_name(pid: Optional[int]) -> Optional[str]:
-    if pid is None:
-        return None
-    try:
-        return psutil.Process(pid).name()
-    except Exception:
-        return None
+class EventShipper:
+    """
+    Bounded in-memory queue drained by a background sender thread.
+
+    The collection loop calls offer(), which never blocks: when the queue
+    is full the event is dropped and counted. The sender posts batches of
+    up to BATCH_MAX_EVENTS to the batch-ingest endpoint.
+    """
+
+    def __init__(
+        self,
+        api_url: str = API_URL,
+        max_queue: int = QUEUE_MAX_EVENTS,
+        max_batch: int = BATCH_MAX_EVENTS,
+        max_wait_s: float = BATCH_MAX_WAIT_S,
+        timeout_s: float = TIMEOUT_S,
+    ) -> None:
+        self.api_url = api_url
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self.timeout_s = timeout_s
+
+        self._queue: "queue.Queue[Dict[str, object]]" = queue.Queue(
+            maxsize=max_queue
+        )
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.queued_total = 0
+        self.sent_total = 0
+        self.batches_total = 0
+        self.bad_status_total = 0
+        self.dropped_queue_full = 0
+        self.dropped_send_error = 0
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run,
+            name="aegisnet-agent-sender",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def offer(self, event: Dict[str, object]) -> bool:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped_queue_full += 1
+            return False
+        self.queued_total += 1
+        return True
 
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
 
-def _get_active_tcp_connections():
-    # net_connections can be costly; keep it isolated for easy tuning later.
-    conns = psutil.net_connections(kind="tcp")
-    active = [
-        c for c in conns
-        if c.raddr and c.status == psutil.CONN_ESTABLISHED
-    ]
-    return active
+    def _next_batch(self) -> List[Dict[str, object]]:
+        try:
+            first = self._queue.get(timeout=0.25)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, session: requests.Session, batch: List) -> None:
+        try:
+            resp = session.post(
+                self.api_url,
+                json={"events": batch},
+                timeout=self.timeout_s,
+            )
+        except Exception:
+            self.dropped_send_error += len(batch)
+            return
+
+        self.batches_total += 1
+        if resp.status_code != 200:
+            self.bad_status_total += len(batch)
+        else:
+            self.sent_total += len(batch)
+
+    def _run(self) -> None:
+        session = requests.Session()
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._send(session, batch)
 
 
 def collect_and_send() -> None:
@@ -45,99 +136,99 @@ def collect_and_send() -> None:
     prev_net = psutil.net_io_counters()
     prev_time = time.time()
 
-    session = requests.Session()
+    shipper = EventShipper()
+    shipper.start()
+
+    # Only connections that are new or changed since the last tick are
+    # reported. On Linux the tracker reads sock_diag, whose per-socket
+    # counters give each connection its own bytes and packets; other
+    # backends fall back to splitting interface totals evenly.
+    tracker = ConnectionTracker()
+    names = ProcessNameCache(ttl_s=PROCESS_NAME_TTL_S)
 
-    sent_total = 0
-    dropped_total = 0
-    bad_status_total = 0
+    collect_errors = 0
+    last_heartbeat = prev_time
 
     print(f"[Agent] Started. Interval={INTERVAL}s -> {API_URL}")
     print(f"[Agent] agent_id={agent_id}")
+    print(f"[Agent] connection backend={tracker.backend}")
 
-    while True:
-        time.sleep(INTERVAL)
-
-        now = time.time()
-        elapsed = now - prev_time
-        prev_time = now
-
-        net = psutil.net_io_counters()
-
-        delta_in = net.bytes_recv - prev_net.bytes_recv
-        delta_out = net.bytes_sent - prev_net.bytes_sent
-
-        delta_pk_in = net.packets_recv - prev_net.packets_recv
-        delta_pk_out = net.packets_sent - prev_net.packets_sent
-        delta_packets = delta_pk_in + delta_pk_out
-
-        prev_net = net
-
-        try:
-            active = _get_active_tcp_connections()
-        except Exception:
-            dropped_total += 1
-            continue
-
-        if not active:
-            continue
-
-        # Cap connections per tick to avoid overwhelming the API
-        if len(active) > MAX_CONNECTIONS_PER_TICK:
-            active = random.sample(active, MAX_CONNECTIONS_PER_TICK)
-
-        n = len(active)
-        per_in = float(delta_in) / n if delta_in > 0 else 0.0
-        per_out = float(delta_out) / n if delta_out > 0 else 0.0
-        per_pk = float(delta_packets) / n if delta_packets > 0 else 0.0
-
-        for c in active:
-            src_ip = getattr(c.laddr, "ip", None)
-            dst_ip = getattr(c.raddr, "ip", None)
-
-            src_port = getattr(c.laddr, "port", None)
-            dst_port = getattr(c.raddr, "port", None)
-
-            if src_port is None or dst_port is None:
-                continue
+    try:
+        while True:
+            time.sleep(INTERVAL)
 
-            process_name = _safe_process_name(getattr(c, "pid", None))
-
-            payload: Dict[str, object] = {
-                "meta": {
-                    "agent_id": agent_id,
-                    "src_ip": str(src_ip) if src_ip else None,
-                    "dst_ip": str(dst_ip) if dst_ip else None,
-                    "process": process_name,
-                    "timestamp": now,
-                },
-                "features": {
-                    "bytes_in": float(per_in),
-                    "bytes_out": float(per_out),
-                    "packets": float(per_pk),
-                    "duration": float(elapsed),
-                    "src_port": float(src_port),
-                    "dst_port": float(dst_port),
-                    "protocol": 6.0,
-                },
-            }
+            now = time.time()
+            elapsed = now - prev_time
+            prev_time = now
 
             try:
-                resp = session.post(API_URL, json=payload, timeout=TIMEOUT_S)
-                sent_total += 1
-
-                if resp.status_code != 200:
-                    bad_status_total += 1
+                new, changed, _ = tracker.poll()
             except Exception:
-                dropped_total += 1
-
-        # Lightweight heartbeat every ~5s so you know it's alive
-        if sent_total and (sent_total % 250 == 0):
-            print(
-                f"[Agent] sent={sent_total} "
-                f"bad_status={bad_status_total} "
-                f"dropped={dropped_total} "
-                f"active_sampled={n}"
-            )
+                collect_errors += 1
+                continue
+
+            per_in = per_out = per_pk = 0.0
+            if not tracker.has_counters:
+                net = psutil.net_io_counters()
+
+                delta_in = net.bytes_recv - prev_net.bytes_recv
+                delta_out = net.bytes_sent - prev_net.bytes_sent
+
+                delta_pk_in = net.packets_recv - prev_net.packets_recv
+                delta_pk_out = net.packets_sent - prev_net.packets_sent
+                delta_packets = delta_pk_in + delta_pk_out
+
+                prev_net = net
+
+                n = max(len(tracker), 1)
+                per_in = float(delta_in) / n if delta_in > 0 else 0.0
+                per_out = float(delta_out) / n if delta_out > 0 else 0.0
+                per_pk = float(delta_packets) / n if delta_packets > 0 else 0.0
+
+            for c in new + changed:
+                if tracker.has_counters:
+                    per_in = float(c.delta_in)
+                    per_out = float(c.delta_out)
+                    per_pk = float(c.delta_packets)
+
+                shipper.offer(
+                    {
+                        "meta": {
+                            "agent_id": agent_id,
+                            "src_ip": c.laddr,
+                            "dst_ip": c.raddr,
+                            "process": names.name(c.pid),
+                            "timestamp": now,
+                        },
+                        "features": {
+                            "bytes_in": per_in,
+                            "bytes_out": per_out,
+                            "packets": per_pk,
+                            "duration": float(elapsed),
+                            "src_port": float(c.lport),
+                            "dst_port": float(c.rport),
+                            "protocol": 6.0,
+                        },
+                    }
+                )
+
+            # Lightweight heartbeat so you know it's alive
+            if now - last_heartbeat >= HEARTBEAT_S:
+                last_heartbeat = now
+                print(
+                    f"[Agent] sent={shipper.sent_total} "
+                    f"batches={shipper.batches_total} "
+                    f"bad_status={shipper.bad_status_total} "
+                    f"dropped_queue_full={shipper.dropped_queue_full} "
+                    f"dropped_send_error={shipper.dropped_send_error} "
+                    f"queue={shipper.queue_depth()} "
+                    f"connections={len(tracker)} "
+                    f"name_cache={names.hits}/{names.hits + names.misses} "
+                    f"collect_errors={collect_errors}"
+                )
+    finally:
+        shipper.stop()
+        tracker.close()
 
 
 def main() -> None:
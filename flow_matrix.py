@@ -0,0 +1,350 @@
+"""
+Memory-mapped float32 flow matrices for streaming training.
+
+FlowDataset reads a whole CSV into RAM, which does not scale to the
+100M+ flows a retention store holds. Here the features are converted
+once into a raw matrix on disk:
+
+    <out>           rows x len(feature_cols) little-endian float32, C order
+    <out>.json      rows, feature_cols, mean, std, source
+
+Conversion streams the source in chunks (CSV via pandas, or the
+HistoryStore segments) and folds every chunk into running mean/variance
+accumulators, so neither the data nor a copy of it is ever held in
+memory. The mean/std are stored in the same form train_autoencoder
+puts in the checkpoint.
+
+Training memory-maps the matrix. BlockShuffleSampler hands out whole
+batches of row numbers (random, but drawn from a few large contiguous
+blocks so reads stay mostly sequential) and FlowBatches gathers and
+normalizes a batch in one fancy-indexing step, which DataLoader workers
+can run in parallel.
+
+    python flow_matrix.py csv data/flows.csv data/flows.f32
+    python flow_matrix.py history history data/flows.f32 --days 7
+    python train_autoencoder.py --matrix data/flows.f32 --workers 4
+"""
+import argparse
+import json
+import os
+import time
+from typing import Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+from aegisnet.models.autoencoder import STD_EPS, RunningStats
+from flow_table import FEATURE_NAMES
+from history_store import HistoryStore
+
+
+DTYPE = np.dtype("<f4")
+
+
+def meta_path(path: str) -> str:
+    return path + ".json"
+
+
+# ----------------------------------------------------------------------
+# Conversion
+# ----------------------------------------------------------------------
+def csv_chunks(
+    csv_path: str,
+    feature_cols: Sequence[str],
+    chunk_rows: int = 1_000_000,
+) -> Iterator[np.ndarray]:
+    """float32 feature chunks of a CSV, parsing only feature_cols."""
+    cols = list(feature_cols)
+    reader = pd.read_csv(
+        csv_path,
+        usecols=cols,
+        dtype={c: np.float32 for c in cols},
+        chunksize=chunk_rows,
+    )
+    for chunk in reader:
+        yield chunk[cols].to_numpy(dtype=np.float32)
+
+
+def build_matrix(
+    chunks: Iterable[np.ndarray],
+    out_path: str,
+    feature_cols: Sequence[str],
+    source: str = "",
+) -> "FlowMatrix":
+    """Write feature chunks to out_path (+ stats) and open the result."""
+    stats = RunningStats(len(feature_cols))
+    rows = 0
+    start = time.perf_counter()
+
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as f:
+        for X in chunks:
+            X = np.ascontiguousarray(X, dtype=DTYPE)
+            if X.ndim != 2 or X.shape[1] != len(feature_cols):
+                raise ValueError(
+                    f"chunk shape {X.shape} does not match "
+                    f"{len(feature_cols)} feature columns"
+                )
+            stats.update(X)
+            f.write(X.data)
+            rows += len(X)
+    if not rows:
+        os.remove(tmp)
+        raise ValueError(f"no rows to convert from {source or 'input'}")
+    os.replace(tmp, out_path)
+
+    meta = {
+        "rows": rows,
+        "feature_cols": list(feature_cols),
+        "mean": stats.mean.tolist(),
+        "std": (stats.std + STD_EPS).tolist(),
+        "source": source,
+    }
+    tmp = meta_path(out_path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, meta_path(out_path))
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"[Matrix] {rows:,} rows x {len(feature_cols)} -> {out_path} "
+        f"in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)"
+    )
+    return FlowMatrix(out_path)
+
+
+def convert_csv(
+    csv_path: str,
+    out_path: str,
+    feature_cols: Sequence[str] = FEATURE_NAMES,
+    chunk_rows: int = 1_000_000,
+) -> "FlowMatrix":
+    return build_matrix(
+        csv_chunks(csv_path, feature_cols, chunk_rows),
+        out_path,
+        feature_cols,
+        source=csv_path,
+    )
+
+
+def convert_history(
+    root: str,
+    out_path: str,
+    feature_cols: Sequence[str] = FEATURE_NAMES,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    exclude_suspicious: bool = False,
+    chunk_rows: int = 1_000_000,
+) -> "FlowMatrix":
+    """Matrix of the flows kept by a HistoryStore under `root`."""
+    store = HistoryStore(root, feature_cols=tuple(feature_cols))
+    chunks = store.iter_features(
+        tuple(feature_cols),
+        start=start,
+        end=end,
+        exclude_suspicious=exclude_suspicious,
+        chunk_rows=chunk_rows,
+    )
+    return build_matrix(chunks, out_path, feature_cols, source=root)
+
+
+# ----------------------------------------------------------------------
+# Reading
+# ----------------------------------------------------------------------
+class FlowMatrix:
+    """A converted matrix: read-only memmap plus its stored stats."""
+
+    def __init__(self, path: str) -> None:
+        with open(meta_path(path)) as f:
+            meta = json.load(f)
+        self.path = path
+        self.rows: int = meta["rows"]
+        self.feature_cols = list(meta["feature_cols"])
+        dim = len(self.feature_cols)
+        self.mean = np.asarray(meta["mean"], dtype=np.float32).reshape(1, dim)
+        self.std = np.asarray(meta["std"], dtype=np.float32).reshape(1, dim)
+
+        expected = self.rows * dim * DTYPE.itemsize
+        size = os.path.getsize(path)
+        if size != expected:
+            raise ValueError(
+                f"{path} is {size} bytes, expected {expected}"
+            )
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def open(self) -> np.memmap:
+        return np.memmap(
+            self.path,
+            dtype=DTYPE,
+            mode="r",
+            shape=(self.rows, len(self.feature_cols)),
+        )
+
+
+class FlowBatches(Dataset):
+    """
+    Normalized batches of a FlowMatrix, indexed by an array of row
+    numbers rather than one row at a time. Use with a batch sampler and
+    DataLoader(batch_size=None). The memmap is opened lazily, so each
+    worker process maps the file itself instead of receiving a copy.
+    """
+
+    def __init__(self, path: str, normalize: bool = True) -> None:
+        matrix = FlowMatrix(path)
+        self.path = path
+        self.rows = matrix.rows
+        self.feature_cols = matrix.feature_cols
+        self.mean = matrix.mean
+        self.std = matrix.std
+        self.normalize = normalize
+        self._shift = matrix.mean.reshape(-1)
+        self._scale = (1.0 / matrix.std.reshape(-1)).astype(np.float32)
+        self._matrix = matrix
+        self._data: Optional[np.memmap] = None
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
+
+    def __getitem__(self, rows: np.ndarray) -> torch.Tensor:
+        if self._data is None:
+            self._data = self._matrix.open()
+        X = self._data[rows]  # fancy indexing: one gather, one copy
+        if self.normalize:
+            X -= self._shift
+            X *= self._scale
+        return torch.from_numpy(X)
+
+
+class BlockShuffleSampler(Sampler):
+    """
+    Yields sorted arrays of row numbers, one per batch.
+
+    Each epoch visits the matrix in blocks of block_rows contiguous
+    rows, in random order; mix_blocks blocks at a time are pooled and
+    shuffled together, and the pool is cut into batches. Batches thus
+    mix rows from mix_blocks distant parts of the file while a pool's
+    reads touch only mix_blocks regions, and the sampler holds at most
+    one pool of indices (8 MB at the defaults), however large the
+    matrix.
+    """
+
+    def __init__(
+        self,
+        rows: int,
+        batch_size: int,
+        block_rows: int = 65_536,
+        mix_blocks: int = 16,
+        drop_last: bool = False,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.rows = rows
+        self.batch_size = batch_size
+        self.block_rows = block_rows
+        self.mix_blocks = mix_blocks
+        self.drop_last = drop_last
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return self.rows // self.batch_size
+        return -(-self.rows // self.batch_size)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        bs = self.batch_size
+        n_blocks = -(-self.rows // self.block_rows)
+        order = self._rng.permutation(n_blocks)
+        carry = np.empty(0, dtype=np.int64)
+
+        for i in range(0, n_blocks, self.mix_blocks):
+            pool = [carry]
+            for block in order[i:i + self.mix_blocks].tolist():
+                lo = block * self.block_rows
+                hi = min(lo + self.block_rows, self.rows)
+                pool.append(np.arange(lo, hi, dtype=np.int64))
+            idx = np.concatenate(pool)
+            self._rng.shuffle(idx)
+
+            full = len(idx) - len(idx) % bs
+            for j in range(0, full, bs):
+                yield np.sort(idx[j:j + bs])
+            carry = idx[full:]
+
+        if len(carry) and not self.drop_last:
+            yield np.sort(carry)
+
+
+def make_loader(
+    path: str,
+    batch_size: int = 256,
+    num_workers: int = 0,
+    shuffle: bool = True,
+    seed: Optional[int] = None,
+    pin_memory: bool = False,
+) -> DataLoader:
+    """DataLoader of normalized (batch_size, dim) tensors from a matrix."""
+    dataset = FlowBatches(path)
+    if shuffle:
+        sampler = BlockShuffleSampler(len(dataset), batch_size, seed=seed)
+    else:
+        sampler = [
+            np.arange(lo, min(lo + batch_size, len(dataset)))
+            for lo in range(0, len(dataset), batch_size)
+        ]
+    return DataLoader(
+        dataset,
+        sampler=sampler,
+        batch_size=None,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        persistent_workers=num_workers > 0,
+        prefetch_factor=4 if num_workers > 0 else None,
+    )
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    sub = parser.add_subparsers(dest="source", required=True)
+
+    p_csv = sub.add_parser("csv", help="convert a flow CSV")
+    p_csv.add_argument("csv_path")
+    p_csv.add_argument("out_path")
+
+    p_hist = sub.add_parser("history", help="convert a HistoryStore")
+    p_hist.add_argument("root")
+    p_hist.add_argument("out_path")
+    p_hist.add_argument("--days", type=float, default=None,
+                        help="only flows from the last N days")
+    p_hist.add_argument("--exclude-suspicious", action="store_true",
+                        help="leave out flows scored as suspicious")
+
+    for p in (p_csv, p_hist):
+        p.add_argument("--cols", nargs="+", default=list(FEATURE_NAMES))
+        p.add_argument("--chunk-rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    if args.source == "csv":
+        convert_csv(args.csv_path, args.out_path, args.cols,
+                    chunk_rows=args.chunk_rows)
+    else:
+        start = None
+        if args.days is not None:
+            start = time.time() - args.days * 86_400
+        convert_history(args.root, args.out_path, args.cols, start=start,
+                        exclude_suspicious=args.exclude_suspicious,
+                        chunk_rows=args.chunk_rows)
+
+
+if __name__ == "__main__":
+    main()
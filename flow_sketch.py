@@ -0,0 +1,156 @@
+import math
+from typing import Hashable, Tuple
+
+import numpy as np
+
+
+FlowEntry = Tuple[float, str, int, float, float]
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(x: int) -> int:
+    # splitmix64 finalizer: spreads Python's hash() (identity for ints).
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def _hll_alpha(m: int) -> float:
+    if m <= 16:
+        return 0.673
+    if m <= 32:
+        return 0.697
+    if m <= 64:
+        return 0.709
+    return 0.7213 / (1.0 + 1.079 / m)
+
+
+class SketchWindow:
+    """
+    Constant-memory, approximate replacement for `SourceWindow`.
+
+    The window is split into `n_buckets` time buckets kept in a ring.
+    Each bucket holds two HyperLogLog register sets (dst ports, dst hosts)
+    and bytes_out/packets sums. Reads merge the buckets that overlap the
+    window, so expiry is at bucket granularity (window_s / n_buckets).
+    """
+
+    __slots__ = (
+        "bucket_s",
+        "last_ts",
+        "_p",
+        "_ids",
+        "_regs",
+        "_sums",
+        "_min_id",
+    )
+
+    def __init__(
+        self,
+        window_s: float,
+        n_buckets: int = 6,
+        precision: int = 7,
+    ) -> None:
+        slots = n_buckets + 1  # one extra so a full window always fits
+        self.bucket_s = float(window_s) / n_buckets
+        self.last_ts = 0.0
+        self._p = precision
+        self._ids = np.full(slots, -1, dtype=np.int64)
+        self._regs = np.zeros((2, slots, 1 << precision), dtype=np.uint8)
+        self._sums = np.zeros((slots, 2), dtype=np.float64)
+        self._min_id = -1
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+    def _slot(self, ts: float) -> int:
+        """Return the ring slot for `ts`, or -1 if it is already expired."""
+        bucket_id = int(ts // self.bucket_s)
+        if bucket_id < self._min_id:
+            return -1
+
+        slot = bucket_id % len(self._ids)
+        current = self._ids[slot]
+        if current == bucket_id:
+            return slot
+        if current > bucket_id:
+            return -1
+
+        # Slot held an older bucket: recycle it.
+        self._ids[slot] = bucket_id
+        self._regs[:, slot, :] = 0
+        self._sums[slot, :] = 0.0
+        return slot
+
+    def _add(self, which: int, slot: int, value: Hashable) -> None:
+        p = self._p
+        h = _mix64(hash(value) & _MASK64)
+        idx = h >> (64 - p)
+        rest = (h << p) & _MASK64
+        rho = min(64 - p + 1, 64 - rest.bit_length() + 1)
+        regs = self._regs[which, slot]
+        if rho > regs[idx]:
+            regs[idx] = rho
+
+    def append(self, entry: FlowEntry) -> None:
+        ts, host, port, bytes_out, packets = entry
+        self.last_ts = max(self.last_ts, ts)
+
+        slot = self._slot(ts)
+        if slot < 0:
+            return
+
+        if port > 0:
+            self._add(0, slot, port)
+        if host:
+            self._add(1, slot, host)
+        self._sums[slot, 0] += bytes_out
+        self._sums[slot, 1] += packets
+
+    def prune(self, cutoff: float) -> None:
+        self._min_id = max(self._min_id, int(cutoff // self.bucket_s))
+
+    # ------------------------------------------------------------------
+    # Aggregates
+    # ------------------------------------------------------------------
+    def _live(self) -> np.ndarray:
+        return self._ids >= self._min_id
+
+    def _estimate(self, which: int) -> int:
+        live = self._live()
+        if not live.any():
+            return 0
+
+        regs = self._regs[which, live].max(axis=0)
+        m = regs.shape[0]
+        inv = np.ldexp(1.0, -regs.astype(np.int32)).sum()
+        estimate = _hll_alpha(m) * m * m / float(inv)
+
+        zeros = int(np.count_nonzero(regs == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
+
+    @property
+    def n_dst_ports(self) -> int:
+        return self._estimate(0)
+
+    @property
+    def n_dst_hosts(self) -> int:
+        return self._estimate(1)
+
+    @property
+    def total_bytes_out(self) -> float:
+        return float(self._sums[self._live(), 0].sum())
+
+    @property
+    def total_packets(self) -> float:
+        return float(self._sums[self._live(), 1].sum())
+
+    def nbytes(self) -> int:
+        return int(
+            self._ids.nbytes + self._regs.nbytes + self._sums.nbytes + 200
+        )
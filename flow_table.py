@@ -0,0 +1,605 @@
+"""
+Compact, array-backed flow table for the capture agents.
+
+Flows live in parallel NumPy columns indexed by slot; the 5-tuple key is
+five uint64 words (src and dst as 16-byte IPv6 / IPv4-mapped addresses,
+plus ports and protocol). An open-addressing hash index maps keys to
+slots, and expired slots go on a free list for reuse.
+
+Flows are bidirectional: both directions of a conversation share one
+canonical key (lower endpoint first), and each flow remembers which
+endpoint started it. Exported records are oriented initiator -> responder,
+with bytes_out sent by the initiator and bytes_in sent back to it.
+
+Packets are applied in vectorized batches: add_packet() packs a record
+into a buffer and update() folds a whole batch of records into the
+table at once. Expired flows come back as a structured array that can
+be turned into a feature matrix in one step (flow_features).
+
+Roughly 100 bytes per flow including the index and expiry heap, so
+1M concurrent flows fit in about 150 MB.
+"""
+import heapq
+import math
+import socket
+import struct
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+# Raw packet record: timestamp, 16-byte src/dst, wire length, ports,
+# proto and TCP flags.
+PACKET_STRUCT = struct.Struct("<d16s16sIHHBB")
+PACKET_DTYPE = np.dtype(
+    [
+        ("ts", "<f8"),
+        ("src", ">u8", (2,)),
+        ("dst", ">u8", (2,)),
+        ("length", "<u4"),
+        ("sport", "<u2"),
+        ("dport", "<u2"),
+        ("proto", "u1"),
+        ("flags", "u1"),
+    ]
+)
+assert PACKET_DTYPE.itemsize == PACKET_STRUCT.size
+
+# Exported flow record.
+FLOW_DTYPE = np.dtype(
+    [
+        ("src", ">u8", (2,)),
+        ("dst", ">u8", (2,)),
+        ("sport", "<u2"),
+        ("dport", "<u2"),
+        ("proto", "u1"),
+        ("first_ts", "<f8"),
+        ("last_ts", "<f8"),
+        ("bytes_in", "<f8"),
+        ("bytes_out", "<f8"),
+        ("packets", "<u4"),
+    ]
+)
+
+FEATURE_NAMES = (
+    "bytes_in",
+    "bytes_out",
+    "packets",
+    "duration",
+    "src_port",
+    "dst_port",
+    "protocol",
+)
+
+V4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+PROTO_TCP = 6
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+# Per-flow TCP state bits.
+_FIN_OUT = 1  # FIN seen from the initiator
+_FIN_IN = 2  # FIN seen from the responder
+_RST = 4
+
+_EMPTY = -1
+_TOMBSTONE = -2
+_MAX_LOAD = 0.5
+_SLOT_BITS = 32
+_SLOT_MASK = (1 << _SLOT_BITS) - 1
+
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+
+
+def pack_ip(ip: str) -> bytes:
+    """Text IP -> 16 bytes (IPv4 addresses become IPv4-mapped IPv6)."""
+    if ":" in ip:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    return V4_MAPPED_PREFIX + socket.inet_aton(ip)
+
+
+def ip_str(raw: bytes) -> str:
+    """16-byte address -> text, printing IPv4-mapped addresses as IPv4."""
+    if raw[:12] == V4_MAPPED_PREFIX:
+        return socket.inet_ntop(socket.AF_INET, raw[12:])
+    return socket.inet_ntop(socket.AF_INET6, raw)
+
+
+def _hash_keys(keys: np.ndarray) -> np.ndarray:
+    h = np.full(len(keys), 0x9E3779B97F4A7C15, dtype=np.uint64)
+    for j in range(keys.shape[1]):
+        h ^= keys[:, j]
+        h ^= h >> np.uint64(30)
+        h *= _M1
+        h ^= h >> np.uint64(27)
+        h *= _M2
+    return h ^ (h >> np.uint64(31))
+
+
+def _packet_keys(packets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Canonical (direction-free) keys for a packet batch: the lower
+    (address, port) endpoint goes first. Also returns `swapped`, True
+    where the packet travels from the higher endpoint to the lower.
+    """
+    src, dst = packets["src"], packets["dst"]
+    sport, dport = packets["sport"], packets["dport"]
+
+    swapped = (src[:, 0] > dst[:, 0]) | (
+        (src[:, 0] == dst[:, 0])
+        & (
+            (src[:, 1] > dst[:, 1])
+            | ((src[:, 1] == dst[:, 1]) & (sport > dport))
+        )
+    )
+    flip = swapped[:, None]
+
+    keys = np.empty((len(packets), 5), dtype=np.uint64)
+    keys[:, 0:2] = np.where(flip, dst, src)
+    keys[:, 2:4] = np.where(flip, src, dst)
+    keys[:, 4] = (
+        (np.where(swapped, dport, sport).astype(np.uint64) << np.uint64(24))
+        | (np.where(swapped, sport, dport).astype(np.uint64) << np.uint64(8))
+        | packets["proto"].astype(np.uint64)
+    )
+    return keys, swapped
+
+
+def _is_closed(state: np.ndarray) -> np.ndarray:
+    both_fin = (state & (_FIN_OUT | _FIN_IN)) == (_FIN_OUT | _FIN_IN)
+    return ((state & _RST) != 0) | both_fin
+
+
+class FlowTable:
+    """
+    Array-backed flow table with NetFlow-style expiry.
+
+    A flow expires idle_s after its last packet, or active_s after its
+    first packet if it is still active (the next packet then starts a
+    new record). A TCP flow that saw a RST, or a FIN from both sides,
+    expires close_s after its last packet, which leaves time for the
+    final ACK to land in the same record.
+
+    Deadlines sit in a heap of packed ints (deadline_ms << 32 | slot),
+    checked lazily against the columns, so expiring k of n flows costs
+    O(k log n).
+    """
+
+    def __init__(
+        self,
+        idle_s: float = 30.0,
+        active_s: float = 60.0,
+        close_s: float = 2.0,
+        capacity: int = 65_536,
+        batch_size: int = 2_048,
+    ) -> None:
+        self.idle_s = idle_s
+        self.active_s = active_s
+        self.close_s = close_s
+        self.flows_created = 0
+        self.flows_closed = 0
+
+        self._cap = 0
+        self._live = 0
+        self._next = 0  # slots below this have been handed out
+        self._nfree = 0
+        self._used = 0  # live + tombstone index buckets
+        self._heap: List[int] = []
+        self._grow(capacity)
+
+        self._pending = bytearray(batch_size * PACKET_STRUCT.size)
+        self._npending = 0
+        self._batch_size = batch_size
+
+    def __len__(self) -> int:
+        return self._live
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+    def _grow(self, capacity: int) -> None:
+        old = self._cap
+        self._cap = capacity
+
+        def grown(col: np.ndarray, fill=0) -> np.ndarray:
+            shape = (capacity,) + col.shape[1:]
+            new = np.full(shape, fill, dtype=col.dtype)
+            new[:old] = col[:old]
+            return new
+
+        if old == 0:
+            self._keys = np.zeros((capacity, 5), dtype=np.uint64)
+            self._first = np.zeros(capacity, dtype=np.float64)
+            self._last = np.zeros(capacity, dtype=np.float64)
+            self._bytes_in = np.zeros(capacity, dtype=np.float64)
+            self._bytes_out = np.zeros(capacity, dtype=np.float64)
+            self._packets = np.zeros(capacity, dtype=np.uint32)
+            self._orient = np.zeros(capacity, dtype=np.bool_)
+            self._state = np.zeros(capacity, dtype=np.uint8)
+            self._due = np.full(capacity, -1, dtype=np.int64)
+            self._bucket = np.zeros(capacity, dtype=np.int64)
+            self._free = np.zeros(capacity, dtype=np.int64)
+        else:
+            self._keys = grown(self._keys)
+            self._first = grown(self._first)
+            self._last = grown(self._last)
+            self._bytes_in = grown(self._bytes_in)
+            self._bytes_out = grown(self._bytes_out)
+            self._packets = grown(self._packets)
+            self._orient = grown(self._orient)
+            self._state = grown(self._state)
+            self._due = grown(self._due, -1)
+            self._bucket = grown(self._bucket)
+            self._free = grown(self._free)
+
+        self._rebuild_index()
+
+    def _rebuild_index(self) -> None:
+        size = 1
+        while size * _MAX_LOAD < self._cap:
+            size <<= 1
+        self._index = np.full(size, _EMPTY, dtype=np.int32)
+        self._mask = np.uint64(size - 1)
+        self._used = 0
+
+        live = np.flatnonzero(self._due[:self._next] >= 0)
+        if live.size:
+            self._insert_slots(live)
+
+    def _insert_slots(self, slots: np.ndarray) -> None:
+        """Place existing slots (with unique keys) into the index."""
+        pos = _hash_keys(self._keys[slots]) & self._mask
+        todo = np.arange(len(slots))
+        while todo.size:
+            p = pos[todo]
+            empty = self._index[p] == _EMPTY
+            cand = todo[empty]
+            uniq, first = np.unique(p[empty], return_index=True)
+            won = cand[first]
+            self._index[uniq] = slots[won]
+            self._bucket[slots[won]] = uniq
+            self._used += len(won)
+
+            rest = np.ones(todo.size, dtype=bool)
+            rest[np.flatnonzero(empty)[first]] = False
+            todo = todo[rest]
+            pos[todo] = (pos[todo] + np.uint64(1)) & self._mask
+
+    def _reserve(self, n_new: int) -> None:
+        if self._live + n_new > self._cap:
+            cap = self._cap
+            while self._live + n_new > cap:
+                cap <<= 1
+            self._grow(cap)
+        elif self._used + n_new > len(self._index) * _MAX_LOAD:
+            self._rebuild_index()  # too many tombstones
+
+    def _alloc(self, n: int) -> np.ndarray:
+        take = min(n, self._nfree)
+        slots = self._free[self._nfree - take:self._nfree].copy()
+        self._nfree -= take
+        if take < n:
+            fresh = np.arange(self._next, self._next + n - take)
+            self._next += n - take
+            slots = np.concatenate([slots, fresh])
+        self._live += n
+        return slots
+
+    def _release(self, slots: np.ndarray) -> None:
+        self._index[self._bucket[slots]] = _TOMBSTONE
+        self._due[slots] = -1
+        self._free[self._nfree:self._nfree + len(slots)] = slots
+        self._nfree += len(slots)
+        self._live -= len(slots)
+
+    def _find_or_insert(
+        self,
+        keys: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (slot per key, mask of keys that were inserted)."""
+        n = len(keys)
+        slots = np.full(n, -1, dtype=np.int64)
+        inserted = np.zeros(n, dtype=bool)
+        pos = _hash_keys(keys) & self._mask
+        todo = np.arange(n)
+        index = self._index
+
+        while todo.size:
+            p = pos[todo]
+            s = index[p].astype(np.int64)
+            advance = np.ones(todo.size, dtype=bool)
+
+            occ = np.flatnonzero(s >= 0)
+            if occ.size:
+                eq = (self._keys[s[occ]] == keys[todo[occ]]).all(axis=1)
+                hit = occ[eq]
+                slots[todo[hit]] = s[hit]
+                advance[hit] = False
+
+            empty = np.flatnonzero(s == _EMPTY)
+            if empty.size:
+                # Several new keys may probe the same empty bucket: the
+                # first one takes it, the rest look again next round.
+                uniq, first = np.unique(p[empty], return_index=True)
+                won = todo[empty[first]]
+                new_slots = self._alloc(len(won))
+                index[uniq] = new_slots
+                self._keys[new_slots] = keys[won]
+                self._bucket[new_slots] = uniq
+                self._used += len(won)
+                slots[won] = new_slots
+                inserted[won] = True
+                advance[empty] = False
+
+            done = slots[todo] >= 0
+            moving = todo[advance & ~done]
+            pos[moving] = (pos[moving] + np.uint64(1)) & self._mask
+            todo = todo[~done]
+
+        return slots, inserted
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+    def add_packet(
+        self,
+        ts: float,
+        src: bytes,
+        dst: bytes,
+        sport: int,
+        dport: int,
+        proto: int,
+        length: int,
+        flags: int = 0,
+    ) -> None:
+        """Buffer one packet (16-byte addresses); applied in batches."""
+        PACKET_STRUCT.pack_into(
+            self._pending,
+            self._npending * PACKET_STRUCT.size,
+            ts, src, dst, length, sport, dport, proto, flags,
+        )
+        self._npending += 1
+        if self._npending == self._batch_size:
+            self.apply_pending()
+
+    def apply_pending(self) -> None:
+        if not self._npending:
+            return
+        packets = np.frombuffer(
+            self._pending,
+            dtype=PACKET_DTYPE,
+            count=self._npending,
+        )
+        self._npending = 0
+        self.update(packets)
+
+    def update(self, packets: np.ndarray) -> int:
+        """Fold a PACKET_DTYPE array into the table; returns new flows."""
+        if not len(packets):
+            return 0
+
+        keys, swapped = _packet_keys(packets)
+        rows = np.ascontiguousarray(keys).view(
+            np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))
+        ).ravel()
+        _, first, inverse = np.unique(
+            rows,
+            return_index=True,
+            return_inverse=True,
+        )
+        ukeys = keys[first]
+        n = len(ukeys)
+
+        ts = packets["ts"]
+        t_min = np.full(n, np.inf)
+        t_max = np.full(n, -np.inf)
+        np.minimum.at(t_min, inverse, ts)
+        np.maximum.at(t_max, inverse, ts)
+        npkts = np.bincount(inverse, minlength=n)
+
+        flags = packets["flags"]
+        tcp = packets["proto"] == PROTO_TCP
+        handshake = flags & (TCP_SYN | TCP_ACK)
+
+        self._reserve(n)
+        slots, inserted = self._find_or_insert(ukeys)
+        new = slots[inserted]
+
+        if new.size:
+            # Initiator: sender of the first SYN, else receiver of the
+            # first SYN-ACK, else sender of the first packet.
+            syn = tcp & (handshake == TCP_SYN)
+            synack = tcp & (handshake == (TCP_SYN | TCP_ACK))
+            rank = np.where(syn, 0, np.where(synack, 1, 2))
+            init_swapped = swapped ^ synack
+            order = np.lexsort((rank, inverse))
+            starts = np.flatnonzero(np.diff(inverse[order])) + 1
+            pick = order[np.concatenate([[0], starts])]
+
+            self._orient[new] = init_swapped[pick][inserted]
+            self._state[new] = 0
+            self._first[new] = t_min[inserted]
+            self._last[new] = t_max[inserted]
+            self._bytes_in[new] = 0.0
+            self._bytes_out[new] = 0.0
+            self._packets[new] = 0
+
+        old = slots[~inserted]
+        self._last[old] = np.maximum(self._last[old], t_max[~inserted])
+
+        # Credit each packet to its direction relative to the initiator.
+        outbound = swapped == self._orient[slots][inverse]
+        length = packets["length"].astype(np.float64)
+        self._bytes_out[slots] += np.bincount(
+            inverse, weights=length * outbound, minlength=n
+        )
+        self._bytes_in[slots] += np.bincount(
+            inverse, weights=length * ~outbound, minlength=n
+        )
+        self._packets[slots] += npkts.astype(np.uint32)
+
+        schedule = new
+        fin = tcp & ((flags & TCP_FIN) != 0)
+        rst = tcp & ((flags & TCP_RST) != 0)
+        if fin.any() or rst.any():
+            bits = (
+                np.where(fin & outbound, _FIN_OUT, 0)
+                | np.where(fin & ~outbound, _FIN_IN, 0)
+                | np.where(rst, _RST, 0)
+            ).astype(np.uint8)
+            ubits = np.zeros(n, dtype=np.uint8)
+            np.bitwise_or.at(ubits, inverse, bits)
+
+            before = self._state[slots]
+            after = before | ubits
+            self._state[slots] = after
+            closing = _is_closed(after) & ~_is_closed(before)
+            self.flows_closed += int(closing.sum())
+
+            # Closing may move the deadline earlier: push a fresh heap
+            # entry (the old one goes stale).
+            schedule = slots[inserted | closing]
+
+        if schedule.size:
+            due = self._deadline_ms(schedule)
+            # Only push when the deadline actually moves earlier (new
+            # slots have none); an identical entry would pass the
+            # staleness check in _pop_due twice.
+            current = self._due[schedule]
+            earlier = (current < 0) | (due < current)
+            schedule, due = schedule[earlier], due[earlier]
+            self._due[schedule] = due
+            heap = self._heap
+            for slot, d in zip(schedule.tolist(), due.tolist()):
+                heapq.heappush(heap, (d << _SLOT_BITS) | slot)
+        self.flows_created += new.size
+
+        return int(new.size)
+
+    # ------------------------------------------------------------------
+    # Expiry and export
+    # ------------------------------------------------------------------
+    def _deadline_ms(self, slots: np.ndarray) -> np.ndarray:
+        last = self._last[slots]
+        due = np.minimum(
+            last + self.idle_s,
+            self._first[slots] + self.active_s,
+        )
+        closed = _is_closed(self._state[slots])
+        if closed.any():
+            due = np.where(closed, np.minimum(due, last + self.close_s), due)
+        return np.ceil(due * 1000.0).astype(np.int64)
+
+    def expire(self, now: float) -> np.ndarray:
+        """
+        Remove every flow whose deadline is <= now (math.inf removes
+        all of them) and return them as a FLOW_DTYPE array.
+        """
+        self.apply_pending()
+
+        if math.isinf(now):
+            slots = np.flatnonzero(self._due[:self._next] >= 0)
+            self._heap = []
+        else:
+            slots = self._pop_due(int(math.floor(now * 1000.0)))
+
+        records = self.records(slots)
+        if slots.size:
+            self._release(slots)
+        return records
+
+    def _pop_due(self, now_ms: int) -> np.ndarray:
+        heap = self._heap
+        popped = []
+        while heap and (heap[0] >> _SLOT_BITS) <= now_ms:
+            popped.append(heapq.heappop(heap))
+        if not popped:
+            return np.empty(0, dtype=np.int64)
+
+        slots = np.array([e & _SLOT_MASK for e in popped], dtype=np.int64)
+        due = np.array([e >> _SLOT_BITS for e in popped], dtype=np.int64)
+
+        # Skip stale entries (slot freed or rescheduled since the push),
+        # and never export or release a slot twice.
+        slots = np.unique(slots[self._due[slots] == due])
+
+        # Flows that saw packets since being scheduled go back in the heap.
+        current = self._deadline_ms(slots)
+        later = current > now_ms
+        self._due[slots[later]] = current[later]
+        for slot, d in zip(slots[later].tolist(), current[later].tolist()):
+            heapq.heappush(heap, (d << _SLOT_BITS) | slot)
+
+        return slots[~later]
+
+    def records(self, slots: np.ndarray) -> np.ndarray:
+        """Copy the given slots out as FLOW_DTYPE, initiator first."""
+        keys = self._keys[slots]
+        flip = self._orient[slots]
+        lo_port = keys[:, 4] >> np.uint64(24)
+        hi_port = (keys[:, 4] >> np.uint64(8)) & np.uint64(0xFFFF)
+
+        out = np.empty(len(slots), dtype=FLOW_DTYPE)
+        out["src"] = np.where(flip[:, None], keys[:, 2:4], keys[:, 0:2])
+        out["dst"] = np.where(flip[:, None], keys[:, 0:2], keys[:, 2:4])
+        out["sport"] = np.where(flip, hi_port, lo_port)
+        out["dport"] = np.where(flip, lo_port, hi_port)
+        out["proto"] = keys[:, 4] & np.uint64(0xFF)
+        out["first_ts"] = self._first[slots]
+        out["last_ts"] = self._last[slots]
+        out["bytes_in"] = self._bytes_in[slots]
+        out["bytes_out"] = self._bytes_out[slots]
+        out["packets"] = self._packets[slots]
+        return out
+
+    def nbytes(self) -> int:
+        cols = (
+            self._keys,
+            self._first,
+            self._last,
+            self._bytes_in,
+            self._bytes_out,
+            self._packets,
+            self._orient,
+            self._state,
+            self._due,
+            self._bucket,
+            self._free,
+            self._index,
+        )
+        heap = len(self._heap) * 44  # list pointer + 3-digit int
+        return int(sum(c.nbytes for c in cols) + heap + len(self._pending))
+
+
+def flow_features(records: np.ndarray) -> np.ndarray:
+    """FLOW_DTYPE records -> float64 matrix with FEATURE_NAMES columns."""
+    X = np.empty((len(records), len(FEATURE_NAMES)), dtype=np.float64)
+    X[:, 0] = records["bytes_in"]
+    X[:, 1] = records["bytes_out"]
+    X[:, 2] = records["packets"]
+    X[:, 3] = np.maximum(0.001, records["last_ts"] - records["first_ts"])
+    X[:, 4] = records["sport"]
+    X[:, 5] = records["dport"]
+    X[:, 6] = records["proto"]
+    return X
+
+
+def record_ips(records: np.ndarray) -> Tuple[List[str], List[str]]:
+    """Text src/dst addresses for FLOW_DTYPE records."""
+    cache: Dict[bytes, str] = {}
+
+    def text(words: np.ndarray) -> List[str]:
+        raw = words.astype(">u8").tobytes()
+        out = []
+        for i in range(0, len(raw), 16):
+            b = raw[i:i + 16]
+            s = cache.get(b)
+            if s is None:
+                s = cache[b] = ip_str(b)
+            out.append(s)
+        return out
+
+    return text(records["src"]), text(records["dst"])
@@ -0,0 +1,743 @@
+"""
+Append-only, columnar on-disk history of scored flows.
+
+Every scored flow (features, meta, score and verdict) is appended to a
+segment directory; a new segment is started every segment_s seconds of
+arrival time or after max_segment_rows rows:
+
+    <root>/seg-<partition start, epoch s>-<n>/
+        index.json          rows committed + min/max pruning index
+        ts.bin, score.bin, suspicious.bin, threat_confidence.bin,
+        <feature>.bin       raw little-endian columns (dtypes in index)
+        src_ip.bin + src_ip.dict, ...
+                            dictionary-encoded strings: int32 codes
+                            (-1 for missing) + one JSON value per line
+
+Column files are only ever appended to. index.json is replaced
+atomically after each batch, so readers (which memory-map the columns)
+only ever see fully written rows, even while a segment is being filled
+or after a crash.
+
+Writes are batched on a background thread; append() only queues.
+Expired segments are first renamed out of the seg- namespace, then
+deleted, and readers skip a segment that disappears mid-query.
+query() skips whole segments whose time, score, source or label index
+cannot match, and filters the rest with vectorized masks.
+iter_features() streams stored feature columns in chunks, for building
+training matrices (see flow_matrix.py).
+"""
+import json
+import os
+import shutil
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from flow_table import FEATURE_NAMES
+
+
+# (flow, score, is_suspicious), as recorded by the ResultSink
+Result = Tuple[Dict[str, Any], float, bool]
+
+STRING_COLUMNS = (
+    "src_ip",
+    "dst_ip",
+    "process",
+    "agent_id",
+    "threat_label",
+    "threat_reason",
+)
+_BASE_COLUMNS = (
+    ("ts", "<f8"),
+    ("score", "<f4"),
+    ("suspicious", "u1"),
+    ("threat_confidence", "<f4"),
+)
+_CODE_DTYPE = "<i4"
+_INDEX = "index.json"
+_TRASH_PREFIX = "expired-"
+
+
+def _segment_name(partition: int, n: int) -> str:
+    return f"seg-{partition:010d}-{n:04d}"
+
+
+def _float_or_nan(value: Any) -> float:
+    return np.nan if value is None else float(value)
+
+
+def _write_json(path: str, obj: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+# ----------------------------------------------------------------------
+# Writer side
+# ----------------------------------------------------------------------
+class _SegmentWriter:
+    """One open segment, owned by the writer thread."""
+
+    def __init__(
+        self,
+        path: str,
+        partition: int,
+        feature_cols: Tuple[str, ...],
+    ) -> None:
+        os.makedirs(path)
+        self.path = path
+        self.partition = partition
+        self.columns = dict(_BASE_COLUMNS)
+        self.columns.update({name: "<f4" for name in feature_cols})
+        self.feature_cols = feature_cols
+
+        self._files = {
+            name: open(os.path.join(path, f"{name}.bin"), "ab")
+            for name in list(self.columns) + list(STRING_COLUMNS)
+        }
+        # Unbuffered: each batch's new values go out in one write, never
+        # split by a buffer flush (readers skip an unterminated line).
+        self._dict_files = {
+            name: open(os.path.join(path, f"{name}.dict"), "ab", buffering=0)
+            for name in STRING_COLUMNS
+        }
+        self._codes: Dict[str, Dict[str, int]] = {
+            name: {} for name in STRING_COLUMNS
+        }
+
+        self.rows = 0
+        self.ts_min = self.ts_max = None
+        self.score_min = self.score_max = None
+        self.src_min = self.src_max = None
+        self.labels: set = set()
+        self._write_index(closed=False)
+
+    def append(self, ts: np.ndarray, flows: List[Dict], scores, flags) -> None:
+        n = len(flows)
+        score = np.asarray(scores, dtype=np.float32)
+        conf = np.fromiter(
+            (_float_or_nan(f.get("threat_confidence")) for f in flows),
+            dtype=np.float32,
+            count=n,
+        )
+        numeric = {
+            "ts": ts,
+            "score": score,
+            "suspicious": np.asarray(flags, dtype=np.uint8),
+            "threat_confidence": conf,
+        }
+        for name in self.feature_cols:
+            numeric[name] = np.fromiter(
+                (f.get(name, np.nan) for f in flows),
+                dtype=np.float32,
+                count=n,
+            )
+        for name, dtype in self.columns.items():
+            self._files[name].write(
+                np.ascontiguousarray(numeric[name], dtype=dtype).tobytes()
+            )
+
+        for name in STRING_COLUMNS:
+            values = [f.get(name) for f in flows]
+            self._files[name].write(self._encode(name, values).tobytes())
+            if name == "src_ip":
+                present = [v for v in values if v]
+                if present:
+                    lo, hi = min(present), max(present)
+                    if self.src_min is None or lo < self.src_min:
+                        self.src_min = lo
+                    if self.src_max is None or hi > self.src_max:
+                        self.src_max = hi
+            elif name == "threat_label":
+                self.labels.update(v for v in values if v)
+
+        self.rows += n
+        lo, hi = float(ts.min()), float(ts.max())
+        self.ts_min = lo if self.ts_min is None else min(self.ts_min, lo)
+        self.ts_max = hi if self.ts_max is None else max(self.ts_max, hi)
+        lo, hi = float(score.min()), float(score.max())
+        self.score_min = (
+            lo if self.score_min is None else min(self.score_min, lo)
+        )
+        self.score_max = (
+            hi if self.score_max is None else max(self.score_max, hi)
+        )
+
+        # Data first, then the index that makes it visible.
+        for f in self._files.values():
+            f.flush()
+        self._write_index(closed=False)
+
+    def _encode(self, name: str, values: List[Optional[str]]) -> np.ndarray:
+        codes = self._codes[name]
+        out = np.empty(len(values), dtype=_CODE_DTYPE)
+        new: List[str] = []
+        for i, value in enumerate(values):
+            if value is None or value == "":
+                out[i] = -1
+                continue
+            value = str(value)
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+                new.append(json.dumps(value))
+            out[i] = code
+        if new:
+            self._dict_files[name].write(
+                ("\n".join(new) + "\n").encode("ascii")
+            )
+        return out
+
+    def _write_index(self, closed: bool) -> None:
+        _write_json(
+            os.path.join(self.path, _INDEX),
+            {
+                "rows": self.rows,
+                "closed": closed,
+                "columns": self.columns,
+                "strings": list(STRING_COLUMNS),
+                "ts_min": self.ts_min,
+                "ts_max": self.ts_max,
+                "score_min": self.score_min,
+                "score_max": self.score_max,
+                "src_min": self.src_min,
+                "src_max": self.src_max,
+                "labels": sorted(self.labels),
+            },
+        )
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        for f in self._dict_files.values():
+            f.close()
+        self._write_index(closed=True)
+
+
+# ----------------------------------------------------------------------
+# Reader side
+# ----------------------------------------------------------------------
+class _SegmentReader:
+    """Memory-mapped view of the committed rows of one segment."""
+
+    def __init__(self, path: str, index: Dict[str, Any]) -> None:
+        self.path = path
+        self.index = index
+        self.rows = index["rows"]
+        self._dicts: Dict[str, List[str]] = {}
+        self._lookups: Dict[str, Dict[str, int]] = {}
+
+    def column(self, name: str) -> np.ndarray:
+        dtype = self.index["columns"].get(name, _CODE_DTYPE)
+        if not self.rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(
+            os.path.join(self.path, f"{name}.bin"),
+            dtype=dtype,
+            mode="r",
+            shape=(self.rows,),
+        )
+
+    def values(self, name: str) -> List[str]:
+        values = self._dicts.get(name)
+        if values is None:
+            with open(os.path.join(self.path, f"{name}.dict"), "rb") as f:
+                data = f.read()
+            # Only complete lines: the writer may be mid-append, but every
+            # value committed rows refer to is already terminated.
+            data = data[:data.rfind(b"\n") + 1]
+            values = [
+                json.loads(line) for line in data.splitlines() if line.strip()
+            ]
+            self._dicts[name] = values
+        return values
+
+    def code(self, name: str, value: str) -> int:
+        """Dictionary code of `value`, or -1 if this segment lacks it."""
+        lookup = self._lookups.get(name)
+        if lookup is None:
+            lookup = self._lookups[name] = {
+                v: i for i, v in enumerate(self.values(name))
+            }
+        return lookup.get(value, -1)
+
+    def can_match(
+        self,
+        start: Optional[float],
+        end: Optional[float],
+        src_ip: Optional[str],
+        min_score: Optional[float],
+        label: Optional[str],
+    ) -> bool:
+        idx = self.index
+        if not self.rows:
+            return False
+        if start is not None and idx["ts_max"] < start:
+            return False
+        if end is not None and idx["ts_min"] > end:
+            return False
+        if min_score is not None and idx["score_max"] < min_score:
+            return False
+        if src_ip is not None and (
+            idx["src_min"] is None
+            or not idx["src_min"] <= src_ip <= idx["src_max"]
+        ):
+            return False
+        if label is not None and label not in idx["labels"]:
+            return False
+        return True
+
+
+class HistoryStore:
+    """
+    Persistent scored-flow history: background batched writer plus
+    segment-pruned queries. append() may be called from one thread (the
+    ResultSink consumer); query() from any.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        segment_s: float = 3_600.0,
+        max_segment_rows: int = 5_000_000,
+        retention_s: Optional[float] = None,
+        flush_rows: int = 8_192,
+        flush_interval_s: float = 1.0,
+        max_pending_rows: int = 1_000_000,
+        feature_cols: Tuple[str, ...] = FEATURE_NAMES,
+    ) -> None:
+        self.root = root
+        self.segment_s = segment_s
+        self.max_segment_rows = max_segment_rows
+        self.retention_s = retention_s
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self.max_pending_rows = max_pending_rows
+        self.feature_cols = tuple(feature_cols)
+
+        self._pending: Deque[Tuple[float, List[Result]]] = deque()
+        self._pending_rows = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._segment: Optional[_SegmentWriter] = None
+
+        # Closed segments never change, so their readers are cached.
+        self._readers: Dict[str, _SegmentReader] = {}
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches_written = 0
+        self.write_errors = 0
+        self.segments_created = 0
+        self.segments_deleted = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="aegisnet-history-writer",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the writer after flushing anything already queued."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def append(self, results: List[Result], now: float) -> None:
+        """Queue results for writing; never waits on disk."""
+        n = len(results)
+        with self._cond:
+            if self._pending_rows + n > self.max_pending_rows:
+                self.rows_dropped += n
+                return
+            self._pending.append((now, results))
+            self._pending_rows += n
+            if self._pending_rows >= self.flush_rows:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._running and self._pending_rows < self.flush_rows:
+                    self._cond.wait(timeout=self.flush_interval_s)
+                batches = list(self._pending)
+                self._pending.clear()
+                self._pending_rows = 0
+                running = self._running
+
+            if batches:
+                try:
+                    self._write(batches)
+                except Exception as exc:
+                    self.write_errors += 1
+                    print(f"[History] write failed: {exc}")
+            if not running:
+                break
+
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _write(self, batches: List[Tuple[float, List[Result]]]) -> None:
+        """Write queued batches, each into the segment for its arrival."""
+        group: List[Tuple[float, List[Result]]] = []
+        for batch in batches:
+            if group and self._partition(batch[0]) != self._partition(
+                group[-1][0]
+            ):
+                self._write_group(group)
+                group = []
+            group.append(batch)
+        if group:
+            self._write_group(group)
+
+    def _write_group(self, batches: List[Tuple[float, List[Result]]]) -> None:
+        now = batches[-1][0]
+        flows: List[Dict[str, Any]] = []
+        scores: List[float] = []
+        flags: List[bool] = []
+        arrival: List[float] = []
+        for received, results in batches:
+            for flow, score, is_suspicious in results:
+                flows.append(flow)
+                scores.append(score)
+                flags.append(is_suspicious)
+                arrival.append(received)
+        if not flows:
+            return
+
+        ts = np.fromiter(
+            (f.get("timestamp") or t for f, t in zip(flows, arrival)),
+            dtype=np.float64,
+            count=len(flows),
+        )
+
+        segment = self._segment_for(now)
+        while len(flows) > self.max_segment_rows - segment.rows:
+            room = self.max_segment_rows - segment.rows
+            if room:
+                segment.append(
+                    ts[:room], flows[:room], scores[:room], flags[:room]
+                )
+            segment = self._roll(segment.partition)
+            ts, flows = ts[room:], flows[room:]
+            scores, flags = scores[room:], flags[room:]
+        if flows:
+            segment.append(ts, flows, scores, flags)
+
+        self.rows_written += len(arrival)
+        self.batches_written += 1
+
+    def _partition(self, now: float) -> int:
+        return int(now // self.segment_s * self.segment_s)
+
+    def _segment_for(self, now: float) -> _SegmentWriter:
+        partition = self._partition(now)
+        segment = self._segment
+        if (
+            segment is None
+            or segment.partition != partition
+            or segment.rows >= self.max_segment_rows
+        ):
+            segment = self._roll(partition)
+            self._expire(now)
+        return segment
+
+    def _roll(self, partition: int) -> _SegmentWriter:
+        if self._segment is not None:
+            self._segment.close()
+
+        n = 0
+        while os.path.exists(
+            os.path.join(self.root, _segment_name(partition, n))
+        ):
+            n += 1
+        self._segment = _SegmentWriter(
+            os.path.join(self.root, _segment_name(partition, n)),
+            partition,
+            self.feature_cols,
+        )
+        self.segments_created += 1
+        return self._segment
+
+    def _expire(self, now: float) -> None:
+        if self.retention_s is None:
+            return
+        cutoff = now - self.retention_s
+        for name in self._segment_names():
+            path = os.path.join(self.root, name)
+            if self._segment is not None and path == self._segment.path:
+                continue
+            index = self._load_index(path)
+            if index is None or (
+                index["ts_max"] is not None and index["ts_max"] >= cutoff
+            ):
+                continue
+            # New queries stop listing the segment once it is renamed;
+            # one already reading it gets OSError and skips it.
+            trash = os.path.join(self.root, _TRASH_PREFIX + name)
+            try:
+                os.rename(path, trash)
+            except OSError:
+                continue
+            self._readers.pop(path, None)
+            self.segments_deleted += 1
+
+        # Includes segments left renamed by a crash before rmtree.
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(_TRASH_PREFIX):
+                shutil.rmtree(
+                    os.path.join(self.root, name), ignore_errors=True
+                )
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def _segment_names(self) -> List[str]:
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return []
+        return sorted(n for n in names if n.startswith("seg-"))
+
+    @staticmethod
+    def _load_index(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(path, _INDEX)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _reader(self, path: str) -> Optional[_SegmentReader]:
+        reader = self._readers.get(path)
+        if reader is not None:
+            return reader
+        index = self._load_index(path)
+        if index is None:
+            return None
+        reader = _SegmentReader(path, index)
+        if index.get("closed"):
+            self._readers[path] = reader
+        return reader
+
+    def query(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        src_ip: Optional[str] = None,
+        min_score: Optional[float] = None,
+        label: Optional[str] = None,
+        limit: int = 100,
+    ) -> Dict[str, Any]:
+        """
+        Matching flows, newest segment first and newest first within a
+        segment, plus how many segments the index let us skip.
+        """
+        names = self._segment_names()
+        rows: List[Dict[str, Any]] = []
+        scanned = skipped = 0
+
+        for name in reversed(names):
+            if len(rows) >= limit:
+                break
+            path = os.path.join(self.root, name)
+            try:
+                reader = self._reader(path)
+                if reader is None or not reader.can_match(
+                    start, end, src_ip, min_score, label
+                ):
+                    skipped += 1
+                    continue
+
+                scanned += 1
+                mask = self._match(
+                    reader, start, end, src_ip, min_score, label
+                )
+                if mask is None:
+                    continue
+                hits = np.flatnonzero(mask)
+                if not len(hits):
+                    continue
+
+                ts = reader.column("ts")
+                hits = hits[np.argsort(ts[hits], kind="stable")[::-1]]
+                rows.extend(self._rows(reader, hits[:limit - len(rows)]))
+            except (OSError, ValueError):
+                # Expired (deleted) while we were reading it, or a side
+                # file we could not parse.
+                self._readers.pop(path, None)
+                skipped += 1
+
+        return {
+            "rows": rows,
+            "count": len(rows),
+            "truncated": len(rows) >= limit,
+            "segments_total": len(names),
+            "segments_scanned": scanned,
+            "segments_skipped": skipped,
+        }
+
+    def iter_features(
+        self,
+        feature_cols: Tuple[str, ...],
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        exclude_suspicious: bool = False,
+        chunk_rows: int = 1_000_000,
+    ) -> Iterator[np.ndarray]:
+        """
+        Feature matrices (float32, one column per feature_cols entry) of
+        the stored flows, oldest segment first, at most chunk_rows rows
+        each. Rows with a missing feature are left out.
+        """
+        for name in self._segment_names():
+            path = os.path.join(self.root, name)
+            try:
+                reader = self._reader(path)
+                if reader is None or not reader.can_match(
+                    start, end, None, None, None
+                ):
+                    continue
+                missing = set(feature_cols) - set(reader.index["columns"])
+                if missing:
+                    raise KeyError(
+                        f"{name} has no column(s) {sorted(missing)}"
+                    )
+
+                # Open mappings stay readable if the segment is deleted.
+                columns = [reader.column(c) for c in feature_cols]
+                ts = reader.column("ts")
+                flags = reader.column("suspicious")
+            except OSError:
+                self._readers.pop(path, None)
+                continue
+            for lo in range(0, reader.rows, chunk_rows):
+                hi = min(lo + chunk_rows, reader.rows)
+                X = np.empty((hi - lo, len(columns)), dtype=np.float32)
+                for j, col in enumerate(columns):
+                    X[:, j] = col[lo:hi]
+
+                keep = ~np.isnan(X).any(axis=1)
+                if start is not None:
+                    keep &= ts[lo:hi] >= start
+                if end is not None:
+                    keep &= ts[lo:hi] <= end
+                if exclude_suspicious:
+                    keep &= flags[lo:hi] == 0
+                if not keep.all():
+                    X = X[keep]
+                if len(X):
+                    yield X
+
+    @staticmethod
+    def _match(
+        reader: _SegmentReader,
+        start: Optional[float],
+        end: Optional[float],
+        src_ip: Optional[str],
+        min_score: Optional[float],
+        label: Optional[str],
+    ) -> Optional[np.ndarray]:
+        mask = np.ones(reader.rows, dtype=bool)
+        if start is not None or end is not None:
+            ts = reader.column("ts")
+            if start is not None:
+                mask &= ts >= start
+            if end is not None:
+                mask &= ts <= end
+        if min_score is not None:
+            mask &= reader.column("score") >= min_score
+        for name, value in (("src_ip", src_ip), ("threat_label", label)):
+            if value is None:
+                continue
+            code = reader.code(name, value)
+            if code < 0:
+                return None
+            mask &= reader.column(name) == code
+        return mask
+
+    def _rows(
+        self,
+        reader: _SegmentReader,
+        hits: np.ndarray,
+    ) -> List[Dict[str, Any]]:
+        numeric = {}
+        for name, dtype in reader.index["columns"].items():
+            values = reader.column(name)[hits]
+            if dtype == "<f4":
+                # Shortest repr of the stored float32, not its float64
+                # expansion (0.8, not 0.800000011920929).
+                numeric[name] = [float(str(v)) for v in values]
+            else:
+                numeric[name] = values.tolist()
+        strings = {}
+        for name in reader.index["strings"]:
+            values = reader.values(name)
+            strings[name] = [
+                values[c] if c >= 0 else None
+                for c in reader.column(name)[hits].tolist()
+            ]
+
+        features = [
+            name for name in reader.index["columns"]
+            if name not in dict(_BASE_COLUMNS)
+        ]
+        out = []
+        for i in range(len(hits)):
+            flow: Dict[str, Any] = {
+                name: numeric[name][i] for name in features
+            }
+            for name in strings:
+                if strings[name][i] is not None:
+                    flow[name] = strings[name][i]
+            conf = numeric["threat_confidence"][i]
+            if conf == conf:  # not NaN
+                flow["threat_confidence"] = conf
+            out.append(
+                {
+                    "ts": numeric["ts"][i],
+                    "score": numeric["score"][i],
+                    "is_suspicious": bool(numeric["suspicious"][i]),
+                    "flow": flow,
+                }
+            )
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = self._pending_rows
+        return {
+            "pending_rows": pending,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "batches_written": self.batches_written,
+            "write_errors": self.write_errors,
+            "segments_created": self.segments_created,
+            "segments_deleted": self.segments_deleted,
+        }
@@ -1,17 +1,38 @@
 import asyncio
-import json
+import time
 from collections import deque
-from typing import Any, Deque, Dict, List
-
-from fastapi import FastAPI, Form, Request
-from fastapi.responses import HTMLResponse, StreamingResponse
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Form, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-
-from anomaly_scorer import AnomalyScorer
-from schemas import IngestEvent
-from threat_classifier import ThreatClassifier
+from pydantic import BaseModel, FiniteFloat
+
+from anomaly_scorer import AnomalyScorer, MissingFeaturesError
+from columnar import (
+    ColumnarError,
+    align_columns,
+    decode_matrix,
+    encode_scores,
+    parse_columns_header,
+)
+from history_store import HistoryStore
+from live_feed import LiveFeed
+from micro_batcher import MicroBatcher
+from result_sink import ResultSink
+from scoring_pool import ScoringPool
+from schemas import IngestBatch, IngestEvent
+from threat_classifier import ThreatClassifier, ThreatVerdict
+from threat_shards import ShardedThreatClassifier
+from traffic_series import TrafficSeries
 
 app = FastAPI(title="AegisNet Anomaly Scoring API")
 
@@ -19,40 +40,209 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
 scorer: AnomalyScorer | None = None
-
-threats = ThreatClassifier(window_s=30)
+scoring: ScoringPool | None = None
+batcher: MicroBatcher | None = None
+
+# A training checkpoint, or a TorchScript artifact (optionally int8)
+# from `python model_export.py`
+SCORER_MODEL_PATH = "autoencoder.pt"
+
+# "torch" or "numpy" (see AnomalyScorer; numpy needs a checkpoint)
+SCORER_BACKEND = "torch"
+
+# Every scorer call runs on a fixed pool of SCORING_WORKERS threads, each
+# limited to SCORING_TORCH_THREADS torch threads (0 = auto: one worker
+# per core, cores split evenly between workers). Compare settings with
+# `python bench_scoring_pool.py`.
+SCORING_WORKERS = 0
+SCORING_TORCH_THREADS = 0
+
+# Micro-batching window for /score and /ingest
+BATCH_MAX_FLOWS = 512
+BATCH_MAX_WAIT_S = 0.002
+
+# Threat correlation state: sources idle past the window are evicted and
+# at most THREAT_MAX_SOURCES are tracked. THREAT_APPROXIMATE swaps exact
+# per-source windows for fixed-size sketches.
+THREAT_MAX_SOURCES = 100_000
+THREAT_APPROXIMATE = False
+
+#
+# To spread correlation over several cores, set THREAT_SHARDS to spawn
+# that many shard processes, or list THREAT_SHARD_ADDRESSES of shard
+# servers started with `python threat_shards.py` (required when running
+# uvicorn with more than one worker). Remote shards need the shared
+# secret in the AEGISNET_THREAT_AUTHKEY environment variable.
+THREAT_SHARDS = 0
+THREAT_SHARD_ADDRESSES: List[Tuple[str, int]] = []
+
+threats: ThreatClassifier | ShardedThreatClassifier = ThreatClassifier(
+    window_s=30,
+    max_sources=THREAT_MAX_SOURCES,
+    approximate=THREAT_APPROXIMATE,
+)
 
 MAX_RECENT = 64
 recent_results: Deque[Dict[str, Any]] = deque(maxlen=MAX_RECENT)
 
 # ---- Live feed streaming (SSE) ----
-_subscribers: set[asyncio.Queue] = set()
+# Results are coalesced into one frame per LIVE_FRAME_INTERVAL_S holding
+# at most MAX_RECENT of them; clients more than LIVE_MAX_FRAMES behind
+# get a "skipped" event instead of being disconnected.
+LIVE_FRAME_INTERVAL_S = 0.25
+LIVE_MAX_FRAMES = 40
+
+live_feed = LiveFeed(
+    interval_s=LIVE_FRAME_INTERVAL_S,
+    max_items=MAX_RECENT,
+    max_frames=LIVE_MAX_FRAMES,
+)
+
+# Per-second aggregates (flows/s, suspicious/s, score percentiles, top
+# sources) for the last SERIES_SECONDS, served by /series and streamed
+# once a second by /live/series.
+SERIES_SECONDS = 300
+SERIES_TOP_SOURCES = 5
+
+traffic_series = TrafficSeries(
+    seconds=SERIES_SECONDS,
+    top_k=SERIES_TOP_SOURCES,
+)
+series_feed = LiveFeed(
+    interval_s=1.0,
+    max_items=SERIES_SECONDS,
+    max_frames=LIVE_MAX_FRAMES,
+    event="series",
+)
+
+# Every scored flow is appended to an on-disk columnar history (one
+# segment per HISTORY_SEGMENT_S), queried through /history. Set
+# HISTORY_DIR to None to disable; HISTORY_RETENTION_S=None keeps all.
+HISTORY_DIR: Optional[str] = "history"
+HISTORY_SEGMENT_S = 3_600
+HISTORY_RETENTION_S: Optional[float] = 7 * 86_400
+HISTORY_QUERY_LIMIT = 1_000
+
+history: HistoryStore | None = None
+if HISTORY_DIR is not None:
+    history = HistoryStore(
+        HISTORY_DIR,
+        segment_s=HISTORY_SEGMENT_S,
+        retention_s=HISTORY_RETENTION_S,
+    )
+
+# Request threads hand results to the sink; a task on the event loop
+# records them in recent_results, traffic_series, the live feeds and
+# the history store.
+RESULT_DRAIN_INTERVAL_S = 0.05
+result_sink = ResultSink(
+    recent_results,
+    live_feed,
+    interval_s=RESULT_DRAIN_INTERVAL_S,
+    series=traffic_series,
+    series_feed=series_feed,
+    history=history,
+)
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(
+    request: Request,
+    exc: RequestValidationError,
+) -> JSONResponse:
+    # The default handler echoes each rejected input back, and a NaN/inf
+    # one cannot be encoded as JSON, turning the 422 into a 500.
+    errors = [
+        {k: v for k, v in err.items() if k != "input"}
+        for err in exc.errors()
+    ]
+    return JSONResponse(
+        status_code=422,
+        content={"detail": jsonable_encoder(errors)},
+    )
 
 
 class FlowFeatures(BaseModel):
-    features: Dict[str, float]
+    features: Dict[str, FiniteFloat]
 
 
 class FlowBatch(BaseModel):
-    flows: List[Dict[str, float]]
+    flows: List[Dict[str, FiniteFloat]]
+
+
+@app.on_event("startup")
+def start_threat_shards() -> None:
+    global threats
+    if THREAT_SHARDS > 0 or THREAT_SHARD_ADDRESSES:
+        threats = ShardedThreatClassifier(
+            n_shards=THREAT_SHARDS,
+            addresses=THREAT_SHARD_ADDRESSES,
+            window_s=30,
+            max_sources=THREAT_MAX_SOURCES,
+            approximate=THREAT_APPROXIMATE,
+        )
+        print(f"[OK] Threat shards: {threats.n_shards}")
+
+
+@app.on_event("shutdown")
+def stop_threat_shards() -> None:
+    if isinstance(threats, ShardedThreatClassifier):
+        threats.close()
+
+
+@app.on_event("startup")
+async def start_live_feed() -> None:
+    if history is not None:
+        history.start()
+    live_feed.start()
+    series_feed.start()
+    result_sink.start()
+
+
+@app.on_event("shutdown")
+async def stop_live_feed() -> None:
+    await result_sink.stop()
+    await live_feed.stop()
+    await series_feed.stop()
+    if history is not None:
+        history.stop()
 
 
 @app.on_event("startup")
 def load_model() -> None:
-    global scorer
-    scorer = AnomalyScorer("autoencoder.pt")
+    global scorer, scoring, batcher
+    scorer = AnomalyScorer(SCORER_MODEL_PATH, backend=SCORER_BACKEND)
     print("[OK] Model loaded")
 
+    scoring = ScoringPool(
+        scorer,
+        workers=SCORING_WORKERS,
+        torch_threads=SCORING_TORCH_THREADS,
+    )
+    batcher = MicroBatcher(
+        scoring,
+        max_batch=BATCH_MAX_FLOWS,
+        max_wait_s=BATCH_MAX_WAIT_S,
+    )
+    batcher.start()
+
 
-def _publish(event: Dict[str, Any]) -> None:
-    for q in list(_subscribers):
-        try:
-            q.put_nowait(event)
-        except Exception:
-            try:
-                _subscribers.remove(q)
-            except KeyError:
-                pass
+@app.on_event("shutdown")
+def stop_batcher() -> None:
+    if batcher is not None:
+        batcher.stop()
+    if scoring is not None:
+        scoring.close()
+
+
+def _score_one(features: Dict[str, float]) -> float:
+    assert scoring is not None
+    try:
+        if batcher is not None:
+            return batcher.score(features)
+        return scoring.score(features)
+    except MissingFeaturesError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
 
 
 def _log_result(
@@ -60,14 +250,13 @@ def _log_result(
     score: float,
     is_suspicious: bool,
 ) -> None:
-    item: Dict[str, Any] = {
-        "flow": flow,
-        "score": score,
-        "is_suspicious": is_suspicious,
-    }
+    _log_results([(flow, score, is_suspicious)])
+
 
-    recent_results.appendleft(item)
-    _publish(item)
+def _log_results(results: List[Tuple[Dict[str, Any], float, bool]]) -> None:
+    """Hand results to the sink; never blocks on the live feed."""
+    if results:
+        result_sink.push(results)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -82,7 +271,6 @@ def dashboard(request: Request) -> HTMLResponse:
     context = {
         "request": request,
         "model_device": device,
-        "results": list(recent_results),
         "last_score": last["score"] if last else None,
         "last_is_suspicious": last["is_suspicious"] if last else None,
         "last_flow": last["flow"] if last else None,
@@ -90,24 +278,73 @@ def dashboard(request: Request) -> HTMLResponse:
     return templates.TemplateResponse("dashboard.html", context)
 
 
+def _worker_metrics() -> Dict[str, Any]:
+    # Lock-protected stats; threat shards answer over a socket.
+    return {
+        "scoring": scoring.stats() if scoring is not None else None,
+        "batcher": batcher.stats() if batcher is not None else None,
+        "threats": threats.stats(),
+        "history": history.stats() if history is not None else None,
+    }
+
+
+@app.get("/metrics")
+async def metrics() -> Dict[str, Any]:
+    stats = await asyncio.to_thread(_worker_metrics)
+    # The feeds and result sink are owned by the event loop, so they are
+    # read here rather than from a threadpool thread.
+    stats["results"] = result_sink.stats()
+    stats["live"] = live_feed.stats()
+    stats["live_series"] = series_feed.stats()
+    return stats
+
+
+@app.get("/history")
+def history_query(
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    src_ip: Optional[str] = None,
+    min_score: Optional[float] = None,
+    label: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=HISTORY_QUERY_LIMIT),
+) -> Dict[str, Any]:
+    """
+    Scored flows from the on-disk history, newest first. start/end are
+    epoch seconds; label matches the threat label exactly.
+    """
+    if history is None:
+        raise HTTPException(status_code=404, detail="History is disabled")
+    return history.query(
+        start=start,
+        end=end,
+        src_ip=src_ip,
+        min_score=min_score,
+        label=label,
+        limit=limit,
+    )
+
+
+@app.get("/series")
+async def series(seconds: int = SERIES_SECONDS) -> Dict[str, Any]:
+    """Per-second aggregates for the last `seconds`, as columns."""
+    # async: TrafficSeries is not thread-safe and lives on the loop.
+    return traffic_series.window(seconds)
+
+
 @app.get("/live")
 async def live() -> StreamingResponse:
-    q: asyncio.Queue = asyncio.Queue(maxsize=256)
-    _subscribers.add(q)
-
-    async def gen():
-        try:
-            yield "event: hello\ndata: {}\n\n"
-            snapshot = list(recent_results)
-            yield f"event: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+    return StreamingResponse(
+        live_feed.stream(list(recent_results)),
+        media_type="text/event-stream",
+    )
 
-            while True:
-                item = await q.get()
-                yield f"event: update\ndata: {json.dumps(item)}\n\n"
-        finally:
-            _subscribers.discard(q)
 
-    return StreamingResponse(gen(), media_type="text/event-stream")
+@app.get("/live/series")
+async def live_series() -> StreamingResponse:
+    return StreamingResponse(
+        series_feed.stream(traffic_series.window()),
+        media_type="text/event-stream",
+    )
 
 
 @app.post("/ui/score", response_class=HTMLResponse)
@@ -122,6 +359,7 @@ async def ui_score(
     protocol: float = Form(...),
 ) -> HTMLResponse:
     assert scorer is not None
+    assert scoring is not None
 
     flow = {
         "bytes_in": float(bytes_in),
@@ -133,7 +371,7 @@ async def ui_score(
         "protocol": float(protocol),
     }
 
-    score = scorer.score(flow)
+    score = await asyncio.wrap_future(scoring.submit(scorer.score, flow))
     is_suspicious = score > 0.05
 
     _log_result(flow, score, is_suspicious)
@@ -142,7 +380,6 @@ async def ui_score(
     context = {
         "request": request,
         "model_device": device,
-        "results": list(recent_results),
         "last_score": score,
         "last_is_suspicious": is_suspicious,
         "last_flow": flow,
@@ -154,7 +391,7 @@ async def ui_score(
 def score_flow(flow: FlowFeatures):
     assert scorer is not None
 
-    score = scorer.score(flow.features)
+    score = _score_one(flow.features)
     is_suspicious = score > 0.05
     _log_result(flow.features, score, is_suspicious)
 
@@ -167,11 +404,23 @@ def score_flow(flow: FlowFeatures):
 @app.post("/score_bulk")
 def score_flows(batch: FlowBatch):
     assert scorer is not None
+    assert scoring is not None
 
-    scores = scorer.score_batch(batch.flows)
+    scores, row_errors = scoring.score_batch_partial(batch.flows)
     results = []
 
     for idx, (flow, score) in enumerate(zip(batch.flows, scores)):
+        if score is None:
+            results.append(
+                {
+                    "index": idx,
+                    "anomaly_score": None,
+                    "is_suspicious": None,
+                    "error": f"missing feature columns: {row_errors[idx]}",
+                }
+            )
+            continue
+
         is_suspicious = score > 0.05
         _log_result(flow, score, is_suspicious)
         results.append(
@@ -185,19 +434,47 @@ def score_flows(batch: FlowBatch):
     return {"results": results}
 
 
-@app.post("/ingest")
-def ingest(event: IngestEvent):
-    assert scorer is not None
+@app.post("/score_columnar")
+async def score_columnar(request: Request) -> Response:
+    """
+    Score a packed float32 feature matrix without JSON.
 
-    score = scorer.score(event.features)
-    is_suspicious = score > 0.05
-
-    verdict = threats.update(
-        meta=event.meta.model_dump(),
-        features=event.features,
-        anomaly_score=score,
+    Accepts Arrow IPC, .npy or raw little-endian float32 bodies; raw and
+    .npy need an X-Feature-Columns header naming the columns. Scores come
+    back as a packed float32 array in the request's format. Results are
+    not written to the live feed.
+    """
+    assert scorer is not None
+    assert scoring is not None
+
+    body = await request.body()
+    content_type = request.headers.get("content-type")
+    columns = parse_columns_header(request.headers.get("x-feature-columns"))
+
+    try:
+        X, columns = decode_matrix(body, content_type, columns)
+        X = align_columns(X, columns, scorer.feature_cols)
+    except ColumnarError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    scores = await asyncio.wrap_future(scoring.submit(scorer.score_matrix, X))
+    payload, media_type = encode_scores(scores, content_type or "")
+
+    return Response(
+        content=payload,
+        media_type=media_type,
+        headers={
+            "X-Row-Count": str(len(scores)),
+            "X-Suspicious-Count": str(int((scores > 0.05).sum())),
+        },
     )
 
+
+def _ingest_payload(
+    score: float,
+    is_suspicious: bool,
+    verdict: Optional[ThreatVerdict],
+) -> Dict[str, Any]:
     payload: Dict[str, Any] = {
         "anomaly_score": score,
         "is_suspicious": is_suspicious,
@@ -210,9 +487,19 @@ def ingest(event: IngestEvent):
             "confidence": verdict.confidence,
             "reason": verdict.reason,
         }
+    return payload
 
+
+def _ingest_log_item(
+    event: IngestEvent,
+    verdict: Optional[ThreatVerdict],
+) -> Dict[str, Any]:
     log_item: Dict[str, Any] = dict(event.features)
 
+    if event.meta.agent_id:
+        log_item["agent_id"] = event.meta.agent_id
+    if event.meta.timestamp:
+        log_item["timestamp"] = event.meta.timestamp
     if event.meta.src_ip:
         log_item["src_ip"] = event.meta.src_ip
     if event.meta.dst_ip:
@@ -225,5 +512,70 @@ def ingest(event: IngestEvent):
         log_item["threat_confidence"] = verdict.confidence
         log_item["threat_reason"] = verdict.reason
 
-    _log_result(log_item, score, is_suspicious)
-    return payload
+    return log_item
+
+
+@app.post("/ingest")
+def ingest(event: IngestEvent):
+    assert scorer is not None
+
+    score = _score_one(event.features)
+    is_suspicious = score > 0.05
+
+    verdict = threats.update(
+        meta=event.meta.model_dump(),
+        features=event.features,
+        anomaly_score=score,
+    )
+
+    _log_result(_ingest_log_item(event, verdict), score, is_suspicious)
+    return _ingest_payload(score, is_suspicious, verdict)
+
+
+@app.post("/ingest_batch")
+def ingest_batch(batch: IngestBatch):
+    """
+    Ingest many events at once: one score_batch pass, threat correlation
+    in timestamp order, and a single publish to the live feed. Results
+    come back in request order; events missing features get an error.
+    """
+    assert scorer is not None
+    assert scoring is not None
+
+    events = batch.events
+    scores, row_errors = scoring.score_batch_partial(
+        [e.features for e in events]
+    )
+
+    now = time.time()
+    metas: List[Dict[str, Any]] = []
+    for e in events:
+        meta = e.meta.model_dump()
+        if not meta.get("timestamp"):
+            meta["timestamp"] = now
+        metas.append(meta)
+
+    order = sorted(
+        (i for i, score in enumerate(scores) if score is not None),
+        key=lambda i: metas[i]["timestamp"],
+    )
+    verdicts = threats.update_many(
+        [(metas[i], events[i].features, scores[i]) for i in order]
+    )
+
+    results: List[Dict[str, Any]] = [
+        {"error": f"missing feature columns: {row_errors.get(i)}"}
+        for i in range(len(events))
+    ]
+    logged: List[Tuple[Dict[str, Any], float, bool]] = []
+
+    for i, verdict in zip(order, verdicts):
+        score = scores[i]
+        is_suspicious = score > 0.05
+        results[i] = _ingest_payload(score, is_suspicious, verdict)
+        logged.append(
+            (_ingest_log_item(events[i], verdict), score, is_suspicious)
+        )
+
+    _log_results(logged)
+    return {"results": results}
@@ -0,0 +1,212 @@
+"""
+Coalescing broadcast hub for the /live SSE feed.
+
+Scored results are published on the event loop into a small pending
+buffer. Every interval_s a task on the same loop turns whatever
+arrived into one SSE frame, serialized once and shared by every
+subscriber. Only the newest max_items results of an interval make it
+into the frame (the dashboard shows no more than that anyway).
+
+Frames are kept in a short ring. A subscriber that falls further behind
+than the ring reaches is sent a "skipped" event saying how many frames
+and results it missed, and carries on from the oldest frame still held
+instead of being disconnected.
+
+Frames holding a single result are sent as "update" events, others as
+"batch"; a feed created with `event` always sends that event with a
+JSON list (the per-second series channel uses this).
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+
+class _Frame(NamedTuple):
+    seq: int
+    data: bytes
+    events: int
+    total: int  # events published in frames up to and including this one
+    ts: float
+
+
+class _Subscriber:
+    __slots__ = ("next_seq", "events_seen", "skipped_frames")
+
+    def __init__(self, next_seq: int, events_seen: int) -> None:
+        self.next_seq = next_seq
+        self.events_seen = events_seen
+        self.skipped_frames = 0
+
+
+def _sse(event: str, data: str) -> bytes:
+    return f"event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+class LiveFeed:
+    """Timed, serialize-once fan-out of scored results to SSE clients."""
+
+    def __init__(
+        self,
+        interval_s: float = 0.25,
+        max_items: int = 64,
+        max_frames: int = 40,
+        event: Optional[str] = None,
+    ) -> None:
+        self.interval_s = interval_s
+        self.max_items = max_items
+        self.event = event
+
+        self._pending: Deque[Dict[str, Any]] = deque(maxlen=max_items)
+        self._pending_count = 0
+
+        self._frames: Deque[_Frame] = deque(maxlen=max_frames)
+        self._seq = 0
+        self._total = 0
+        self._tick = asyncio.Event()
+        self._subscribers: set[_Subscriber] = set()
+        self._task: asyncio.Task | None = None
+
+        self.frames_total = 0
+        self.events_total = 0
+        self.events_coalesced = 0
+        self.skipped_frames_total = 0
+        self.skipped_events_total = 0
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+    def publish(
+        self,
+        items: List[Dict[str, Any]],
+        count: Optional[int] = None,
+    ) -> None:
+        """
+        Queue results for the next frame (call on the event loop).
+        `count` is how many results `items` stands for when the caller
+        already dropped older ones (default: len(items)).
+        """
+        if not self._subscribers:
+            return
+        self._pending.extend(items)
+        self._pending_count += len(items) if count is None else count
+
+    def start(self) -> None:
+        """Start the frame task on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            self._emit()
+
+    def _emit(self) -> None:
+        if not self._pending_count:
+            return
+        items = list(self._pending)
+        count = self._pending_count
+        self._pending.clear()
+        self._pending_count = 0
+
+        if self.event is not None:
+            data = _sse(self.event, json.dumps(items))
+        elif len(items) == 1:
+            data = _sse("update", json.dumps(items[0]))
+        else:
+            data = _sse("batch", json.dumps(items))
+
+        self._seq += 1
+        self._total += count
+        self._frames.append(
+            _Frame(self._seq, data, count, self._total, time.time())
+        )
+        self.frames_total += 1
+        self.events_total += count
+        self.events_coalesced += count - len(items)
+
+        # Wake every waiting subscriber; later waits use a fresh event.
+        tick, self._tick = self._tick, asyncio.Event()
+        tick.set()
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+    async def stream(self, snapshot: List[Dict[str, Any]]) -> AsyncIterator:
+        """SSE byte chunks for one client: hello, snapshot, then frames."""
+        sub = _Subscriber(self._seq + 1, self._total)
+        self._subscribers.add(sub)
+        try:
+            yield _sse("hello", "{}")
+            yield _sse("snapshot", json.dumps(snapshot))
+
+            while True:
+                if sub.next_seq > self._seq:
+                    await self._tick.wait()
+                    continue
+
+                oldest = self._frames[0]
+                if sub.next_seq < oldest.seq:
+                    frames = oldest.seq - sub.next_seq
+                    events = oldest.total - oldest.events - sub.events_seen
+                    sub.next_seq = oldest.seq
+                    sub.events_seen = oldest.total - oldest.events
+                    sub.skipped_frames += frames
+                    self.skipped_frames_total += frames
+                    self.skipped_events_total += events
+                    yield _sse(
+                        "skipped",
+                        json.dumps({"frames": frames, "events": events}),
+                    )
+                    continue
+
+                frame = self._frames[sub.next_seq - oldest.seq]
+                sub.next_seq += 1
+                sub.events_seen = frame.total
+                yield frame.data
+        finally:
+            self._subscribers.discard(sub)
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        lag_frames = 0
+        lag_s = 0.0
+        oldest = self._frames[0].seq if self._frames else self._seq + 1
+        for sub in self._subscribers:
+            behind = self._seq - sub.next_seq + 1
+            lag_frames = max(lag_frames, behind)
+            if behind > 0:
+                idx = max(sub.next_seq, oldest) - oldest
+                lag_s = max(lag_s, now - self._frames[idx].ts)
+
+        return {
+            "subscribers": len(self._subscribers),
+            "frames_total": self.frames_total,
+            "events_total": self.events_total,
+            "events_coalesced": self.events_coalesced,
+            "skipped_frames_total": self.skipped_frames_total,
+            "skipped_events_total": self.skipped_events_total,
+            "max_lag_frames": lag_frames,
+            "max_lag_s": round(lag_s, 3),
+        }
@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from anomaly_scorer import AnomalyScorer, MissingFeaturesError
+
+
+PendingItem = Tuple[Dict[str, float], float, Future]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return float(ordered[idx])
+
+
+class MicroBatcher:
+    """
+    Coalesces single-flow scoring requests into batched forward passes.
+
+    Callers submit one flow at a time from any thread. A background worker
+    waits at most `max_wait_s` after the oldest queued flow (or until
+    `max_batch` flows are queued), runs them through
+    `AnomalyScorer.score_batch` and resolves each caller's future.
+    """
+
+    def __init__(
+        self,
+        scorer: AnomalyScorer,
+        max_batch: int = 512,
+        max_wait_s: float = 0.002,
+        stats_window: int = 1024,
+    ) -> None:
+        self.scorer = scorer
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_s = max(0.0, float(max_wait_s))
+
+        self._pending: Deque[PendingItem] = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Metrics (recent windows + lifetime counters)
+        self._batch_sizes: Deque[int] = deque(maxlen=stats_window)
+        self._waits_s: Deque[float] = deque(maxlen=stats_window)
+        self._max_queue_depth = 0
+        self.batches_total = 0
+        self.flows_total = 0
+        self.errors_total = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="aegisnet-micro-batcher",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """Stop the worker after draining anything already queued."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def submit(self, flow: Dict[str, float]) -> Future:
+        """Queue a flow for scoring and return a future for its score."""
+        fut: Future = Future()
+
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("MicroBatcher is not running")
+
+            self._pending.append((flow, time.perf_counter(), fut))
+            depth = len(self._pending)
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+
+            # Wake the worker for the first item (starts the window) and
+            # when a full batch is ready; other arrivals just ride along.
+            if depth == 1 or depth >= self.max_batch:
+                self._cond.notify()
+
+        return fut
+
+    def score(
+        self,
+        flow: Dict[str, float],
+        timeout: Optional[float] = None,
+    ) -> float:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(flow).result(timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = list(self._batch_sizes)
+        waits = list(self._waits_s)
+
+        return {
+            "queue_depth": len(self._pending),
+            "max_queue_depth": self._max_queue_depth,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_s * 1000.0,
+            "batches_total": self.batches_total,
+            "flows_total": self.flows_total,
+            "errors_total": self.errors_total,
+            "batch_size_mean": (sum(sizes) / len(sizes)) if sizes else 0.0,
+            "batch_size_p50": _percentile(sizes, 0.50),
+            "batch_size_max": max(sizes) if sizes else 0,
+            "wait_ms_p50": _percentile(waits, 0.50) * 1000.0,
+            "wait_ms_p99": _percentile(waits, 0.99) * 1000.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+    def _collect(self) -> List[PendingItem]:
+        with self._cond:
+            while self._running and not self._pending:
+                self._cond.wait()
+
+            if not self._pending:
+                return []
+
+            deadline = self._pending[0][1] + self.max_wait_s
+            while self._running and len(self._pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            n = min(len(self._pending), self.max_batch)
+            return [self._pending.popleft() for _ in range(n)]
+
+    def _dispatch(self, batch: List[PendingItem]) -> None:
+        started = time.perf_counter()
+        flows = [flow for flow, _, _ in batch]
+        failure: Optional[Exception] = None
+
+        try:
+            # Partial scoring: a malformed flow only fails its own caller.
+            scores, row_errors = self.scorer.score_batch_partial(flows)
+        except Exception as exc:
+            scores, row_errors = None, {}
+            failure = exc
+
+        for i, (_, enqueued, fut) in enumerate(batch):
+            self._waits_s.append(started - enqueued)
+            if scores is None:
+                self.errors_total += 1
+                fut.set_exception(failure)
+            elif i in row_errors:
+                self.errors_total += 1
+                fut.set_exception(MissingFeaturesError({0: row_errors[i]}))
+            else:
+                fut.set_result(scores[i])
+
+        self._batch_sizes.append(len(batch))
+        self.batches_total += 1
+        self.flows_total += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                if not self._running:
+                    return
+                continue
+            self._dispatch(batch)
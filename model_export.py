@@ -0,0 +1,135 @@
+"""
+Export a training checkpoint as a self-contained TorchScript artifact.
+
+The artifact holds a frozen ScoringModule (normalization + autoencoder
++ per-row MSE, so forward() maps raw feature rows straight to anomaly
+scores) and, as an extra file, the metadata AnomalyScorer needs:
+feature_cols, mean, std, input_dim and whether it is quantized. Loading
+it needs neither the pickled checkpoint (torch.load with
+weights_only=False) nor the Autoencoder class.
+
+With --quantize the Linear layers are dynamically quantized to int8
+(weights stored as int8, activations quantized per batch).
+
+    python model_export.py autoencoder.pt autoencoder.ts
+    python model_export.py autoencoder.pt autoencoder-int8.ts --quantize
+
+AnomalyScorer loads either kind of file in place of the checkpoint;
+bench_model_export.py compares them.
+"""
+import argparse
+import json
+import warnings
+from typing import Any, Dict
+
+import numpy as np
+import torch
+from torch import nn
+
+from aegisnet.models.autoencoder import Autoencoder
+from anomaly_scorer import META_FILE, NORM_EPS
+
+
+class ScoringModule(nn.Module):
+    """Raw features -> anomaly scores, with the z-score constants built in."""
+
+    def __init__(
+        self,
+        model: nn.Module,
+        shift: torch.Tensor,
+        scale: torch.Tensor,
+    ) -> None:
+        super().__init__()
+        self.model = model
+        self.register_buffer("shift", shift)
+        self.register_buffer("scale", scale)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.score_normalized((x - self.shift) * self.scale)
+
+    @torch.jit.export
+    def score_normalized(self, x: torch.Tensor) -> torch.Tensor:
+        recon = self.model(x)
+        return torch.mean((recon - x) ** 2, dim=1)
+
+
+def export_scorer(
+    checkpoint_path: str,
+    out_path: str,
+    quantize: bool = False,
+) -> Dict[str, Any]:
+    """Write the TorchScript artifact for a checkpoint; returns its meta."""
+    checkpoint = torch.load(
+        checkpoint_path,
+        map_location="cpu",
+        weights_only=False,  # Required for full checkpoint structures
+    )
+    feature_cols = list(checkpoint.get("feature_cols", []))
+    input_dim = checkpoint.get("input_dim", len(feature_cols))
+
+    model = Autoencoder(input_dim=input_dim)
+    model.load_state_dict(checkpoint["model_state_dict"])
+    model.eval()
+
+    # Same constants AnomalyScorer derives from the checkpoint.
+    mean = checkpoint.get("mean", None)
+    std = checkpoint.get("std", None)
+    if mean is not None and std is not None:
+        std64 = np.asarray(std, dtype=np.float64).reshape(-1)
+        shift = np.asarray(mean, dtype=np.float32).reshape(-1)
+        scale = (1.0 / (std64 + NORM_EPS)).astype(np.float32)
+    else:
+        shift = np.zeros(input_dim, dtype=np.float32)
+        scale = np.ones(input_dim, dtype=np.float32)
+
+    meta = {
+        "feature_cols": feature_cols,
+        "input_dim": input_dim,
+        "mean": None if mean is None else np.asarray(mean).ravel().tolist(),
+        "std": None if std is None else np.asarray(std).ravel().tolist(),
+        "quantized": quantize,
+        "source": checkpoint_path,
+    }
+
+    # TorchScript and eager-mode dynamic quantization are deprecated in
+    # recent torch releases but still the lightest self-contained format
+    # that needs no extra runtime.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.simplefilter("ignore", FutureWarning)
+        warnings.simplefilter("ignore", UserWarning)
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {nn.Linear}, dtype=torch.qint8
+            )
+        module = ScoringModule(
+            model,
+            torch.from_numpy(shift),
+            torch.from_numpy(scale),
+        ).eval()
+        scripted = torch.jit.freeze(
+            torch.jit.script(module),
+            preserved_attrs=["score_normalized"],
+        )
+        torch.jit.save(
+            scripted,
+            out_path,
+            _extra_files={META_FILE: json.dumps(meta)},
+        )
+
+    kind = "int8 TorchScript" if quantize else "TorchScript"
+    print(f"[OK] Exported {checkpoint_path} -> {out_path} ({kind})")
+    return meta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("checkpoint")
+    parser.add_argument("out")
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="dynamic int8 quantization of the Linear layers",
+    )
+    args = parser.parse_args()
+    export_scorer(args.checkpoint, args.out, quantize=args.quantize)
@@ -1,17 +1,56 @@
+import argparse
+import math
 import socket
+import threading
 import time
-from dataclasses import dataclass
-from typing import Dict, Optional, Tuple
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 
-import pyshark
+import numpy as np
 import requests
 
-
-API_URL = "http://127.0.0.1:8000/ingest"
-
+from flow_table import (
+    FEATURE_NAMES,
+    FlowTable,
+    flow_features,
+    pack_ip,
+    record_ips,
+)
+from raw_capture import (
+    FlowKey,
+    Packet,
+    capture_files,
+    iter_af_packet,
+    iter_pcap_file,
+    parse_frame_raw,
+)
+
+try:
+    import pyshark
+except ImportError:  # the raw engine works without tshark/pyshark
+    pyshark = None
+
+
+API_URL = "http://127.0.0.1:8000/ingest_batch"
+
+# "raw" parses frames directly (AF_PACKET, Linux); "pyshark" uses tshark.
+# Replays work with either engine; live raw capture needs AF_PACKET.
+HAS_AF_PACKET = hasattr(socket, "AF_PACKET")
+CAPTURE_ENGINE = "raw" if HAS_AF_PACKET else "pyshark"
+
+# Raw engine only: > 0 splits capture, aggregation and export across
+# processes (capture_pipeline.py), with this many aggregator processes.
+CAPTURE_AGGREGATORS = 0
+
+# Flows are exported NetFlow-style: once when idle for FLOW_TTL seconds,
+# and once per ACTIVE_TIMEOUT for long-lived flows (a new record starts
+# with the next packet). Expiry is checked every FLUSH_INTERVAL.
 FLUSH_INTERVAL = 1.0
 FLOW_TTL = 30.0
-MAX_FLUSH = 200
+ACTIVE_TIMEOUT = 60.0
+MAX_FLUSH = 500  # flows per /ingest_batch post
+FLUSH_TIMEOUT_S = 2.0
 
 
 def _hostname() -> str:
@@ -22,21 +61,38 @@ def _hostname() -> str:
 
 
 @dataclass
-class FlowAgg:
-    first_ts: float
-    last_ts: float
-    bytes_in: float = 0.0
-    bytes_out: float = 0.0
-    packets: float = 0.0
-    proto: float = 0.0
-    src_port: float = 0.0
-    dst_port: float = 0.0
-    src_ip: Optional[str] = None
-    dst_ip: Optional[str] = None
-    process: Optional[str] = None
-
-
-FlowKey = Tuple[str, str, int, int, int]
+class CaptureStats:
+    """Counters for a capture or replay run."""
+
+    packets: int = 0
+    parsed: int = 0
+    flows_created: int = 0
+    flows_closed: int = 0
+    flows_exported: int = 0
+    dropped: int = 0
+    send_errors: int = 0
+    post_latencies: List[float] = field(default_factory=list)
+    log_flushes: bool = True
+    started: float = field(default_factory=time.perf_counter)
+
+    def summary(self) -> str:
+        elapsed = max(1e-9, time.perf_counter() - self.started)
+        lat = sorted(self.post_latencies) or [0.0]
+        p50 = lat[len(lat) // 2] * 1000.0
+        p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000.0
+
+        return (
+            f"[PCAP Agent] packets={self.packets} parsed={self.parsed} "
+            f"flows={self.flows_created} closed={self.flows_closed} "
+            f"exported={self.flows_exported} dropped={self.dropped} "
+            f"elapsed={elapsed:.2f}s\n"
+            f"[PCAP Agent] {self.packets / elapsed:,.0f} packets/s, "
+            f"{self.flows_created / elapsed:,.0f} flows/s\n"
+            f"[PCAP Agent] scoring latency per batch: "
+            f"p50={p50:.1f}ms p99={p99:.1f}ms "
+            f"(posts={len(self.post_latencies)} "
+            f"errors={self.send_errors})"
+        )
 
 
 def _packet_len(pkt) -> int:
@@ -49,6 +105,13 @@ def _packet_len(pkt) -> int:
             return 0
 
 
+def _tcp_flags(pkt) -> int:
+    try:
+        return int(pkt.tcp.flags, 16)
+    except Exception:
+        return 0
+
+
 def _extract_5tuple(pkt) -> Optional[FlowKey]:
     try:
         if hasattr(pkt, "ip"):
@@ -77,76 +140,142 @@ def _extract_5tuple(pkt) -> Optional[FlowKey]:
         return None
 
 
+def _flow_events(records: np.ndarray, agent_id: str) -> List[Dict]:
+    """FLOW_DTYPE records -> /ingest_batch events."""
+    features = flow_features(records).tolist()
+    last_ts = records["last_ts"].tolist()
+    src_ips, dst_ips = record_ips(records)
+
+    events = []
+    for row, ts, src_ip, dst_ip in zip(features, last_ts, src_ips, dst_ips):
+        events.append(
+            {
+                "meta": {
+                    "agent_id": agent_id,
+                    "src_ip": src_ip,
+                    "dst_ip": dst_ip,
+                    "process": None,
+                    "timestamp": ts,
+                },
+                "features": dict(zip(FEATURE_NAMES, row)),
+            }
+        )
+    return events
+
+
 def _flush(
-    flows: Dict[FlowKey, FlowAgg],
-    session: requests.Session,
+    table: FlowTable,
+    session: Optional[requests.Session],
     agent_id: str,
     now: float,
+    stats: Optional[CaptureStats] = None,
+    lock: Optional[threading.Lock] = None,
 ) -> None:
-    cutoff = now - FLOW_TTL
-    stale_keys = [
-        key for key, agg in flows.items()
-        if agg.last_ts < cutoff
-    ]
+    """
+    Export every flow that has hit its idle or active timeout by `now`
+    (math.inf exports everything). Expired flows are taken out of the
+    table under `lock`; posting happens after it is released.
+    """
+    with lock or nullcontext():
+        expired = table.expire(now)
+        active = len(table)
+        if stats is not None:
+            stats.flows_created = table.flows_created
+            stats.flows_closed = table.flows_closed
+
+    if not len(expired):
+        return
 
-    for key in stale_keys:
-        flows.pop(key, None)
+    if stats is not None:
+        stats.flows_exported += len(expired)
 
-    if not flows:
+    # session=None: dry run (aggregate only, nothing is posted)
+    if session is None:
         return
 
-    items = sorted(
-        flows.items(),
-        key=lambda kv: kv[1].last_ts,
-        reverse=True,
-    )[:MAX_FLUSH]
+    sent = _post_flows(expired, session, agent_id, stats)
+
+    if stats is None or stats.log_flushes:
+        print(
+            f"[PCAP Agent] flushed={sent} "
+            f"active_flows={active}"
+        )
 
+
+def _post_flows(
+    records: np.ndarray,
+    session: requests.Session,
+    agent_id: str,
+    stats: Optional[CaptureStats] = None,
+) -> int:
+    """Post flow records in MAX_FLUSH batches; returns how many landed."""
     sent = 0
-    for _, agg in items:
-        duration = max(0.001, agg.last_ts - agg.first_ts)
-
-        payload = {
-            "meta": {
-                "agent_id": agent_id,
-                "src_ip": agg.src_ip,
-                "dst_ip": agg.dst_ip,
-                "process": agg.process,
-                "timestamp": now,
-            },
-            "features": {
-                "bytes_in": agg.bytes_in,
-                "bytes_out": agg.bytes_out,
-                "packets": agg.packets,
-                "duration": duration,
-                "src_port": agg.src_port,
-                "dst_port": agg.dst_port,
-                "protocol": agg.proto,
-            },
-        }
+    for i in range(0, len(records), MAX_FLUSH):
+        events = _flow_events(records[i:i + MAX_FLUSH], agent_id)
 
+        started = time.perf_counter()
         try:
             resp = session.post(
                 API_URL,
-                json=payload,
-                timeout=0.75,
+                json={"events": events},
+                timeout=FLUSH_TIMEOUT_S,
             )
             if resp.status_code == 200:
-                sent += 1
+                sent += len(events)
+            if stats is not None:
+                stats.post_latencies.append(time.perf_counter() - started)
         except Exception:
-            continue
+            if stats is not None:
+                stats.send_errors += 1
 
-    print(
-        f"[PCAP Agent] flushed={sent} "
-        f"active_flows={len(flows)}"
-    )
+    return sent
+
+
+class FlushTimer(threading.Thread):
+    """Runs _flush every FLUSH_INTERVAL, whether or not packets arrive."""
+
+    def __init__(
+        self,
+        table: FlowTable,
+        lock: threading.Lock,
+        session: Optional[requests.Session],
+        agent_id: str,
+        stats: Optional[CaptureStats] = None,
+    ) -> None:
+        super().__init__(name="pcap-agent-flush", daemon=True)
+        self._args = (table, session, agent_id)
+        self._lock = lock
+        self._stats = stats
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(FLUSH_INTERVAL):
+            self.flush(time.time())
+
+    def flush(self, now: float) -> None:
+        _flush(*self._args, now=now, stats=self._stats, lock=self._lock)
+
+    def stop(self) -> None:
+        """Stop the timer and export every remaining flow."""
+        self._stopped.set()
+        self.join(timeout=FLUSH_TIMEOUT_S)
+        self.flush(math.inf)
+
+
+def _new_table() -> FlowTable:
+    return FlowTable(idle_s=FLOW_TTL, active_s=ACTIVE_TIMEOUT)
 
 
 def run_capture(interface: str, bpf: str = "tcp or udp") -> None:
+    if pyshark is None:
+        raise RuntimeError("pyshark is not installed; use run_raw_capture")
+
     agent_id = _hostname()
     session = requests.Session()
 
-    flows: Dict[FlowKey, FlowAgg] = {}
-    last_flush = time.time()
+    table = _new_table()
+    lock = threading.Lock()
+    timer = FlushTimer(table, lock, session, agent_id)
 
     print(f"[PCAP Agent] agent_id={agent_id}")
     print(f"[PCAP Agent] interface={interface}")
@@ -158,44 +287,27 @@ def run_capture(interface: str, bpf: str = "tcp or udp") -> None:
         interface=interface,
         bpf_filter=bpf,
     )
+    timer.start()
 
     try:
         for pkt in capture.sniff_continuously():
-            now = time.time()
             key = _extract_5tuple(pkt)
 
             if key is None:
                 continue
 
-            plen = _packet_len(pkt)
             src_ip, dst_ip, src_port, dst_port, proto = key
-
-            agg = flows.get(key)
-            if agg is None:
-                agg = FlowAgg(
-                    first_ts=now,
-                    last_ts=now,
-                    proto=float(proto),
-                    src_port=float(src_port),
-                    dst_port=float(dst_port),
-                    src_ip=str(src_ip),
-                    dst_ip=str(dst_ip),
+            with lock:
+                table.add_packet(
+                    time.time(),
+                    pack_ip(src_ip),
+                    pack_ip(dst_ip),
+                    src_port,
+                    dst_port,
+                    proto,
+                    _packet_len(pkt),
+                    _tcp_flags(pkt) if proto == 6 else 0,
                 )
-                flows[key] = agg
-            else:
-                agg.last_ts = now
-
-            agg.packets += 1.0
-            agg.bytes_out += float(plen)
-
-            if now - last_flush >= FLUSH_INTERVAL:
-                _flush(
-                    flows=flows,
-                    session=session,
-                    agent_id=agent_id,
-                    now=now,
-                )
-                last_flush = now
 
     except KeyboardInterrupt:
         print("\n[PCAP Agent] stopping")
@@ -205,22 +317,250 @@ def run_capture(interface: str, bpf: str = "tcp or udp") -> None:
             capture.close()
         except Exception:
             pass
+        timer.stop()
+
+
+def _capture_loop(
+    packets: Iterable[Packet],
+    sink,
+    stats: CaptureStats,
+    packet_time: bool = False,
+    speed: float = 0.0,
+    lock: Optional[threading.Lock] = None,
+    on_tick: Optional[Callable[[float], None]] = None,
+) -> float:
+    """
+    Parse packets from a raw source into `sink` (anything with
+    FlowTable.add_packet: the table itself, or a pipeline fan-out).
+
+    With packet_time=True timestamps come from the packets and
+    on_tick(now) runs every FLUSH_INTERVAL of packet time; speed > 0
+    paces the source at that multiple of real time. Otherwise a timer
+    thread is expected to do the periodic work, and `lock` guards the
+    sink. Returns the last timestamp seen.
+    """
+    now = time.time()
+    next_flush: Optional[float] = None
+    ts0: Optional[float] = None
+    wall0 = 0.0
+    guard = lock or nullcontext()
+
+    for ts, frame, wire_len, linktype in packets:
+        stats.packets += 1
+        now = ts if packet_time else time.time()
+
+        if speed > 0:
+            if ts0 is None:
+                ts0, wall0 = ts, time.perf_counter()
+            delay = wall0 + (ts - ts0) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        hdr = parse_frame_raw(frame, linktype)
+        if hdr is None:
+            continue
 
+        stats.parsed += 1
+        src, dst, src_port, dst_port, proto, flags = hdr
+        with guard:
+            sink.add_packet(
+                now, src, dst, src_port, dst_port, proto, wire_len, flags
+            )
 
-def main() -> None:
+        if on_tick is None:
+            continue
+        if next_flush is None:
+            next_flush = now + FLUSH_INTERVAL
+        elif now >= next_flush:
+            on_tick(now)
+            next_flush = now + FLUSH_INTERVAL
+
+    return now
+
+
+def run_raw_capture(interface: str, aggregators: int = 0) -> None:
+    """
+    Live capture with the raw engine: headers are parsed straight from
+    AF_PACKET frames (see raw_capture.py) and fed into the same
+    FlowTable. Only TCP/UDP over IP is tracked.
+
+    aggregators > 0 runs the multi-process pipeline instead (see
+    capture_pipeline.py).
+    """
+    if aggregators > 0:
+        from capture_pipeline import run_pipeline
+
+        print(f"[PCAP Agent] interface={interface} (raw engine)")
+        run_pipeline(iter_af_packet(interface), aggregators)
+        return
+
+    agent_id = _hostname()
+    session = requests.Session()
+    table = _new_table()
+    lock = threading.Lock()
+    stats = CaptureStats()
+    timer = FlushTimer(table, lock, session, agent_id, stats)
+
+    print(f"[PCAP Agent] agent_id={agent_id}")
+    print(f"[PCAP Agent] interface={interface} (raw engine)")
+    print(f"[PCAP Agent] sending to {API_URL}")
+    print("[PCAP Agent] starting capture (Ctrl+C to stop)")
+
+    timer.start()
+    try:
+        _capture_loop(iter_af_packet(interface), table, stats, lock=lock)
+    except KeyboardInterrupt:
+        print("\n[PCAP Agent] stopping")
+    finally:
+        timer.stop()
+        print(stats.summary())
+
+
+def run_replay(
+    path: str,
+    speed: float = 0.0,
+    send: bool = True,
+    aggregators: int = 0,
+) -> CaptureStats:
+    """
+    Replay a .pcap/.pcapng file, or every capture in a directory,
+    through the same pipeline as a live capture.
+
+    Flow times come from packet timestamps. speed=0 replays as fast as
+    possible; otherwise at that multiple of the recorded rate. With
+    send=False flows are aggregated but not posted. Prints packets/s,
+    flows/s and per-batch scoring latency at the end.
+    """
+    files = capture_files(path)
+
+    print(f"[PCAP Agent] replaying {len(files)} file(s) from {path}")
+    print(f"[PCAP Agent] speed={'max' if speed <= 0 else f'{speed}x'}")
+
+    def packets() -> Iterator[Packet]:
+        for f in files:
+            yield from iter_pcap_file(f)
+
+    if aggregators > 0:
+        from capture_pipeline import run_pipeline
+
+        return run_pipeline(
+            packets(),
+            aggregators,
+            send=send,
+            packet_time=True,
+            speed=speed,
+        )
+
+    agent_id = _hostname()
+    session = requests.Session() if send else None
+    table = _new_table()
+    stats = CaptureStats(log_flushes=False)
+    print(f"[PCAP Agent] sending to {API_URL if send else '(nowhere)'}")
+
+    def on_tick(now: float) -> None:
+        _flush(table, session, agent_id, now, stats)
+
+    try:
+        _capture_loop(
+            packets(),
+            table,
+            stats,
+            packet_time=True,
+            speed=speed,
+            on_tick=on_tick,
+        )
+    except KeyboardInterrupt:
+        print("\n[PCAP Agent] stopping")
+
+    # Export whatever is still active at the end of the recording.
+    _flush(table, session, agent_id, math.inf, stats)
+
+    print(stats.summary())
+    return stats
+
+
+def _list_interfaces():
+    if CAPTURE_ENGINE == "pyshark" and pyshark is not None:
+        return pyshark.tshark.tshark.get_tshark_interfaces()
+    return [name for _, name in socket.if_nameindex()]
+
+
+def _prompt_interface() -> str:
     print("[PCAP Agent] available interfaces:")
-    for iface in pyshark.tshark.tshark.get_tshark_interfaces():
+    for iface in _list_interfaces():
         print(" -", iface)
 
-    interface = input(
+    return input(
         "\nPaste interface name from list above:\n> "
     ).strip()
 
+
+def main() -> None:
+    global CAPTURE_ENGINE
+
+    parser = argparse.ArgumentParser(description="AegisNet PCAP agent")
+    parser.add_argument(
+        "--interface",
+        help="capture live from this interface (prompted if omitted)",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="replay a .pcap/.pcapng file or a directory of them",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="replay at this multiple of real time (0 = as fast as possible)",
+    )
+    parser.add_argument(
+        "--no-send",
+        action="store_true",
+        help="replay: aggregate flows but do not post them",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("raw", "pyshark"),
+        default=CAPTURE_ENGINE,
+    )
+    parser.add_argument(
+        "--aggregators",
+        type=int,
+        default=CAPTURE_AGGREGATORS,
+        help="raw engine: aggregator processes (0 = single process)",
+    )
+    args = parser.parse_args()
+    CAPTURE_ENGINE = args.engine
+
+    if args.replay:
+        run_replay(
+            args.replay,
+            speed=args.speed,
+            send=not args.no_send,
+            aggregators=args.aggregators,
+        )
+        return
+
+    if CAPTURE_ENGINE == "raw" and not HAS_AF_PACKET:
+        if pyshark is None:
+            parser.error(
+                "live raw capture needs AF_PACKET (Linux); "
+                "install pyshark and tshark for --engine pyshark"
+            )
+        print("[PCAP Agent] no AF_PACKET on this platform, using pyshark")
+        CAPTURE_ENGINE = "pyshark"
+
+    interface = args.interface or _prompt_interface()
+
     if not interface:
         print("No interface provided. Exiting.")
         return
 
-    run_capture(interface=interface)
+    if CAPTURE_ENGINE == "pyshark":
+        run_capture(interface=interface)
+    else:
+        run_raw_capture(interface=interface, aggregators=args.aggregators)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,376 @@
+"""
+Minimal raw-packet capture and header parsing for pcap_agent.
+
+Parses Ethernet (incl. VLAN tags), Linux cooked (SLL) and raw-IP frames,
+IPv4/IPv6 and TCP/UDP ports straight from the frame bytes with struct,
+instead of building a full tshark dissection per packet.
+
+Sources yield (timestamp, frame, wire_len, linktype) tuples:
+  - iter_af_packet(interface): Linux AF_PACKET socket (needs CAP_NET_RAW)
+  - iter_pcap_file(path): .pcap or .pcapng capture file
+"""
+import os
+import socket
+import struct
+import time
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from flow_table import V4_MAPPED_PREFIX, ip_str
+
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_8021Q = 0x8100
+ETH_P_8021AD = 0x88A8
+
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+# IPv6 extension headers we can step over to reach TCP/UDP.
+_IPV6_EXT = {0, 43, 60}
+_IPV6_FRAGMENT = 44
+
+# (src_ip, dst_ip, src_port, dst_port, proto)
+FlowKey = Tuple[str, str, int, int, int]
+# (src, dst, src_port, dst_port, proto, tcp_flags) with 16-byte
+# addresses (IPv4 as IPv4-mapped IPv6)
+RawHeaders = Tuple[bytes, bytes, int, int, int, int]
+Packet = Tuple[float, bytes, int, int]
+
+_u16 = struct.Struct("!H")
+_ports = struct.Struct("!HH")
+
+_IP_CACHE_MAX = 65_536
+_ip_cache: Dict[bytes, str] = {}
+
+
+def _ip_str(raw: bytes) -> str:
+    s = _ip_cache.get(raw)
+    if s is None:
+        s = ip_str(raw)
+        if len(_ip_cache) >= _IP_CACHE_MAX:
+            _ip_cache.clear()
+        _ip_cache[raw] = s
+    return s
+
+
+# ----------------------------------------------------------------------
+# Header parsing
+# ----------------------------------------------------------------------
+def _l3_offset(buf, linktype: int) -> Tuple[int, int]:
+    """Return (ethertype, offset of the IP header) for a frame."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(buf) < 14:
+            return 0, 0
+        off = 12
+        ethertype = _u16.unpack_from(buf, off)[0]
+        while ethertype in (ETH_P_8021Q, ETH_P_8021AD):
+            off += 4
+            if len(buf) < off + 2:
+                return 0, 0
+            ethertype = _u16.unpack_from(buf, off)[0]
+        return ethertype, off + 2
+
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(buf) < 16:
+            return 0, 0
+        return _u16.unpack_from(buf, 14)[0], 16
+
+    if linktype == LINKTYPE_RAW:
+        if not buf:
+            return 0, 0
+        version = buf[0] >> 4
+        if version == 4:
+            return ETH_P_IP, 0
+        if version == 6:
+            return ETH_P_IPV6, 0
+
+    return 0, 0
+
+
+def parse_frame(buf, linktype: int = LINKTYPE_ETHERNET) -> Optional[FlowKey]:
+    """
+    Extract the directed 5-tuple from a raw frame, or None for anything
+    that is not TCP/UDP over IPv4/IPv6 (or is a non-first fragment).
+    """
+    hdr = parse_frame_raw(buf, linktype)
+    if hdr is None:
+        return None
+    src, dst, src_port, dst_port, proto, _ = hdr
+    return (_ip_str(src), _ip_str(dst), src_port, dst_port, proto)
+
+
+def parse_frame_raw(
+    buf,
+    linktype: int = LINKTYPE_ETHERNET,
+) -> Optional[RawHeaders]:
+    """
+    parse_frame with 16-byte addresses, as FlowTable stores them, plus
+    the TCP flags byte (0 for UDP or a truncated TCP header).
+    """
+    ethertype, off = _l3_offset(buf, linktype)
+    n = len(buf)
+
+    if ethertype == ETH_P_IP:
+        if n < off + 20:
+            return None
+        ihl = (buf[off] & 0x0F) * 4
+        if ihl < 20 or n < off + ihl:
+            return None
+        frag = _u16.unpack_from(buf, off + 6)[0] & 0x1FFF
+        if frag:
+            return None
+        proto = buf[off + 9]
+        src = V4_MAPPED_PREFIX + bytes(buf[off + 12:off + 16])
+        dst = V4_MAPPED_PREFIX + bytes(buf[off + 16:off + 20])
+        l4 = off + ihl
+
+    elif ethertype == ETH_P_IPV6:
+        if n < off + 40:
+            return None
+        proto = buf[off + 6]
+        src = bytes(buf[off + 8:off + 24])
+        dst = bytes(buf[off + 24:off + 40])
+        l4 = off + 40
+
+        while proto in _IPV6_EXT or proto == _IPV6_FRAGMENT:
+            if n < l4 + 8:
+                return None
+            if proto == _IPV6_FRAGMENT:
+                if _u16.unpack_from(buf, l4 + 2)[0] & 0xFFF8:
+                    return None
+                next_proto, l4 = buf[l4], l4 + 8
+            else:
+                next_proto, l4 = buf[l4], l4 + (buf[l4 + 1] + 1) * 8
+            proto = next_proto
+
+    else:
+        return None
+
+    if proto != PROTO_TCP and proto != PROTO_UDP:
+        return None
+    if n < l4 + 4:
+        return None
+
+    src_port, dst_port = _ports.unpack_from(buf, l4)
+    flags = buf[l4 + 13] if proto == PROTO_TCP and n > l4 + 13 else 0
+    return (src, dst, src_port, dst_port, proto, flags)
+
+
+# ----------------------------------------------------------------------
+# Packet sources
+# ----------------------------------------------------------------------
+def iter_af_packet(interface: str, snaplen: int = 65_535) -> Iterator[Packet]:
+    """Live capture from a Linux AF_PACKET socket (all protocols)."""
+    sock = socket.socket(
+        socket.AF_PACKET,
+        socket.SOCK_RAW,
+        socket.ntohs(ETH_P_ALL),
+    )
+    try:
+        sock.bind((interface, 0))
+        buf = bytearray(snaplen)
+        view = memoryview(buf)
+        while True:
+            n = sock.recv_into(buf)
+            yield time.time(), view[:n], n, LINKTYPE_ETHERNET
+    finally:
+        sock.close()
+
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+
+# Largest record we accept (Wireshark's limit). A corrupt incl_len would
+# otherwise make us allocate whatever the header claims.
+_PCAP_MAX_RECORD = 262_144
+
+
+def read_pcap(fp: BinaryIO) -> Iterator[Packet]:
+    """Iterate packets from an open libpcap-format stream."""
+    header = fp.read(24)
+    if len(header) < 24 or header[:4] not in _PCAP_MAGIC:
+        raise ValueError("Not a libpcap capture file")
+
+    endian, ts_unit = _PCAP_MAGIC[header[:4]]
+    linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+    rec = struct.Struct(endian + "IIII")
+
+    while True:
+        hdr = fp.read(16)
+        if len(hdr) < 16:
+            return
+        ts_sec, ts_frac, incl_len, orig_len = rec.unpack(hdr)
+        if incl_len > _PCAP_MAX_RECORD:
+            raise ValueError(f"Corrupt pcap record length {incl_len}")
+        data = fp.read(incl_len)
+        if len(data) < incl_len:
+            return
+        yield ts_sec + ts_frac * ts_unit, data, orig_len, linktype
+
+
+_PCAPNG_SHB = 0x0A0D0D0A
+_PCAPNG_IDB = 1
+_PCAPNG_PB = 2
+_PCAPNG_SPB = 3
+_PCAPNG_EPB = 6
+_PCAPNG_BOM_LE = b"\x4d\x3c\x2b\x1a"
+_IF_TSRESOL = 9
+_PCAPNG_SHB_MIN = 28
+# Bytes of fixed fields at the start of each block body we parse.
+_PCAPNG_FIXED = {
+    _PCAPNG_IDB: 8,
+    _PCAPNG_EPB: 20,
+    _PCAPNG_PB: 20,
+    _PCAPNG_SPB: 4,
+}
+
+
+def _idb_interface(body: bytes, endian: str) -> Tuple[int, float]:
+    """Return (linktype, timestamp unit) from an Interface Description."""
+    linktype = struct.unpack_from(endian + "H", body, 0)[0]
+    ts_unit = 1e-6
+
+    off = 8
+    while off + 4 <= len(body) - 4:
+        code, length = struct.unpack_from(endian + "HH", body, off)
+        if code == 0:
+            break
+        if code == _IF_TSRESOL and length >= 1:
+            v = body[off + 4]
+            ts_unit = 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0 ** -v
+        off += 4 + ((length + 3) & ~3)
+
+    return linktype, ts_unit
+
+
+def _pcapng_block_len(total_len: int, minimum: int = 12) -> int:
+    # Block lengths cover the 8-byte head and the trailing length copy
+    # and are padded to 32 bits. Anything else means we lost the block
+    # boundaries and cannot resynchronise.
+    if total_len < minimum or total_len % 4:
+        raise ValueError(f"Corrupt pcapng block length {total_len}")
+    return total_len
+
+
+def read_pcapng(fp: BinaryIO) -> Iterator[Packet]:
+    """Iterate packets from an open pcapng stream."""
+    endian = "<"
+    interfaces: List[Tuple[int, float]] = []
+    last_ts = 0.0
+
+    while True:
+        head = fp.read(8)
+        if len(head) < 8:
+            return
+
+        if struct.unpack_from("<I", head, 0)[0] == _PCAPNG_SHB:
+            bom = fp.read(4)
+            if bom == _PCAPNG_BOM_LE:
+                endian = "<"
+            elif bom == _PCAPNG_BOM_LE[::-1]:
+                endian = ">"
+            else:
+                raise ValueError("Corrupt pcapng section header")
+            total_len = struct.unpack_from(endian + "I", head, 4)[0]
+            _pcapng_block_len(total_len, _PCAPNG_SHB_MIN)
+            if len(fp.read(total_len - 12)) < total_len - 12:
+                return
+            interfaces = []  # interface ids restart per section
+            continue
+
+        block_type, total_len = struct.unpack(endian + "II", head)
+        _pcapng_block_len(total_len)
+        body = fp.read(total_len - 8)
+        if len(body) < total_len - 8:
+            return
+
+        # body ends with the 4-byte trailing length; the fixed fields
+        # must fit in front of it.
+        fixed = _PCAPNG_FIXED.get(block_type)
+        if fixed is None:
+            continue
+        if len(body) < fixed + 4:
+            raise ValueError(
+                f"Corrupt pcapng block: type {block_type}, "
+                f"length {total_len}"
+            )
+
+        if block_type == _PCAPNG_IDB:
+            interfaces.append(_idb_interface(body, endian))
+            continue
+
+        if block_type == _PCAPNG_EPB:
+            iface, ts_hi, ts_lo, cap_len, orig_len = struct.unpack_from(
+                endian + "IIIII", body, 0
+            )
+        elif block_type == _PCAPNG_PB:
+            iface, _, ts_hi, ts_lo, cap_len, orig_len = struct.unpack_from(
+                endian + "HHIIII", body, 0
+            )
+        else:  # _PCAPNG_SPB
+            # No timestamp or interface id: reuse the previous timestamp.
+            iface, ts_hi, ts_lo = 0, -1, 0
+            orig_len = struct.unpack_from(endian + "I", body, 0)[0]
+            cap_len = orig_len
+        cap_len = min(cap_len, len(body) - 4 - fixed)
+
+        if iface >= len(interfaces):
+            continue
+        linktype, ts_unit = interfaces[iface]
+        if ts_hi >= 0:
+            last_ts = ((ts_hi << 32) | ts_lo) * ts_unit
+
+        data = memoryview(body)[fixed:fixed + cap_len]
+        yield last_ts, data, orig_len, linktype
+
+
+def iter_pcap_file(path: str) -> Iterator[Packet]:
+    """Iterate a .pcap or .pcapng file (format detected from its magic)."""
+    with open(path, "rb", buffering=1 << 20) as fp:
+        magic = fp.read(4)
+        fp.seek(0)
+        if len(magic) == 4 and struct.unpack("<I", magic)[0] == _PCAPNG_SHB:
+            yield from read_pcapng(fp)
+        else:
+            yield from read_pcap(fp)
+
+
+CAPTURE_SUFFIXES = (".pcap", ".pcapng", ".cap")
+
+
+def capture_files(path: str) -> List[str]:
+    """A single capture file, or every capture file in a directory."""
+    if not os.path.isdir(path):
+        return [path]
+
+    return sorted(
+        os.path.join(path, name)
+        for name in os.listdir(path)
+        if name.lower().endswith(CAPTURE_SUFFIXES)
+    )
+
+
+def write_pcap(
+    fp: BinaryIO,
+    packets,
+    linktype: int = LINKTYPE_ETHERNET,
+) -> None:
+    """Write (timestamp, frame) pairs as a microsecond libpcap file."""
+    fp.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65_535, linktype))
+    rec = struct.Struct("<IIII")
+    for ts, frame in packets:
+        sec = int(ts)
+        usec = int((ts - sec) * 1e6)
+        fp.write(rec.pack(sec, usec, len(frame), len(frame)))
+        fp.write(frame)
@@ -0,0 +1,140 @@
+"""
+Hands scored results from request threads to the event loop.
+
+Sync endpoints run in FastAPI's threadpool, so they must not touch
+recent_results or the live feed directly. push() is a single
+deque.append (atomic under the GIL, no lock taken) and never waits on
+anything downstream. One task on the event loop drains the deque every
+interval_s, builds the result records, adds them to `recent` and
+publishes them to the live feed. Request latency therefore does not
+depend on how many dashboards are connected.
+
+With a TrafficSeries, drained results are also folded into its
+per-second buckets, and each closed second is published to
+`series_feed`. With a HistoryStore, every result is queued for its
+background writer.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from history_store import HistoryStore
+from live_feed import LiveFeed
+from traffic_series import Result, TrafficSeries
+
+
+class ResultSink:
+    """Many-producer, single-consumer handoff of scored results."""
+
+    def __init__(
+        self,
+        recent: Deque[Dict[str, Any]],
+        feed: LiveFeed,
+        interval_s: float = 0.05,
+        max_pending: int = 10_000,
+        series: Optional[TrafficSeries] = None,
+        series_feed: Optional[LiveFeed] = None,
+        history: Optional[HistoryStore] = None,
+    ) -> None:
+        self.recent = recent
+        self.feed = feed
+        self.series = series
+        self.series_feed = series_feed
+        self.history = history
+        self.interval_s = interval_s
+        self.max_pending = max_pending
+
+        self._ring: Deque[List[Result]] = deque()
+        self._task: asyncio.Task | None = None
+
+        self.dropped_total = 0
+        self.recorded_total = 0
+        self.max_pending_seen = 0
+
+    # ------------------------------------------------------------------
+    # Producers (any thread)
+    # ------------------------------------------------------------------
+    def push(self, results: List[Result]) -> None:
+        # The length check (and dropped_total) can be off by a few under
+        # contention, which is fine for a backstop against a stalled
+        # consumer.
+        if len(self._ring) >= self.max_pending:
+            self.dropped_total += len(results)
+            return
+        self._ring.append(results)
+
+    # ------------------------------------------------------------------
+    # Consumer (event loop)
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.drain()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            self.drain()
+            if self.series is not None:
+                self._publish_points(self.series.advance(time.time()))
+
+    def _publish_points(self, points: List[Dict[str, Any]]) -> None:
+        if points and self.series_feed is not None:
+            self.series_feed.publish(points)
+
+    def drain(self) -> int:
+        """Record everything pushed so far; returns the result count."""
+        pending = len(self._ring)
+        if not pending:
+            return 0
+        self.max_pending_seen = max(self.max_pending_seen, pending)
+
+        now = time.time()
+        batches = [self._ring.popleft() for _ in range(pending)]
+        total = 0
+        for batch in batches:
+            total += len(batch)
+            if self.series is not None:
+                self._publish_points(self.series.add(batch, now))
+            if self.history is not None:
+                self.history.append(batch, now)
+
+        # Only the newest results are kept by `recent` and the live feed,
+        # so only those become records.
+        keep = max(self.recent.maxlen or total, self.feed.max_items)
+        newest: List[Result] = []
+        for batch in reversed(batches):
+            newest.extend(reversed(batch[-(keep - len(newest)):]))
+            if len(newest) >= keep:
+                break
+
+        items: List[Dict[str, Any]] = [
+            {
+                "flow": flow,
+                "score": score,
+                "is_suspicious": is_suspicious,
+            }
+            for flow, score, is_suspicious in reversed(newest)
+        ]
+        self.recent.extendleft(items)
+        self.feed.publish(items, count=total)
+        self.recorded_total += total
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._ring),
+            "max_pending": self.max_pending_seen,
+            "recorded_total": self.recorded_total,
+            "dropped_total": self.dropped_total,
+        }
@@ -1,5 +1,5 @@
-from typing import Dict, Optional
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from pydantic import BaseModel, FiniteFloat
 
 
 class FlowMeta(BaseModel):
@@ -7,9 +7,14 @@ class FlowMeta(BaseModel):
     src_ip: Optional[str] = None
     dst_ip: Optional[str] = None
     process: Optional[str] = None
-    timestamp: Optional[float] = None  # epoch seconds
+    timestamp: Optional[FiniteFloat] = None  # epoch seconds
 
 
 class IngestEvent(BaseModel):
     meta: FlowMeta
-    features: Dict[str, float]
+    # NaN/inf would poison the classifier's running window sums.
+    features: Dict[str, FiniteFloat]
+
+
+class IngestBatch(BaseModel):
+    events: List[IngestEvent]
@@ -0,0 +1,177 @@
+"""
+Fixed pool of scoring workers with pinned torch thread counts.
+
+Every AnomalyScorer call from the service runs on one of `workers`
+threads owned by the pool. Each worker sets torch's intra-op thread
+count when it starts (the OpenMP team size is per calling thread, so
+setting it once on the main thread does not reach threads created
+later), and the inter-op pool is limited once for the process. At most
+workers * torch_threads cores are then busy scoring at any moment,
+however many request threads are waiting, instead of every concurrent
+request spinning up its own full-width OpenMP team and oversubscribing
+the CPU.
+
+ScoringPool exposes the scorer's API (score, score_batch,
+score_batch_partial, score_matrix, feature_cols, device), so it can be
+handed to MicroBatcher in place of the scorer. submit() returns a
+Future for async callers.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from anomaly_scorer import AnomalyScorer, RowErrors
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        return os.cpu_count() or 1
+
+
+def pool_size(
+    workers: int = 0,
+    torch_threads: int = 0,
+) -> Tuple[int, int]:
+    """
+    Resolve 0 ("auto") settings: one worker per core with one torch
+    thread each, or split the cores evenly between the given workers.
+    """
+    cores = available_cores()
+    workers = workers if workers > 0 else cores
+    torch_threads = torch_threads if torch_threads > 0 else max(
+        1, cores // workers
+    )
+    return workers, torch_threads
+
+
+class ScoringPool:
+    """Routes AnomalyScorer calls through a fixed set of worker threads."""
+
+    def __init__(
+        self,
+        scorer: AnomalyScorer,
+        workers: int = 0,
+        torch_threads: int = 0,
+        interop_threads: int = 1,
+        stats_window: int = 1024,
+    ) -> None:
+        self.scorer = scorer
+        self.workers, self.torch_threads = pool_size(workers, torch_threads)
+        self.interop_threads = interop_threads
+
+        # Only allowed before any inter-op work has run in the process.
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            self.interop_threads = torch.get_num_interop_threads()
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="aegisnet-scorer",
+            initializer=torch.set_num_threads,
+            initargs=(self.torch_threads,),
+        )
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._waits_s: Deque[float] = deque(maxlen=stats_window)
+        self._run_s: Deque[float] = deque(maxlen=stats_window)
+        self.max_pending = 0
+        self.calls_total = 0
+        self.errors_total = 0
+
+        print(
+            f"[Scoring] {self.workers} workers x {self.torch_threads} "
+            f"torch threads (inter-op {self.interop_threads})"
+        )
+
+    # ------------------------------------------------------------------
+    # Scorer API
+    # ------------------------------------------------------------------
+    @property
+    def feature_cols(self) -> List[str]:
+        return self.scorer.feature_cols
+
+    @property
+    def device(self) -> str:
+        return self.scorer.device
+
+    def score(self, flow: dict) -> float:
+        return self.submit(self.scorer.score, flow).result()
+
+    def score_batch(self, flows: List[dict]) -> List[float]:
+        return self.submit(self.scorer.score_batch, flows).result()
+
+    def score_batch_partial(
+        self,
+        flows: List[dict],
+    ) -> Tuple[List[Optional[float]], RowErrors]:
+        return self.submit(self.scorer.score_batch_partial, flows).result()
+
+    def score_matrix(self, X: np.ndarray) -> np.ndarray:
+        return self.submit(self.scorer.score_matrix, X).result()
+
+    # ------------------------------------------------------------------
+    # Pool
+    # ------------------------------------------------------------------
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Run fn(*args) on a scoring worker."""
+        with self._lock:
+            self._pending += 1
+            if self._pending > self.max_pending:
+                self.max_pending = self._pending
+        return self._executor.submit(
+            self._call, fn, args, time.perf_counter()
+        )
+
+    def _call(self, fn: Callable[..., Any], args: tuple, enqueued: float):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = fn(*args)
+            failed = False
+            return result
+        finally:
+            done = time.perf_counter()
+            with self._lock:
+                self._pending -= 1
+                self.calls_total += 1
+                self.errors_total += failed
+                self._waits_s.append(started - enqueued)
+                self._run_s.append(done - started)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = np.asarray(self._waits_s, dtype=np.float64)
+            runs = np.asarray(self._run_s, dtype=np.float64)
+            pending = self._pending
+
+        def ms(values: np.ndarray, q: float) -> float:
+            if not len(values):
+                return 0.0
+            return round(float(np.percentile(values, q)) * 1000.0, 3)
+
+        return {
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "interop_threads": self.interop_threads,
+            "pending": pending,
+            "max_pending": self.max_pending,
+            "calls_total": self.calls_total,
+            "errors_total": self.errors_total,
+            "wait_ms_p50": ms(waits, 50),
+            "wait_ms_p99": ms(waits, 99),
+            "run_ms_p50": ms(runs, 50),
+            "run_ms_p99": ms(runs, 99),
+        }
@@ -0,0 +1,53 @@
+"""FlowTable export on TCP close."""
+import math
+
+import numpy as np
+
+from flow_table import PACKET_DTYPE, TCP_FIN, FlowTable
+
+
+CLIENT = (0xFFFF << 32) | 0x0A000001
+SERVER = (0xFFFF << 32) | 0xC0A8010A
+
+
+def _packet(src, dst, sport, dport, flags=0, ts=0.0):
+    pk = np.zeros(1, dtype=PACKET_DTYPE)
+    pk["src"][:, 1] = src
+    pk["dst"][:, 1] = dst
+    pk["sport"] = sport
+    pk["dport"] = dport
+    pk["proto"] = 6
+    pk["length"] = 60
+    pk["flags"] = flags
+    pk["ts"] = ts
+    return pk
+
+
+def _fin_exchange(table, sport=40_000):
+    table.update(_packet(CLIENT, SERVER, sport, 443))
+    table.update(_packet(CLIENT, SERVER, sport, 443, TCP_FIN))
+    table.update(_packet(SERVER, CLIENT, 443, sport, TCP_FIN))
+
+
+def test_close_with_unchanged_deadline_exports_once():
+    # close_s > idle_s: closing leaves the flow's deadline where it was.
+    table = FlowTable(idle_s=1.0, active_s=60.0, close_s=5.0)
+    _fin_exchange(table)
+
+    assert len(table.expire(2.0)) == 1
+    assert len(table.expire(math.inf)) == 0
+    assert len(table) == 0
+
+
+def test_closed_flow_slot_is_reused_once():
+    table = FlowTable(idle_s=1.0, active_s=60.0, close_s=5.0)
+    _fin_exchange(table)
+    table.expire(2.0)
+
+    # A slot released twice would be handed to both of these flows.
+    table.update(_packet(CLIENT, SERVER, 40_001, 443, ts=3.0))
+    table.update(_packet(CLIENT, SERVER, 40_002, 443, ts=3.0))
+    assert len(table) == 2
+
+    records = table.expire(math.inf)
+    assert sorted(records["sport"].tolist()) == [40_001, 40_002]
@@ -1,12 +1,193 @@
+import math
+import sys
+import threading
 import time
-from collections import defaultdict, deque
+from collections import OrderedDict, deque
 from dataclasses import dataclass
-from typing import Deque, Dict, Optional, Tuple
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from flow_sketch import SketchWindow
 
 
 FlowEntry = Tuple[float, str, int, float, float]
 FlowQueue = Deque[FlowEntry]
 
+# tuple + float/str/int/float/float payloads, measured on CPython 3.11
+_ENTRY_BYTES = 200
+
+
+class ExactSum:
+    """
+    Running float sum that supports removal without drift.
+
+    Keeps Shewchuk-style non-overlapping partials so repeated add/subtract
+    over a long-lived window returns the correctly rounded total.
+    """
+
+    __slots__ = ("_partials",)
+
+    def __init__(self) -> None:
+        self._partials: List[float] = []
+
+    def add(self, x: float) -> None:
+        partials = self._partials
+        i = 0
+        for y in partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                partials[i] = lo
+                i += 1
+            x = hi
+        partials[i:] = [x]
+
+    @property
+    def value(self) -> float:
+        return math.fsum(self._partials)
+
+
+class SourceWindow:
+    """
+    Rolling window of flows from one source, with aggregates kept
+    up to date on append/popleft so reading them is O(1).
+    """
+
+    __slots__ = (
+        "events",
+        "port_counts",
+        "host_counts",
+        "bytes_out",
+        "packets",
+        "last_ts",
+    )
+
+    def __init__(self) -> None:
+        self.last_ts = 0.0
+        self.events: FlowQueue = deque()
+        self.port_counts: Dict[int, int] = {}
+        self.host_counts: Dict[str, int] = {}
+        self.bytes_out = ExactSum()
+        self.packets = ExactSum()
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def append(self, entry: FlowEntry) -> None:
+        self.events.append(entry)
+        ts, host, port, bytes_out, packets = entry
+        if ts > self.last_ts:
+            self.last_ts = ts
+
+        if port > 0:
+            self.port_counts[port] = self.port_counts.get(port, 0) + 1
+        if host:
+            self.host_counts[host] = self.host_counts.get(host, 0) + 1
+
+        self.bytes_out.add(bytes_out)
+        self.packets.add(packets)
+
+    def popleft(self) -> FlowEntry:
+        entry = self.events.popleft()
+        _, host, port, bytes_out, packets = entry
+
+        if port > 0:
+            _decrement(self.port_counts, port)
+        if host:
+            _decrement(self.host_counts, host)
+
+        self.bytes_out.add(-bytes_out)
+        self.packets.add(-packets)
+        return entry
+
+    def prune(self, cutoff: float) -> None:
+        events = self.events
+        while events and events[0][0] < cutoff:
+            self.popleft()
+
+    @property
+    def n_dst_ports(self) -> int:
+        return len(self.port_counts)
+
+    @property
+    def n_dst_hosts(self) -> int:
+        return len(self.host_counts)
+
+    @property
+    def total_bytes_out(self) -> float:
+        return self.bytes_out.value
+
+    @property
+    def total_packets(self) -> float:
+        return self.packets.value
+
+    def nbytes(self) -> int:
+        """Rough memory footprint (containers plus per-event tuples)."""
+        return (
+            sys.getsizeof(self.events)
+            + len(self.events) * _ENTRY_BYTES
+            + sys.getsizeof(self.port_counts)
+            + sys.getsizeof(self.host_counts)
+            + 200
+        )
+
+
+def _decrement(counts: Dict, key) -> None:
+    n = counts[key] - 1
+    if n:
+        counts[key] = n
+    else:
+        del counts[key]
+
+
+# (timestamp, src_ip, dst_ip, dst_port, bytes_out, packets)
+FlowFields = Tuple[float, Optional[str], Optional[str], int, float, float]
+
+# Event timestamps come from clients and drive window pruning and idle
+# eviction; one dated far ahead would make every other source look idle.
+# Timestamps later than server time + MAX_CLOCK_SKEW_S are clamped.
+MAX_CLOCK_SKEW_S = 5.0
+
+
+def _event_time(value: Any) -> float:
+    now = time.time()
+    ts = float(value) if value else now
+    if not math.isfinite(ts):
+        return now
+    return min(ts, now + MAX_CLOCK_SKEW_S)
+
+
+def _finite(features: Dict[str, float], name: str) -> float:
+    # One NaN/inf added to an ExactSum makes it NaN for good: removing
+    # the value again cannot undo it. Treat such values as missing.
+    value = float(features.get(name, 0.0))
+    return value if math.isfinite(value) else 0.0
+
+
+def extract_fields(meta: Dict, features: Dict[str, float]) -> FlowFields:
+    """Pull the values the classifier needs out of an ingest event."""
+    src_ip = meta.get("src_ip")
+    dst_ip = meta.get("dst_ip")
+
+    return (
+        _event_time(meta.get("timestamp")),
+        str(src_ip) if src_ip else None,
+        str(dst_ip) if dst_ip else None,
+        int(_finite(features, "dst_port")),
+        _finite(features, "bytes_out"),
+        _finite(features, "packets"),
+    )
+
 
 @dataclass
 class ThreatVerdict:
@@ -15,20 +196,96 @@ class ThreatVerdict:
     reason: str
 
 
+Window = Union[SourceWindow, SketchWindow]
+
+
 class ThreatClassifier:
     """
     Lightweight, explainable threat labeling based on rolling flow patterns.
     Keeps in-memory state; good for prototype and demos.
+
+    Per-source state is held in LRU order: sources idle for longer than
+    `window_s` are evicted as newer events arrive, and at most
+    `max_sources` are tracked. With `approximate=True` each source uses a
+    fixed-size SketchWindow (HyperLogLog distinct counts) instead of an
+    exact event window.
+
+    Safe to call from several threads (the service's sync endpoints run
+    on a threadpool): window aggregates are updated incrementally and
+    never recomputed, so every update runs under one lock.
     """
 
-    def __init__(self, window_s: int = 30) -> None:
+    def __init__(
+        self,
+        window_s: int = 30,
+        max_sources: int = 100_000,
+        approximate: bool = False,
+    ) -> None:
         self.window_s = window_s
-        self.by_src: Dict[str, FlowQueue] = defaultdict(lambda: deque())
+        self.max_sources = max_sources
+        self.approximate = approximate
+        self.by_src: "OrderedDict[str, Window]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.evicted_idle = 0
+        self.evicted_overflow = 0
+
+    def _new_window(self) -> Window:
+        if self.approximate:
+            return SketchWindow(self.window_s)
+        return SourceWindow()
+
+    def _window_for(self, src_ip: str, now: float) -> Window:
+        # Caller holds self._lock: LRU moves and evictions below mutate
+        # by_src, which stats() iterates from other threads.
+        self._evict_idle(now)
 
-    def _prune(self, q: FlowQueue, now: float) -> None:
+        q = self.by_src.get(src_ip)
+        if q is not None:
+            self.by_src.move_to_end(src_ip)
+            return q
+
+        while self.by_src and len(self.by_src) >= self.max_sources:
+            self.by_src.popitem(last=False)
+            self.evicted_overflow += 1
+
+        q = self._new_window()
+        self.by_src[src_ip] = q
+        return q
+
+    def evict_idle(self, now: float) -> int:
+        """Drop sources with no events in the last window_s seconds."""
+        with self._lock:
+            return self._evict_idle(now)
+
+    def _evict_idle(self, now: float) -> int:
         cutoff = now - self.window_s
-        while q and q[0][0] < cutoff:
-            q.popleft()
+        evicted = 0
+        while self.by_src:
+            src, q = next(iter(self.by_src.items()))
+            if q.last_ts >= cutoff:
+                break
+            del self.by_src[src]
+            evicted += 1
+
+        self.evicted_idle += evicted
+        return evicted
+
+    def _prune(self, q: Window, now: float) -> None:
+        q.prune(now - self.window_s)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": "approximate" if self.approximate else "exact",
+                "tracked_sources": len(self.by_src),
+                "max_sources": self.max_sources,
+                "memory_bytes": sum(
+                    q.nbytes() for q in self.by_src.values()
+                ),
+                "evicted_idle": self.evicted_idle,
+                "evicted_overflow": self.evicted_overflow,
+            }
 
     def update(
         self,
@@ -36,13 +293,38 @@ class ThreatClassifier:
         features: Dict[str, float],
         anomaly_score: float,
     ) -> Optional[ThreatVerdict]:
-        now = float(meta.get("timestamp") or time.time())
-        src_ip = meta.get("src_ip")
-        dst_ip = meta.get("dst_ip")
+        return self.update_fields(
+            extract_fields(meta, features),
+            anomaly_score,
+        )
+
+    def update_many(
+        self,
+        events: Sequence[Tuple[Dict, Dict[str, float], float]],
+    ) -> List[Optional[ThreatVerdict]]:
+        """update() each (meta, features, anomaly_score) in order."""
+        fields = [extract_fields(m, f) for m, f, _ in events]
+        with self._lock:
+            return [
+                self._update_fields(x, s)
+                for x, (_, _, s) in zip(fields, events)
+            ]
+
+    def update_fields(
+        self,
+        fields: FlowFields,
+        anomaly_score: float,
+    ) -> Optional[ThreatVerdict]:
+        """update() on values already pulled out by extract_fields()."""
+        with self._lock:
+            return self._update_fields(fields, anomaly_score)
 
-        dst_port = int(features.get("dst_port", 0))
-        bytes_out = float(features.get("bytes_out", 0.0))
-        packets = float(features.get("packets", 0.0))
+    def _update_fields(
+        self,
+        fields: FlowFields,
+        anomaly_score: float,
+    ) -> Optional[ThreatVerdict]:
+        now, src_ip, dst_ip, dst_port, bytes_out, packets = fields
 
         # If we don't have IP metadata, we can only give weak labels.
         if not src_ip or not dst_ip:
@@ -54,20 +336,20 @@ class ThreatClassifier:
                 )
             return None
 
-        q = self.by_src[str(src_ip)]
-        q.append((now, str(dst_ip), dst_port, bytes_out, packets))
+        q = self._window_for(src_ip, now)
+        q.append((now, dst_ip, dst_port, bytes_out, packets))
         self._prune(q, now)
 
-        dst_ports = {p for _, _, p, _, _ in q if p > 0}
-        dst_hosts = {h for _, h, _, _, _ in q if h}
+        n_dst_ports = q.n_dst_ports
+        n_dst_hosts = q.n_dst_hosts
 
-        total_bytes_out = sum(b for _, _, _, b, _ in q)
-        total_packets = sum(pk for _, _, _, _, pk in q)
+        total_bytes_out = q.total_bytes_out
+        total_packets = q.total_packets
 
         # 1) Port scan
-        if len(dst_ports) >= 30 and anomaly_score > 0.03:
+        if n_dst_ports >= 30 and anomaly_score > 0.03:
             reason = (
-                f"{len(dst_ports)} dst ports in "
+                f"{n_dst_ports} dst ports in "
                 f"{self.window_s}s from {src_ip}"
             )
             return ThreatVerdict(
@@ -77,9 +359,9 @@ class ThreatClassifier:
             )
 
         # 2) Host sweep / lateral movement
-        if len(dst_hosts) >= 20 and anomaly_score > 0.03:
+        if n_dst_hosts >= 20 and anomaly_score > 0.03:
             reason = (
-                f"{len(dst_hosts)} dst hosts in "
+                f"{n_dst_hosts} dst hosts in "
                 f"{self.window_s}s from {src_ip}"
             )
             return ThreatVerdict(
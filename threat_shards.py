@@ -0,0 +1,347 @@
+"""
+Sharded ThreatClassifier spread over several processes.
+
+Each shard process owns a ThreatClassifier for the sources that hash to
+it (crc32(src_ip) % n_shards) and serves requests over a
+multiprocessing.connection listener. Because routing only depends on
+src_ip, every client (e.g. each uvicorn worker) sends a given source to
+the same shard, so verdicts do not depend on how many clients run.
+
+Standalone shard servers for a multi-worker deployment:
+
+    AEGISNET_THREAT_AUTHKEY=<secret> \
+        python threat_shards.py --shards 8 --base-port 7100
+
+Shards exchange pickles, so anyone who can connect and knows the key
+can run code in the shard process. There is no built-in key: standalone
+servers and their clients read it from AEGISNET_THREAT_AUTHKEY (or
+--authkey / the authkey argument), and locally spawned shards get a
+random one.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import threading
+import zlib
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from threat_classifier import (
+    FlowFields,
+    ThreatClassifier,
+    ThreatVerdict,
+    extract_fields,
+)
+
+
+AUTHKEY_ENV = "AEGISNET_THREAT_AUTHKEY"
+
+ShardEvent = Tuple[Dict, Dict[str, float], float]
+ShardItem = Tuple[FlowFields, float]
+
+
+def authkey_from_env() -> Optional[bytes]:
+    value = os.environ.get(AUTHKEY_ENV)
+    return value.encode("utf-8") if value else None
+
+
+def shard_for(src_ip: str, n_shards: int) -> int:
+    """Stable src_ip -> shard mapping (same in every process)."""
+    return zlib.crc32(src_ip.encode("utf-8")) % n_shards
+
+
+# ----------------------------------------------------------------------
+# Shard server
+# ----------------------------------------------------------------------
+def _handle(
+    conn: Connection,
+    clf: ThreatClassifier,
+    lock: threading.Lock,
+) -> None:
+    try:
+        while True:
+            op, arg = conn.recv()
+            if op == "update":
+                with lock:
+                    out = [clf.update_fields(f, s) for f, s in arg]
+                conn.send(out)
+            elif op == "stats":
+                with lock:
+                    conn.send(clf.stats())
+            else:
+                return
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+
+def serve_shard(
+    address: Any,
+    authkey: bytes,
+    ready: Optional[Connection] = None,
+    **classifier_kwargs: Any,
+) -> None:
+    """Run one shard until the process is terminated."""
+    clf = ThreatClassifier(**classifier_kwargs)
+    lock = threading.Lock()
+
+    with Listener(address, authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+
+        while True:
+            conn = listener.accept()
+            threading.Thread(
+                target=_handle,
+                args=(conn, clf, lock),
+                daemon=True,
+            ).start()
+
+
+# ----------------------------------------------------------------------
+# Client
+# ----------------------------------------------------------------------
+class ShardedThreatClassifier:
+    """
+    Drop-in for ThreatClassifier that routes each source to a shard.
+
+    Pass `addresses` to connect to shard servers started elsewhere, or
+    `n_shards` to spawn that many local shard processes. The authkey
+    defaults to $AEGISNET_THREAT_AUTHKEY; it is required for remote
+    shards and random for spawned ones when not set.
+    """
+
+    def __init__(
+        self,
+        n_shards: int = 0,
+        addresses: Optional[Sequence[Any]] = None,
+        authkey: Optional[bytes] = None,
+        window_s: int = 30,
+        max_sources: int = 100_000,
+        approximate: bool = False,
+    ) -> None:
+        self.window_s = window_s
+        self._procs: List[mp.process.BaseProcess] = []
+        authkey = authkey or authkey_from_env()
+
+        if not addresses:
+            if n_shards <= 0:
+                raise ValueError("Need n_shards > 0 or shard addresses")
+            authkey = authkey or os.urandom(32)
+            addresses = self._spawn(
+                n_shards,
+                authkey,
+                window_s=window_s,
+                max_sources=max_sources // n_shards,
+                approximate=approximate,
+            )
+        elif not authkey:
+            raise ValueError(
+                f"Remote threat shards need an authkey (set {AUTHKEY_ENV})"
+            )
+
+        self.addresses = list(addresses)
+        self.n_shards = len(self.addresses)
+        self._authkey = authkey
+        self._conns = [Client(a, authkey=authkey) for a in self.addresses]
+        self._locks = [threading.Lock() for _ in self._conns]
+
+        # IP-less events get a stateless weak label; no shard needed.
+        self._local = ThreatClassifier(window_s=window_s, max_sources=1)
+
+    def _spawn(self, n_shards: int, authkey: bytes, **kwargs: Any) -> List:
+        ctx = mp.get_context("spawn")
+        addresses = []
+        for i in range(n_shards):
+            recv, send = ctx.Pipe(duplex=False)
+            proc = ctx.Process(
+                target=serve_shard,
+                kwargs=dict(
+                    address=None,
+                    authkey=authkey,
+                    ready=send,
+                    **kwargs,
+                ),
+                name=f"aegisnet-threat-shard-{i}",
+                daemon=True,
+            )
+            proc.start()
+            send.close()
+            addresses.append(recv.recv())
+            recv.close()
+            self._procs.append(proc)
+        return addresses
+
+    # ------------------------------------------------------------------
+    # ThreatClassifier API
+    # ------------------------------------------------------------------
+    def update(
+        self,
+        meta: Dict,
+        features: Dict[str, float],
+        anomaly_score: float,
+    ) -> Optional[ThreatVerdict]:
+        return self.update_many([(meta, features, anomaly_score)])[0]
+
+    def update_many(
+        self,
+        events: Sequence[ShardEvent],
+    ) -> List[Optional[ThreatVerdict]]:
+        """
+        Classify many events with one round trip per involved shard.
+        Per-source order is preserved, so pass events in timestamp order.
+        """
+        verdicts: List[Optional[ThreatVerdict]] = [None] * len(events)
+        batches: Dict[int, List[ShardItem]] = {}
+        positions: Dict[int, List[int]] = {}
+
+        for i, (meta, features, score) in enumerate(events):
+            fields = extract_fields(meta, features)
+            src_ip, dst_ip = fields[1], fields[2]
+            if not src_ip or not dst_ip:
+                verdicts[i] = self._local.update_fields(fields, score)
+                continue
+
+            shard = shard_for(src_ip, self.n_shards)
+            batches.setdefault(shard, []).append((fields, score))
+            positions.setdefault(shard, []).append(i)
+
+        # Lock in shard order (no deadlocks between concurrent callers),
+        # send everything first so shards work in parallel, then collect.
+        shards = sorted(batches)
+        for shard in shards:
+            self._locks[shard].acquire()
+        waiting: List[int] = []
+        try:
+            for shard in shards:
+                self._conns[shard].send(("update", batches[shard]))
+                waiting.append(shard)
+            for shard in shards:
+                out = self._conns[shard].recv()
+                waiting.remove(shard)
+                for i, verdict in zip(positions[shard], out):
+                    verdicts[i] = verdict
+        except BaseException:
+            # Unread replies would be taken as the answers to the next
+            # request; never reuse a connection that has one in flight.
+            for shard in waiting:
+                self._reconnect(shard)
+            raise
+        finally:
+            for shard in shards:
+                self._locks[shard].release()
+
+        return verdicts
+
+    def stats(self) -> Dict[str, Any]:
+        per_shard = []
+        for shard, lock in enumerate(self._locks):
+            with lock:
+                try:
+                    self._conns[shard].send(("stats", None))
+                    per_shard.append(self._conns[shard].recv())
+                except BaseException:
+                    self._reconnect(shard)
+                    raise
+
+        totals: Dict[str, Any] = {
+            "mode": per_shard[0]["mode"] if per_shard else "exact",
+            "shards": self.n_shards,
+        }
+        for key in (
+            "tracked_sources",
+            "max_sources",
+            "memory_bytes",
+            "evicted_idle",
+            "evicted_overflow",
+        ):
+            totals[key] = sum(s[key] for s in per_shard)
+        totals["tracked_sources_per_shard"] = [
+            s["tracked_sources"] for s in per_shard
+        ]
+        return totals
+
+    def _reconnect(self, shard: int) -> None:
+        """Replace a shard connection (call with its lock held)."""
+        try:
+            self._conns[shard].close()
+        except OSError:
+            pass
+        try:
+            self._conns[shard] = Client(
+                self.addresses[shard], authkey=self._authkey
+            )
+        except OSError:
+            # Shard unreachable: leave the closed connection, so later
+            # calls fail (and retry this) instead of reading stale data.
+            pass
+
+    def close(self) -> None:
+        for conn, lock in zip(self._conns, self._locks):
+            with lock:
+                try:
+                    conn.send(("close", None))
+                except OSError:
+                    pass
+                conn.close()
+
+        for proc in self._procs:
+            proc.terminate()
+            proc.join(timeout=2.0)
+        self._procs = []
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--shards", type=int, default=mp.cpu_count())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=7100)
+    parser.add_argument("--window-s", type=int, default=30)
+    parser.add_argument("--max-sources", type=int, default=100_000)
+    parser.add_argument("--approximate", action="store_true")
+    parser.add_argument(
+        "--authkey",
+        help=f"shared secret (prefer the {AUTHKEY_ENV} environment "
+        "variable: command lines are visible to other users)",
+    )
+    args = parser.parse_args()
+
+    authkey = (
+        args.authkey.encode("utf-8") if args.authkey else authkey_from_env()
+    )
+    if not authkey:
+        # Required even on loopback: clients need the same key anyway.
+        parser.error(f"an authkey is required: set {AUTHKEY_ENV} or pass "
+                     "--authkey")
+
+    procs = []
+    for i in range(args.shards):
+        address = (args.host, args.base_port + i)
+        proc = mp.Process(
+            target=serve_shard,
+            kwargs=dict(
+                address=address,
+                authkey=authkey,
+                window_s=args.window_s,
+                max_sources=args.max_sources // args.shards,
+                approximate=args.approximate,
+            ),
+            name=f"aegisnet-threat-shard-{i}",
+        )
+        proc.start()
+        procs.append(proc)
+        print(f"[Threat Shards] shard {i} listening on {address}")
+
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        print("\n[Threat Shards] stopping")
+        for proc in procs:
+            proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Rolling per-second traffic aggregates for the dashboard.
+
+TrafficSeries folds scored results into one bucket per wall-clock
+second: flows, suspicious flows, threat alerts, score percentiles and
+the busiest sources. Closed buckets go into fixed-size ring buffers
+covering the last `seconds` seconds, so memory and the cost of reading
+a window do not grow with traffic.
+
+It is not thread-safe; the service feeds it from the ResultSink
+consumer on the event loop.
+"""
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# (flow, score, is_suspicious), as pushed to the ResultSink
+Result = Tuple[Dict[str, Any], float, bool]
+
+_COUNT_FIELDS = ("flows", "suspicious", "alerts")
+_SCORE_FIELDS = ("score_p50", "score_p95", "score_max")
+
+
+class TrafficSeries:
+    """Ring buffers of per-second aggregates."""
+
+    def __init__(self, seconds: int = 300, top_k: int = 5) -> None:
+        self.seconds = seconds
+        self.top_k = top_k
+
+        self._t = np.zeros(seconds, dtype=np.int64)
+        self._counts = {
+            name: np.zeros(seconds, dtype=np.int64) for name in _COUNT_FIELDS
+        }
+        self._scores = {
+            name: np.zeros(seconds, dtype=np.float32) for name in _SCORE_FIELDS
+        }
+        self._top: List[List[Tuple[str, int]]] = [[] for _ in range(seconds)]
+        self._written = 0  # buckets closed so far
+
+        # The open bucket
+        self._sec: Optional[int] = None
+        self._bucket_scores: List[float] = []
+        self._suspicious = 0
+        self._alerts = 0
+        self._sources: Counter = Counter()
+
+    def __len__(self) -> int:
+        return min(self._written, self.seconds)
+
+    def add(self, results: List[Result], now: float) -> List[Dict[str, Any]]:
+        """Fold results into the bucket for `now`; returns closed points."""
+        points = self.advance(now)
+        scores = self._bucket_scores
+        sources = self._sources
+        for flow, score, is_suspicious in results:
+            scores.append(score)
+            if is_suspicious:
+                self._suspicious += 1
+            if flow.get("threat_label"):
+                self._alerts += 1
+            src = flow.get("src_ip")
+            if src:
+                sources[src] += 1
+        return points
+
+    def advance(self, now: float) -> List[Dict[str, Any]]:
+        """
+        Close every bucket older than the second `now` falls in, adding
+        empty buckets for quiet seconds. Returns the closed points.
+        """
+        sec = int(now)
+        if self._sec is None:
+            self._sec = sec
+            return []
+        if sec <= self._sec:
+            return []
+
+        points = [self._close()]
+        # Quiet seconds in between (at most one ring's worth).
+        gap_start = max(self._sec + 1, sec - self.seconds)
+        for quiet in range(gap_start, sec):
+            self._sec = quiet
+            points.append(self._close())
+        self._sec = sec
+        return points
+
+    def _close(self) -> Dict[str, Any]:
+        i = self._written % self.seconds
+        self._written += 1
+
+        scores = self._bucket_scores
+        if scores:
+            arr = np.asarray(scores, dtype=np.float64)
+            p50, p95 = np.percentile(arr, (50, 95))
+            top = arr.max()
+        else:
+            p50 = p95 = top = 0.0
+        top_sources = self._sources.most_common(self.top_k)
+
+        self._t[i] = self._sec
+        self._counts["flows"][i] = len(scores)
+        self._counts["suspicious"][i] = self._suspicious
+        self._counts["alerts"][i] = self._alerts
+        self._scores["score_p50"][i] = p50
+        self._scores["score_p95"][i] = p95
+        self._scores["score_max"][i] = top
+        self._top[i] = top_sources
+
+        point = {
+            "t": self._sec,
+            "flows": len(scores),
+            "suspicious": self._suspicious,
+            "alerts": self._alerts,
+            "score_p50": round(float(p50), 6),
+            "score_p95": round(float(p95), 6),
+            "score_max": round(float(top), 6),
+            "top_sources": top_sources,
+        }
+
+        self._bucket_scores = []
+        self._suspicious = 0
+        self._alerts = 0
+        self._sources = Counter()
+        return point
+
+    def window(self, seconds: Optional[int] = None) -> Dict[str, Any]:
+        """
+        The last `seconds` closed buckets (oldest first) as columns:
+        {"t0": first second, "step": 1, "flows": [...], ...}.
+        """
+        n = len(self)
+        if seconds is not None:
+            n = min(n, max(0, int(seconds)))
+        idx = np.arange(self._written - n, self._written) % self.seconds
+
+        out: Dict[str, Any] = {
+            "t0": int(self._t[idx[0]]) if n else None,
+            "step": 1,
+        }
+        for name, col in self._counts.items():
+            out[name] = col[idx].tolist()
+        for name, col in self._scores.items():
+            out[name] = np.round(col[idx].astype(np.float64), 6).tolist()
+        out["top_sources"] = [self._top[i] for i in idx.tolist()]
+        return out
@@ -1,7 +1,51 @@
+import argparse
+import time
+
 import torch
 from torch import nn
 from torch.utils.data import DataLoader
 from aegisnet.models.autoencoder import Autoencoder, FlowDataset
+from flow_matrix import make_loader
+
+
+def _fit(model, dataloader, n_rows, num_epochs, lr, device):
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    loss_fn = nn.MSELoss()
+    non_blocking = device == "cuda"
+
+    for epoch in range(num_epochs):
+        model.train()
+        total_loss = 0.0
+        start = time.perf_counter()
+
+        for batch in dataloader:
+            batch = batch.to(device, non_blocking=non_blocking)
+            optimizer.zero_grad()
+            recon = model(batch)
+            loss = loss_fn(recon, batch)
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * batch.size(0)
+
+        elapsed = time.perf_counter() - start
+        avg_loss = total_loss / n_rows
+        print(
+            f"Epoch {epoch + 1}/{num_epochs} - loss={avg_loss:.6f} "
+            f"({n_rows / max(elapsed, 1e-9):,.0f} rows/s)"
+        )
+
+
+def _save(model, feature_cols, mean, std, model_save_path):
+    # Save model + normalization stats and metadata
+    checkpoint = {
+        "model_state_dict": model.state_dict(),
+        "input_dim": len(feature_cols),
+        "feature_cols": feature_cols,
+        "mean": mean,
+        "std": std,
+    }
+    torch.save(checkpoint, model_save_path)
+    print(f"[OK] Saved model to {model_save_path}")
 
 
 def train_autoencoder(
@@ -27,54 +71,92 @@ def train_autoencoder(
     model = Autoencoder(input_dim=len(feature_cols))
     model.to(device)
 
-    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
-    loss_fn = nn.MSELoss()
+    _fit(model, dataloader, len(dataset), num_epochs, lr, device)
+    _save(model, feature_cols, dataset.mean, dataset.std, model_save_path)
 
-    for epoch in range(num_epochs):
-        model.train()
-        total_loss = 0.0
 
-        for batch in dataloader:
-            batch = batch.to(device)
-            optimizer.zero_grad()
-            recon = model(batch)
-            loss = loss_fn(recon, batch)
-            loss.backward()
-            optimizer.step()
-            total_loss += loss.item() * batch.size(0)
+def train_autoencoder_streaming(
+    matrix_path,
+    model_save_path="autoencoder.pt",
+    batch_size=256,
+    num_epochs=20,
+    lr=1e-3,
+    device=None,
+    num_workers=4,
+    seed=None,
+):
+    """
+    Train from a memory-mapped matrix built by flow_matrix.py. Only the
+    batches in flight are in memory, so the matrix can be far larger
+    than RAM; normalization uses the stats computed at conversion.
+    """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device}")
 
-        avg_loss = total_loss / len(dataset)
-        print(f"Epoch {epoch + 1}/{num_epochs} - loss={avg_loss:.6f}")
+    dataloader = make_loader(
+        matrix_path,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        seed=seed,
+        pin_memory=device == "cuda",
+    )
+    dataset = dataloader.dataset
+    print(
+        f"Streaming {len(dataset):,} rows from {matrix_path} "
+        f"({num_workers} loader workers)"
+    )
 
-    # Save model + normalization stats and metadata
-    checkpoint = {
-        "model_state_dict": model.state_dict(),
-        "input_dim": len(feature_cols),
-        "feature_cols": feature_cols,
-        "mean": dataset.mean,
-        "std": dataset.std,
-    }
-    torch.save(checkpoint, model_save_path)
-    print(f"[OK] Saved model to {model_save_path}")
+    model = Autoencoder(input_dim=len(dataset.feature_cols))
+    model.to(device)
+
+    _fit(model, dataloader, len(dataset), num_epochs, lr, device)
+    _save(
+        model,
+        dataset.feature_cols,
+        dataset.mean,
+        dataset.std,
+        model_save_path,
+    )
 
 
 if __name__ == "__main__":
-    # TODO: update these to match your actual CSV columns
-    csv_path = "data/sample_flows.csv"
-    feature_cols = [
-        "bytes_in",
-        "bytes_out",
-        "packets",
-        "duration",
-        "src_port",
-        "dst_port",
-        "protocol",
-    ]
-    train_autoencoder(
-        csv_path=csv_path,
-        feature_cols=feature_cols,
-        model_save_path="autoencoder.pt",
-        batch_size=256,
-        num_epochs=20,
-        lr=1e-3,
+    parser = argparse.ArgumentParser(description="Train the autoencoder")
+    parser.add_argument(
+        "--matrix",
+        help="train from a flow_matrix.py matrix instead of the CSV",
     )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--out", default="autoencoder.pt")
+    args = parser.parse_args()
+
+    if args.matrix:
+        train_autoencoder_streaming(
+            matrix_path=args.matrix,
+            model_save_path=args.out,
+            batch_size=args.batch_size,
+            num_epochs=args.epochs,
+            lr=1e-3,
+            num_workers=args.workers,
+        )
+    else:
+        # TODO: update these to match your actual CSV columns
+        csv_path = "data/sample_flows.csv"
+        feature_cols = [
+            "bytes_in",
+            "bytes_out",
+            "packets",
+            "duration",
+            "src_port",
+            "dst_port",
+            "protocol",
+        ]
+        train_autoencoder(
+            csv_path=csv_path,
+            feature_cols=feature_cols,
+            model_save_path=args.out,
+            batch_size=args.batch_size,
+            num_epochs=args.epochs,
+            lr=1e-3,
+        )